@@ -1,15 +1,11 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException
 from fastapi.responses import FileResponse, Response
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
 from typing import List, Dict, Any, Optional
 import os
 import shutil
 from datetime import datetime
 
-from app.core.database import get_db
 from app.core.config import settings
-from app.models.task import Task
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -23,6 +19,30 @@ class FileInfo(BaseModel):
     created_at: datetime
     task_id: Optional[str] = None
 
+def _output_files() -> List[str]:
+    """输出目录中的全部产物（产物位于以任务ID命名的子目录中）"""
+    paths = []
+    for root, _, filenames in os.walk(settings.OUTPUT_DIR):
+        paths.extend(os.path.join(root, filename) for filename in filenames)
+    return paths
+
+def _resolve_file(file_type: str, filename: str) -> str:
+    """将文件类型和相对路径转换为文件路径，不允许访问目录之外的文件"""
+    if file_type == "input":
+        base_dir = settings.UPLOAD_DIR
+    elif file_type == "output":
+        base_dir = settings.OUTPUT_DIR
+    else:
+        raise HTTPException(status_code=400, detail="不支持的文件类型")
+
+    base_dir = os.path.realpath(base_dir)
+    file_path = os.path.realpath(os.path.join(base_dir, filename))
+    if os.path.commonpath([base_dir, file_path]) != base_dir:
+        raise HTTPException(status_code=400, detail="文件路径不合法")
+    if not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return file_path
+
 class StorageInfo(BaseModel):
     """存储信息模型"""
     total_space: int
@@ -34,8 +54,7 @@ class StorageInfo(BaseModel):
 @router.get("", response_model=List[FileInfo])
 @router.get("/", response_model=List[FileInfo])
 async def list_files(
-    file_type: str = "all",  # all, input, output, temp
-    db: AsyncSession = Depends(get_db)
+    file_type: str = "all"  # all, input, output, temp
 ):
     """获取文件列表"""
     try:
@@ -59,25 +78,20 @@ async def list_files(
         # 获取输出文件
         if file_type in ["all", "output"]:
             if os.path.exists(settings.OUTPUT_DIR):
-                for filename in os.listdir(settings.OUTPUT_DIR):
-                    file_path = os.path.join(settings.OUTPUT_DIR, filename)
-                    if os.path.isfile(file_path):
-                        stat = os.stat(file_path)
-                        
-                        # 查找关联的任务
-                        result = await db.execute(
-                            select(Task).where(Task.output_file_path == file_path)
-                        )
-                        task = result.scalar_one_or_none()
-                        
-                        files.append(FileInfo(
-                            name=filename,
-                            path=file_path,
-                            size=stat.st_size,
-                            type="output",
-                            created_at=datetime.fromtimestamp(stat.st_ctime),
-                            task_id=task.task_id if task else None
-                        ))
+                for file_path in _output_files():
+                    stat = os.stat(file_path)
+                    # 相对输出目录的路径（任务ID/文件名），用于下载、预览和删除
+                    name = os.path.relpath(file_path, settings.OUTPUT_DIR).replace(os.sep, "/")
+                    task_id, _, _ = name.rpartition("/")
+                    
+                    files.append(FileInfo(
+                        name=name,
+                        path=file_path,
+                        size=stat.st_size,
+                        type="output",
+                        created_at=datetime.fromtimestamp(stat.st_ctime),
+                        task_id=task_id or None
+                    ))
         
         # 按创建时间排序
         files.sort(key=lambda x: x.created_at, reverse=True)
@@ -105,8 +119,7 @@ async def get_storage_info():
                               if os.path.isfile(os.path.join(settings.UPLOAD_DIR, f))])
         
         if os.path.exists(settings.OUTPUT_DIR):
-            output_count = len([f for f in os.listdir(settings.OUTPUT_DIR) 
-                              if os.path.isfile(os.path.join(settings.OUTPUT_DIR, f))])
+            output_count = len(_output_files())
         
         return StorageInfo(
             total_space=total_space,
@@ -119,23 +132,15 @@ async def get_storage_info():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/download/{file_type}/{filename}")
+@router.get("/download/{file_type}/{filename:path}")
 async def download_file(file_type: str, filename: str):
     """下载文件"""
     try:
-        if file_type == "input":
-            file_path = os.path.join(settings.UPLOAD_DIR, filename)
-        elif file_type == "output":
-            file_path = os.path.join(settings.OUTPUT_DIR, filename)
-        else:
-            raise HTTPException(status_code=400, detail="不支持的文件类型")
-        
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="文件不存在")
+        file_path = _resolve_file(file_type, filename)
         
         return FileResponse(
             path=file_path,
-            filename=filename,
+            filename=os.path.basename(file_path),
             media_type='application/octet-stream'
         )
         
@@ -144,21 +149,17 @@ async def download_file(file_type: str, filename: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.delete("/{file_type}/{filename}")
+@router.delete("/{file_type}/{filename:path}")
 async def delete_file(file_type: str, filename: str):
     """删除文件"""
     try:
-        if file_type == "input":
-            file_path = os.path.join(settings.UPLOAD_DIR, filename)
-        elif file_type == "output":
-            file_path = os.path.join(settings.OUTPUT_DIR, filename)
-        else:
-            raise HTTPException(status_code=400, detail="不支持的文件类型")
-        
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="文件不存在")
+        file_path = _resolve_file(file_type, filename)
         
         os.remove(file_path)
+        # 删除已空的任务产物目录
+        parent = os.path.dirname(file_path)
+        if file_type == "output" and parent != os.path.realpath(settings.OUTPUT_DIR) and not os.listdir(parent):
+            os.rmdir(parent)
         return {"message": "文件删除成功"}
         
     except HTTPException:
@@ -166,19 +167,11 @@ async def delete_file(file_type: str, filename: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/content/{file_type}/{filename}")
+@router.get("/content/{file_type}/{filename:path}")
 async def get_file_content(file_type: str, filename: str):
     """获取文件内容（用于文本文件预览）"""
     try:
-        if file_type == "input":
-            file_path = os.path.join(settings.UPLOAD_DIR, filename)
-        elif file_type == "output":
-            file_path = os.path.join(settings.OUTPUT_DIR, filename)
-        else:
-            raise HTTPException(status_code=400, detail="不支持的文件类型")
-        
-        if not os.path.exists(file_path):
-            raise HTTPException(status_code=404, detail="文件不存在")
+        file_path = _resolve_file(file_type, filename)
         
         # 检查文件大小（限制在1MB）
         file_size = os.path.getsize(file_path)
@@ -1,5 +1,8 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any
+import asyncio
 import psutil
 import platform
 import os
@@ -7,6 +10,12 @@ import subprocess
 from datetime import datetime
 
 from app.core.config import settings
+from app.core.database import get_db
+from app.models.cache import CacheStats, ResolutionCacheStats
+from app.services.cache_service import result_cache
+from app.services.resolution_cache import resolution_cache
+from app.services.wheelhouse import wheelhouse
+from app.services.scheduler import task_scheduler
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -92,9 +101,91 @@ async def update_api_config(config: ApiConfig):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/cache", response_model=CacheStats)
+async def get_cache_stats(db: AsyncSession = Depends(get_db)):
+    """获取结果缓存统计"""
+    try:
+        return await result_cache.stats(db)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/cache/evict")
+async def evict_cache(db: AsyncSession = Depends(get_db)):
+    """按存活时间和大小限制淘汰结果缓存"""
+    try:
+        removed = await result_cache.evict(db)
+        return {"message": f"淘汰了 {removed} 个缓存条目"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/cache")
+async def clear_cache(db: AsyncSession = Depends(get_db)):
+    """清空结果缓存"""
+    try:
+        removed = await result_cache.clear(db)
+        return {"message": f"已清空 {removed} 个缓存条目"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/resolution-cache", response_model=ResolutionCacheStats)
+async def get_resolution_cache_stats():
+    """获取依赖解析缓存统计"""
+    try:
+        return await resolution_cache.stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/resolution-cache")
+async def clear_resolution_cache():
+    """清空依赖解析缓存"""
+    try:
+        removed = await resolution_cache.invalidate()
+        return {"message": f"已清空 {removed} 个解析缓存条目"}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.delete("/resolution-cache/{cache_key}")
+async def invalidate_resolution_cache(cache_key: str):
+    """删除指定的依赖解析缓存条目"""
+    try:
+        removed = await resolution_cache.invalidate(cache_key)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    if not removed:
+        raise HTTPException(status_code=404, detail="解析缓存条目不存在")
+    return {"message": "解析缓存条目已删除"}
+
+@router.get("/wheelhouse")
+async def get_wheelhouse_stats():
+    """获取共享依赖仓库统计"""
+    try:
+        return await asyncio.to_thread(wheelhouse.stats)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/drain")
+async def start_draining():
+    """进入排空模式：不再开始新任务（新建任务保留在队列中），健康检查返回503
+
+    用于滚动发布前的preStop钩子，运行中的任务在服务停止时最多等待SHUTDOWN_GRACE_PERIOD秒。
+    """
+    task_scheduler.start_draining()
+    return {
+        "status": "draining",
+        "running": task_scheduler.running_count(),
+        "queued": task_scheduler.queue_depth()
+    }
+
 @router.get("/health")
 async def health_check():
     """健康检查"""
+    if task_scheduler.draining:
+        return JSONResponse(status_code=503, content={
+            "status": "draining",
+            "timestamp": datetime.now().isoformat(),
+            "running": task_scheduler.running_count()
+        })
     try:
         # 检查目录是否存在且可写
         upload_dir_ok = os.path.exists(settings.UPLOAD_DIR) and os.access(settings.UPLOAD_DIR, os.W_OK)
@@ -1,19 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, Depends, HTTPException, Request, Query, WebSocket, WebSocketDisconnect
 from fastapi.responses import FileResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, desc
 from typing import List, Optional, Dict, Any
+import asyncio
 import uuid
 import json
 import os
-import shutil
 from datetime import datetime
 
-from app.core.database import get_db
+from app.core.database import get_db, async_session_maker
 from app.models.task import Task, TaskCreate, TaskResponse, TaskProgress, TaskStatus, ProcessMode
-from app.models.task import MarketParams, GithubParams, LocalParams
+from app.models.task import BatchCreate, BatchResponse
+from app.models.task import MarketParams, GithubParams, LocalParams, PlatformTarget
+from app.models.upload import UploadSession, UploadSessionCreate, UploadSessionResponse
 from app.services.task_service import TaskService
 from app.services.websocket_service import WebSocketManager
+from app.services.scheduler import task_scheduler
+from app.services.uploads import receive_upload, UploadError
+from app.services.upload_sessions import upload_sessions
+from app.services import task_logs
+from app.services.progress_store import progress_store
+from app.services.cache_service import compute_file_sha256
 from app.core.config import settings
 
 router = APIRouter()
@@ -21,117 +29,381 @@ router = APIRouter()
 # WebSocket管理器
 manager = WebSocketManager()
 
+# 各模式的参数模型
+MODE_PARAMS = {
+    ProcessMode.MARKET: MarketParams,
+    ProcessMode.GITHUB: GithubParams,
+    ProcessMode.LOCAL: LocalParams
+}
+
+async def _prepare_parameters(task_data: TaskCreate):
+    """按模式校验参数并补全默认值
+
+    Local模式的file_sha256决定结果缓存键，不信任客户端提供的值：校验file_name指向已上传的文件，
+    并在服务端重新计算其sha256（上传接口创建的任务已在接收时计算，不经过这里）。
+    """
+    parameters = MODE_PARAMS[task_data.mode](**task_data.parameters).dict()
+    if task_data.mode == ProcessMode.LOCAL:
+        file_name = os.path.basename(parameters["file_name"].replace("\\", "/"))
+        file_path = os.path.join(settings.UPLOAD_DIR, file_name)
+        if not file_name or not os.path.isfile(file_path):
+            raise ValueError(f"上传文件不存在: {parameters['file_name']}")
+        parameters["file_name"] = file_name
+        parameters["file_sha256"] = await asyncio.to_thread(compute_file_sha256, file_path)
+    task_data.parameters = parameters
+
+def _build_task_response(task: Task, include_queue: bool = False) -> TaskResponse:
+    """将任务记录转换为响应模型"""
+    task_dict = {
+        "id": task.id,
+        "task_id": task.task_id,
+        "task_name": task.task_name,
+        "mode": task.mode,
+        "status": task.status,
+        "priority": task.priority or 0,
+        "leader_task_id": task.leader_task_id,
+        "batch_id": task.batch_id,
+        "attempts": task.attempts or 0,
+        "retry_at": task.retry_at,
+        "progress": task.progress,
+        "current_step": task.current_step,
+        "total_steps": task.total_steps,
+        "created_at": task.created_at,
+        "started_at": task.started_at,
+        "completed_at": task.completed_at,
+        "input_file_path": task.input_file_path,
+        "output_file_path": task.output_file_path,
+        "file_size": task.file_size,
+        "error_message": task.error_message
+    }
+    
+    # 叠加尚未落库的最新进度
+    pending = progress_store.get(task.task_id)
+    if pending:
+        for key in ("status", "progress", "current_step"):
+            if key in pending:
+                task_dict[key] = pending[key]
+    
+    # 解析参数JSON
+    if task.parameters:
+        try:
+            task_dict["parameters"] = json.loads(task.parameters)
+        except:
+            task_dict["parameters"] = {}
+    else:
+        task_dict["parameters"] = {}
+    
+    if task.stage_metrics:
+        try:
+            task_dict["stage_metrics"] = json.loads(task.stage_metrics)
+        except:
+            task_dict["stage_metrics"] = None
+    
+    if task.output_files:
+        try:
+            task_dict["output_files"] = json.loads(task.output_files)
+        except:
+            task_dict["output_files"] = None
+    
+    if include_queue:
+        task_dict["queue_position"] = task_scheduler.queue_position(task.task_id)
+        task_dict["queue_depth"] = task_scheduler.queue_depth()
+    
+    return TaskResponse(**task_dict)
+
 @router.post("/", response_model=TaskResponse)
 async def create_task(
     task_data: TaskCreate,
     db: AsyncSession = Depends(get_db)
 ):
     """创建新任务"""
+    try:
+        await _prepare_parameters(task_data)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"任务参数错误: {str(e)}")
+    
     try:
         task_service = TaskService(db)
         task = await task_service.create_task(task_data)
         
         # 启动异步任务处理
         await task_service.start_task(task.task_id, manager)
+        await db.refresh(task)
         
-        return task
+        return _build_task_response(task, include_queue=True)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.post("/market", response_model=TaskResponse)
 async def create_market_task(
     params: MarketParams,
+    priority: int = 0,
     db: AsyncSession = Depends(get_db)
 ):
     """创建Market模式任务"""
     task_data = TaskCreate(
         mode=ProcessMode.MARKET,
-        parameters=params.dict()
+        parameters=params.dict(),
+        priority=priority
     )
     return await create_task(task_data, db)
 
 @router.post("/github", response_model=TaskResponse)
 async def create_github_task(
     params: GithubParams,
+    priority: int = 0,
     db: AsyncSession = Depends(get_db)
 ):
     """创建Github模式任务"""
     task_data = TaskCreate(
         mode=ProcessMode.GITHUB,
-        parameters=params.dict()
+        parameters=params.dict(),
+        priority=priority
     )
     return await create_task(task_data, db)
 
-@router.post("/upload")
-async def upload_file(
-    file: UploadFile = File(...),
-    platform: Optional[str] = Form(None),
-    suffix: Optional[str] = Form("offline"),
-    db: AsyncSession = Depends(get_db)
-):
-    """上传文件并创建Local模式任务"""
+def _upload_path(filename: str) -> str:
+    """生成基于原文件名的唯一保存路径（时间戳加随机后缀，同一秒内上传同名文件也不会冲突）"""
+    original_name = os.path.splitext(filename)[0]  # 原文件名（不含扩展名）
+    file_extension = os.path.splitext(filename)[1]  # 文件扩展名
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")  # 时间戳
+    unique = uuid.uuid4().hex[:8]
+    return os.path.join(settings.UPLOAD_DIR, f"{original_name}_{timestamp}_{unique}{file_extension}")
+
+async def _create_local_task(
+    db: AsyncSession,
+    file_path: str,
+    filename: str,
+    file_sha256: str,
+    file_size: int,
+    platform: Optional[str] = None,
+    suffix: Optional[str] = None,
+    targets: Optional[List[PlatformTarget]] = None,
+    priority: int = 0
+) -> str:
+    """为已保存的上传文件创建Local模式任务并加入队列，返回任务ID"""
+    params = LocalParams(
+        file_name=os.path.basename(file_path),
+        original_filename=filename,
+        file_sha256=file_sha256,
+        platform=platform,
+        suffix=suffix or "offline",
+        targets=targets
+    )
+    
+    task_data = TaskCreate(
+        mode=ProcessMode.LOCAL,
+        parameters=params.dict(),
+        priority=priority
+    )
     
-    # 验证文件类型
-    if not file.filename.endswith('.difypkg'):
-        raise HTTPException(status_code=400, detail="只支持.difypkg文件")
+    task_service = TaskService(db)
+    task = await task_service.create_task(task_data)
     
-    # 验证文件大小
-    if file.size > settings.MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail=f"文件大小超过限制({settings.MAX_FILE_SIZE / 1024 / 1024}MB)")
+    # 更新任务的输入文件路径
+    await task_service.update_task_file_info(task.task_id, file_path, file_size)
     
+    # 启动异步任务处理
+    await task_service.start_task(task.task_id, manager)
+    return task.task_id
+
+@router.post("/upload")
+async def upload_file(request: Request, db: AsyncSession = Depends(get_db)):
+    """上传文件并创建Local模式任务
+
+    multipart/form-data表单字段：file（.difypkg文件）、platform、suffix、
+    targets（JSON数组，如[{"platform": "...", "suffix": "..."}]）、priority。
+    文件边接收边写入磁盘并计算sha256，超过大小限制时立即中止，校验插件包结构后才创建任务。
+    """
     try:
-        # 生成基于原文件名的唯一文件名
-        original_name = os.path.splitext(file.filename)[0]  # 原文件名（不含扩展名）
-        file_extension = os.path.splitext(file.filename)[1]  # 文件扩展名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")  # 时间戳
-        saved_filename = f"{original_name}_{timestamp}{file_extension}"
-        file_path = os.path.join(settings.UPLOAD_DIR, saved_filename)
-        
-        # 保存文件
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        upload = await receive_upload(request, _upload_path)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    try:
+        # 解析表单字段
+        try:
+            priority = int(upload.fields.get("priority") or 0)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="priority必须为整数")
         
-        # 创建任务
-        params = LocalParams(
-            file_name=saved_filename,
-            original_filename=file.filename,
-            platform=platform,
-            suffix=suffix or "offline"
-        )
+        # 解析多平台目标
+        targets = upload.fields.get("targets")
+        try:
+            target_list = [PlatformTarget(**item) for item in json.loads(targets)] if targets else None
+        except Exception:
+            raise HTTPException(status_code=400, detail="targets格式错误，应为JSON数组")
         
-        task_data = TaskCreate(
-            mode=ProcessMode.LOCAL,
-            parameters=params.dict()
+        task_id = await _create_local_task(
+            db, upload.path, upload.filename, upload.sha256, upload.size,
+            platform=upload.fields.get("platform") or None,
+            suffix=upload.fields.get("suffix"),
+            targets=target_list,
+            priority=priority
         )
         
-        task_service = TaskService(db)
-        task = await task_service.create_task(task_data)
-        
-        # 更新任务的输入文件路径
-        await task_service.update_task_file_info(task.task_id, file_path, file.size)
-        
-        # 启动异步任务处理
-        await task_service.start_task(task.task_id, manager)
-        
         return {
-            "task_id": task.task_id,
-            "filename": file.filename,
-            "size": file.size,
+            "task_id": task_id,
+            "filename": upload.filename,
+            "size": upload.size,
             "status": "uploaded"
         }
         
     except Exception as e:
         # 清理已上传的文件
-        if 'file_path' in locals() and os.path.exists(file_path):
+        if os.path.exists(upload.path):
+            os.remove(upload.path)
+        if isinstance(e, HTTPException):
+            raise
+        raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
+
+async def _build_upload_response(db: AsyncSession, session: UploadSession) -> UploadSessionResponse:
+    """将上传会话转换为响应模型"""
+    received = await upload_sessions.received_ranges(db, session.upload_id)
+    if session.status == "completed":
+        received = [[0, session.file_size]]
+    return UploadSessionResponse(
+        upload_id=session.upload_id,
+        filename=session.filename,
+        size=session.file_size,
+        status=session.status,
+        received=received,
+        received_bytes=sum(end - start for start, end in received),
+        chunk_size=settings.UPLOAD_SESSION_CHUNK_SIZE,
+        task_id=session.task_id,
+        created_at=session.created_at,
+        expires_at=session.expires_at
+    )
+
+@router.post("/uploads", response_model=UploadSessionResponse)
+async def create_upload_session(data: UploadSessionCreate, db: AsyncSession = Depends(get_db)):
+    """创建断点续传上传会话（之后PUT分块、查询已接收范围，全部上传后完成并创建Local任务）"""
+    try:
+        session = await upload_sessions.create(db, data)
+        return await _build_upload_response(db, session)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionResponse)
+async def get_upload_session(upload_id: str, db: AsyncSession = Depends(get_db)):
+    """查询上传会话及已接收的字节范围"""
+    try:
+        session = await upload_sessions.get(db, upload_id)
+        return await _build_upload_response(db, session)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@router.put("/uploads/{upload_id}")
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    offset: int = Query(..., ge=0, description="分块在文件中的起始字节位置"),
+    db: AsyncSession = Depends(get_db)
+):
+    """上传分块（请求体为分块原始字节），分块可以任意顺序并行上传，重复上传会覆盖相同位置"""
+    content_length = request.headers.get("content-length", "")
+    try:
+        session = await upload_sessions.get(db, upload_id)
+        received = await upload_sessions.write_chunk(
+            db, session, offset, request.stream(),
+            int(content_length) if content_length.isdigit() else None
+        )
+        return {"upload_id": upload_id, "offset": offset, "length": received}
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@router.post("/uploads/{upload_id}/complete")
+async def complete_upload(upload_id: str, db: AsyncSession = Depends(get_db)):
+    """完成上传：校验文件完整性和插件包结构后创建Local模式任务"""
+    try:
+        session = await upload_sessions.get(db, upload_id)
+        # 重复的完成请求直接返回已创建的任务
+        if session.status == "completed":
+            return {"task_id": session.task_id, "filename": session.filename, "size": session.file_size, "status": "uploaded"}
+        file_path, file_sha256 = await upload_sessions.complete(db, session, _upload_path)
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    
+    try:
+        parameters = json.loads(session.parameters) if session.parameters else {}
+        targets = parameters.get("targets")
+        task_id = await _create_local_task(
+            db, file_path, session.filename, file_sha256, session.file_size,
+            platform=parameters.get("platform"),
+            suffix=parameters.get("suffix"),
+            targets=[PlatformTarget(**item) for item in targets] if targets else None,
+            priority=session.priority or 0
+        )
+        await upload_sessions.mark_completed(db, session, task_id)
+        
+        return {
+            "task_id": task_id,
+            "filename": session.filename,
+            "size": session.file_size,
+            "status": "uploaded"
+        }
+    except Exception as e:
+        if os.path.exists(file_path):
             os.remove(file_path)
+        await upload_sessions.abort(db, session)
         raise HTTPException(status_code=500, detail=f"文件上传失败: {str(e)}")
 
+@router.delete("/uploads/{upload_id}")
+async def abort_upload(upload_id: str, db: AsyncSession = Depends(get_db)):
+    """取消上传并删除已接收的数据"""
+    try:
+        session = await upload_sessions.get(db, upload_id)
+        await upload_sessions.abort(db, session)
+        return {"message": "上传已取消"}
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+@router.post("/batch", response_model=BatchResponse)
+async def create_batch(
+    batch_data: BatchCreate,
+    db: AsyncSession = Depends(get_db)
+):
+    """批量创建任务（单个事务写入并一次性加入调度队列）"""
+    if not batch_data.tasks:
+        raise HTTPException(status_code=400, detail="批次中没有任务")
+    if len(batch_data.tasks) > settings.MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"批次任务数超过限制({settings.MAX_BATCH_SIZE})")
+    
+    # 按模式校验参数并补全默认值
+    for index, task_data in enumerate(batch_data.tasks):
+        try:
+            await _prepare_parameters(task_data)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=f"第{index + 1}个任务参数错误: {str(e)}")
+    
+    try:
+        task_service = TaskService(db)
+        batch, tasks = await task_service.create_batch(batch_data)
+        await task_service.start_tasks(tasks)
+        
+        summary = await task_service.get_batch_summary(batch.batch_id)
+        return BatchResponse(**summary, task_ids=[task.task_id for task in tasks])
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/batches/{batch_id}", response_model=BatchResponse)
+async def get_batch(
+    batch_id: str,
+    db: AsyncSession = Depends(get_db)
+):
+    """获取批次的汇总进度"""
+    summary = await TaskService(db).get_batch_summary(batch_id)
+    if not summary:
+        raise HTTPException(status_code=404, detail="批次不存在")
+    return BatchResponse(**summary)
+
 @router.get("", response_model=List[TaskResponse])
 @router.get("/", response_model=List[TaskResponse])
 async def get_tasks(
     skip: int = 0,
     limit: int = 20,
     status: Optional[str] = None,
+    batch_id: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
     """获取任务列表"""
@@ -141,41 +413,15 @@ async def get_tasks(
         if status:
             query = query.where(Task.status == status)
         
+        if batch_id:
+            query = query.where(Task.batch_id == batch_id)
+        
         query = query.offset(skip).limit(limit)
         result = await db.execute(query)
         tasks = result.scalars().all()
         
         # 转换参数字段
-        task_responses = []
-        for task in tasks:
-            task_dict = {
-                "id": task.id,
-                "task_id": task.task_id,
-                "task_name": task.task_name,
-                "mode": task.mode,
-                "status": task.status,
-                "progress": task.progress,
-                "current_step": task.current_step,
-                "total_steps": task.total_steps,
-                "created_at": task.created_at,
-                "started_at": task.started_at,
-                "completed_at": task.completed_at,
-                "input_file_path": task.input_file_path,
-                "output_file_path": task.output_file_path,
-                "file_size": task.file_size,
-                "error_message": task.error_message
-            }
-            
-            # 解析参数JSON
-            if task.parameters:
-                try:
-                    task_dict["parameters"] = json.loads(task.parameters)
-                except:
-                    task_dict["parameters"] = {}
-            else:
-                task_dict["parameters"] = {}
-            
-            task_responses.append(TaskResponse(**task_dict))
+        task_responses = [_build_task_response(task) for task in tasks]
         
         return task_responses
         
@@ -195,35 +441,8 @@ async def get_task(
         if not task:
             raise HTTPException(status_code=404, detail="任务不存在")
         
-        # 构建响应
-        task_dict = {
-            "id": task.id,
-            "task_id": task.task_id,
-            "task_name": task.task_name,
-            "mode": task.mode,
-            "status": task.status,
-            "progress": task.progress,
-            "current_step": task.current_step,
-            "total_steps": task.total_steps,
-            "created_at": task.created_at,
-            "started_at": task.started_at,
-            "completed_at": task.completed_at,
-            "input_file_path": task.input_file_path,
-            "output_file_path": task.output_file_path,
-            "file_size": task.file_size,
-            "error_message": task.error_message
-        }
-        
-        # 解析参数JSON
-        if task.parameters:
-            try:
-                task_dict["parameters"] = json.loads(task.parameters)
-            except:
-                task_dict["parameters"] = {}
-        else:
-            task_dict["parameters"] = {}
-        
-        return TaskResponse(**task_dict)
+        # 构建响应（附带排队信息）
+        return _build_task_response(task, include_queue=True)
         
     except HTTPException:
         raise
@@ -238,17 +457,21 @@ async def cancel_task(
     """取消任务"""
     try:
         task_service = TaskService(db)
-        await task_service.cancel_task(task_id)
+        if not await task_service.cancel_task(task_id):
+            raise HTTPException(status_code=409, detail="任务不存在或已结束，无法取消")
         return {"message": "任务已取消"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/{task_id}/download")
 async def download_result(
     task_id: str,
+    suffix: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    """下载任务结果文件"""
+    """下载任务结果文件（多平台任务通过suffix指定目标，默认第一个）"""
     try:
         result = await db.execute(select(Task).where(Task.task_id == task_id))
         task = result.scalar_one_or_none()
@@ -259,12 +482,20 @@ async def download_result(
         if task.status != TaskStatus.COMPLETED:
             raise HTTPException(status_code=400, detail="任务未完成")
         
-        if not task.output_file_path or not os.path.exists(task.output_file_path):
+        output_path = task.output_file_path
+        if suffix:
+            output_files = json.loads(task.output_files) if task.output_files else []
+            matched = [item for item in output_files if item.get("suffix") == suffix]
+            if not matched:
+                raise HTTPException(status_code=404, detail=f"未找到目标平台的结果文件: {suffix}")
+            output_path = matched[0]["file_path"]
+        
+        if not output_path or not os.path.exists(output_path):
             raise HTTPException(status_code=404, detail="结果文件不存在")
         
         return FileResponse(
-            path=task.output_file_path,
-            filename=os.path.basename(task.output_file_path),
+            path=output_path,
+            filename=os.path.basename(output_path),
             media_type='application/octet-stream'
         )
         
@@ -273,13 +504,151 @@ async def download_result(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+FINISHED_STATUSES = (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value)
+
+async def _get_log_task(db: AsyncSession, task_id: str) -> Task:
+    """获取任务，不存在时返回404"""
+    result = await db.execute(select(Task).where(Task.task_id == task_id))
+    task = result.scalar_one_or_none()
+    if not task:
+        raise HTTPException(status_code=404, detail="任务不存在")
+    return task
+
+async def _legacy_log(db: AsyncSession, task_id: str) -> Optional[bytes]:
+    """旧版本保存在log_content列中的日志"""
+    result = await db.execute(select(Task.log_content).where(Task.task_id == task_id))
+    content = result.scalar_one_or_none()
+    return content.encode("utf-8") if content else None
+
+def _log_source(task: Task) -> str:
+    """日志所在的任务（复用相同任务结果的跟随者读取领队任务的日志）"""
+    if not os.path.exists(task_logs.log_path(task.task_id)) and task.leader_task_id:
+        return task.leader_task_id
+    return task.task_id
+
+@router.get("/{task_id}/logs")
+async def get_task_logs(
+    task_id: str,
+    offset: int = Query(0, alias="from", ge=0),
+    limit: int = Query(64 * 1024, ge=1, le=1024 * 1024),
+    db: AsyncSession = Depends(get_db)
+):
+    """按字节偏移分段获取任务日志（from为起始偏移，返回next_offset供下次读取）"""
+    task = await _get_log_task(db, task_id)
+    source_id = _log_source(task)
+    
+    log_range = await asyncio.to_thread(task_logs.read_range, source_id, offset, limit)
+    if log_range is None:
+        legacy = await _legacy_log(db, task_id) or b""
+        chunk = legacy[offset:offset + limit]
+        log_range = {
+            "offset": min(offset, len(legacy)),
+            "next_offset": min(offset, len(legacy)) + len(chunk),
+            "size": len(legacy),
+            "content": chunk.decode("utf-8", errors="replace")
+        }
+    
+    return {
+        "task_id": task_id,
+        "source_task_id": source_id,
+        **log_range,
+        "finished": task.status in FINISHED_STATUSES
+    }
+
+@router.get("/{task_id}/logs/tail")
+async def get_task_log_tail(
+    task_id: str,
+    lines: int = Query(200, ge=1, le=5000),
+    db: AsyncSession = Depends(get_db)
+):
+    """获取任务日志的最后若干行"""
+    task = await _get_log_task(db, task_id)
+    source_id = _log_source(task)
+    
+    tail = await asyncio.to_thread(task_logs.read_tail, source_id, lines)
+    if tail is None:
+        legacy = await _legacy_log(db, task_id) or b""
+        tail_lines = legacy.decode("utf-8", errors="replace").splitlines()[-lines:]
+        tail = {
+            "offset": max(len(legacy) - len("\n".join(tail_lines).encode("utf-8")), 0),
+            "next_offset": len(legacy),
+            "size": len(legacy),
+            "lines": tail_lines
+        }
+    
+    return {
+        "task_id": task_id,
+        "source_task_id": source_id,
+        **tail,
+        "finished": task.status in FINISHED_STATUSES
+    }
+
 @router.websocket("/ws/{task_id}")
-async def websocket_task_progress(websocket: WebSocket, task_id: str):
-    """WebSocket连接，实时推送任务进度"""
-    await manager.connect(websocket, task_id)
+async def websocket_task_progress(websocket: WebSocket, task_id: str, since: Optional[int] = Query(None)):
+    """WebSocket连接，实时推送任务进度（重连时通过since补发该序号之后的事件）"""
+    await manager.connect(websocket, task_id, since=since)
     try:
         while True:
             # 保持连接活跃
             await websocket.receive_text()
-    except WebSocketDisconnect:
-        manager.disconnect(websocket, task_id)
\ No newline at end of file
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: 慢连接已被服务端关闭
+        pass
+    finally:
+        manager.disconnect(websocket, task_id)
+
+async def _batch_task_ids(batch_ids: List[str]) -> List[str]:
+    """获取批次包含的任务ID"""
+    if not batch_ids:
+        return []
+    async with async_session_maker() as db:
+        result = await db.execute(select(Task.task_id).where(Task.batch_id.in_(batch_ids)))
+        return list(result.scalars().all())
+
+@router.websocket("/ws")
+async def websocket_multiplex(websocket: WebSocket):
+    """多路复用的WebSocket连接，一个连接可订阅多个任务
+    
+    客户端发送 {"action": "subscribe" | "unsubscribe", "task_ids": [...], "batch_ids": [...], "all": true}，
+    推送的每条消息带有task_id字段以区分任务，进度和日志消息带有按任务递增的seq。
+    重连时subscribe消息可携带 "since": {task_id: seq}，先补发各任务该序号之后的事件。
+    """
+    connection = await manager.connect(websocket)
+    try:
+        while True:
+            try:
+                request = json.loads(await websocket.receive_text())
+                action = request.get("action")
+                task_ids = list(request.get("task_ids") or [])
+                batch_ids = list(request.get("batch_ids") or [])
+                all_tasks = bool(request.get("all"))
+                since = {str(key): int(value) for key, value in (request.get("since") or {}).items()}
+            except (ValueError, AttributeError, TypeError):
+                connection.send({"type": "error", "data": {"message": "无效的订阅消息"}})
+                continue
+            
+            if action == "ping":
+                connection.send({"type": "pong"})
+                continue
+            if action not in ("subscribe", "unsubscribe"):
+                connection.send({"type": "error", "data": {"message": f"不支持的操作: {action}"}})
+                continue
+            
+            # 批次订阅展开为批次内的任务（批次创建后任务不再变化）
+            task_ids += await _batch_task_ids(batch_ids)
+            if action == "subscribe":
+                manager.subscribe(connection, task_ids, all_tasks=all_tasks, since=since)
+            else:
+                manager.unsubscribe(connection, task_ids, all_tasks=all_tasks)
+            
+            connection.send({
+                "type": "subscribed",
+                "data": {
+                    "task_ids": sorted(connection.task_ids),
+                    "all": connection.all_tasks
+                }
+            })
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        manager.disconnect(websocket)
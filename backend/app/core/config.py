@@ -34,19 +34,87 @@ class Settings(BaseSettings):
     # Redis配置
     REDIS_URL: str = "redis://localhost:6379/0"
     
+    # 任务事件总线配置（多进程部署时需使用redis，使WebSocket连接能收到其他进程中任务的进度）
+    EVENT_BUS: str = "memory"  # memory 或 redis
+    EVENT_BUS_CHANNEL: str = "dify-repackaging:events"
+    EVENT_BUS_QUEUE_SIZE: int = 10000  # 等待发布到Redis的事件数上限，超出时丢弃
+    
     # 文件存储配置
     UPLOAD_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "uploads")
     OUTPUT_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "outputs")
     MAX_FILE_SIZE: int = 500 * 1024 * 1024  # 500MB
+    UPLOAD_CHUNK_SIZE: int = 1024 * 1024  # 上传文件每次写入磁盘的块大小（字节）
+    UPLOAD_SESSION_CHUNK_SIZE: int = 8 * 1024 * 1024  # 断点续传时建议客户端使用的分块大小（字节）
+    UPLOAD_SESSION_TTL: int = 86400  # 秒，断点续传会话在没有新分块后的保留时间
+    UPLOAD_SESSION_CLEANUP_INTERVAL: int = 600  # 秒，清理过期上传会话的间隔
+    CACHE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "cache")
+    # 任务日志目录（每个任务一个只追加的日志文件）
+    LOG_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "logs")
+    # 任务临时工作目录（可指向tmpfs等高速存储，如/dev/shm/dify-repackaging）
+    WORK_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "workspaces")
     
     # API配置
     DEFAULT_GITHUB_API_URL: str = "https://github.com"
     DEFAULT_MARKETPLACE_API_URL: str = "https://marketplace.dify.ai"
     DEFAULT_PIP_MIRROR_URL: str = "https://mirrors.aliyun.com/pypi/simple"
+    # 依赖解析的目标Python版本（如3.12），为空时使用当前解释器版本
+    PIP_PYTHON_VERSION: str = ""
+    
+    # 打包工具配置（dify-plugin-<os>-<arch>-5g所在目录）
+    DIFY_PLUGIN_BIN_DIR: str = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+    
+    # WebSocket推送配置（每个连接独立的发送队列）
+    WS_SEND_QUEUE_SIZE: int = 1000  # 单个连接最多积压的消息数
+    WS_OVERFLOW_POLICY: str = "drop_oldest"  # 队列满时的处理方式：drop_oldest（丢弃最早的日志）或 disconnect
+    WS_SEND_TIMEOUT: float = 10.0  # 秒，单条消息发送超时的连接视为慢连接并断开
+    WS_REPLAY_BUFFER_SIZE: int = 500  # 每个任务保留的最近事件数，重连时通过since补发
+    WS_REPLAY_MAX_TASKS: int = 1000  # 最多保留事件的任务数（按最近使用淘汰）
     
     # 任务配置
-    TASK_TIMEOUT: int = 1800  # 30分钟
+    TASK_TIMEOUT: int = 1800  # 30分钟，单个任务的整体执行时间上限，0表示不限制
+    # 各阶段的执行时间上限（秒），0表示不限制，超时后结束该阶段的外部命令并将任务标记为失败
+    STAGE_TIMEOUT_DOWNLOAD: int = 600
+    STAGE_TIMEOUT_EXTRACT: int = 120
+    STAGE_TIMEOUT_DEPENDENCIES: int = 1200
+    STAGE_TIMEOUT_PACKAGE: int = 600
     MAX_CONCURRENT_TASKS: int = 5
+    SHUTDOWN_GRACE_PERIOD: float = 300.0  # 秒，停止服务时等待运行中任务完成的时间，超时的任务终止后重新排队
+    CANCEL_GRACE_PERIOD: float = 5.0  # 秒，取消任务时子进程收到SIGTERM后的退出等待时间，超时发送SIGKILL
+    EMBEDDED_WORKER: bool = True  # 是否在API进程中执行任务，为false时只入队，由独立的worker.py执行
+    WORKER_LEASE_TTL: int = 60  # 秒，任务执行租约有效期，执行节点失联超过该时间后任务重新排队
+    WORKER_HEARTBEAT_INTERVAL: int = 15  # 秒，续约及检查过期租约的间隔
+    WORKER_POLL_INTERVAL: float = 2.0  # 秒，独立执行节点查询待处理任务的间隔
+    TASK_MAX_ATTEMPTS: int = 3  # 执行中断（服务重启、节点失联）的任务最多执行次数，达到后标记为失败
+    TASK_RETRY_BACKOFF: float = 30.0  # 秒，中断任务重新排队后的首次重试等待时间，之后每次翻倍
+    TASK_RETRY_BACKOFF_MAX: float = 600.0  # 秒，重试等待时间上限
+    MAX_BATCH_SIZE: int = 1000  # 单个批次最多包含的任务数
+    PROGRESS_FLUSH_INTERVAL: float = 2.0  # 秒，任务进度批量写入数据库的间隔（状态变化时立即写入）
+    
+    # 结果缓存配置
+    RESULT_CACHE_ENABLED: bool = True
+    RESULT_CACHE_MAX_AGE: int = 7 * 24 * 3600  # 7天
+    RESULT_CACHE_MAX_SIZE: int = 10 * 1024 * 1024 * 1024  # 10GB
+    
+    # 共享依赖仓库配置
+    WHEELHOUSE_ENABLED: bool = True
+    WHEELHOUSE_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "cache", "wheels")
+    WHEELHOUSE_MAX_SIZE: int = 20 * 1024 * 1024 * 1024  # 20GB
+    
+    # 插件包下载配置（未完成的下载保存在CACHE_DIR/downloads，支持断点续传）
+    DOWNLOAD_RETRIES: int = 3
+    DOWNLOAD_BACKOFF: float = 1.0  # 秒，每次重试翻倍
+    DOWNLOAD_PARTIAL_MAX_AGE: int = 24 * 3600  # 超过该时间未更新的部分文件会被删除
+    
+    # 依赖解析缓存配置
+    RESOLUTION_CACHE_ENABLED: bool = True
+    RESOLUTION_CACHE_TTL: int = 24 * 3600  # 1天
+    
+    # 依赖下载配置（parallel: 解析后并发下载，pip: 使用pip download逐个下载）
+    DEPENDENCY_DOWNLOADER: str = "parallel"
+    WHEEL_FETCH_CONCURRENCY: int = 8
+    WHEEL_FETCH_PER_HOST: int = 4
+    WHEEL_FETCH_RETRIES: int = 3
+    WHEEL_FETCH_BACKOFF: float = 0.5  # 秒，每次重试翻倍
     
     # 安全配置
     SECRET_KEY: str = "your-secret-key-here"
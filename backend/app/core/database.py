@@ -1,5 +1,6 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy import inspect, text
 from app.core.config import settings
 
 # 创建异步数据库引擎
@@ -28,8 +29,32 @@ async def get_db():
         finally:
             await session.close()
 
+def _add_missing_columns(sync_conn):
+    """为已存在的表补充模型中新增的列（轻量级迁移，create_all不会修改已有表）"""
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        
+        existing_columns = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing_columns:
+                continue
+            
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+        
+        # 补充新增列上的索引
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
 async def init_db():
     """初始化数据库"""
+    # 确保全部模型已注册（独立worker等入口不会导入API模块）
+    import app.models  # noqa: F401
+    
     async with engine.begin() as conn:
         # 创建所有表
-        await conn.run_sync(Base.metadata.create_all)
\ No newline at end of file
+        await conn.run_sync(Base.metadata.create_all)
+        # 补充旧数据库中缺失的列
+        await conn.run_sync(_add_missing_columns)
\ No newline at end of file
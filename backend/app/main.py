@@ -1,4 +1,5 @@
 from fastapi import FastAPI, HTTPException
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from contextlib import asynccontextmanager
@@ -12,6 +13,9 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.api import main_router
 from app.core.config import settings
 from app.core.database import init_db
+from app.services.scheduler import task_scheduler
+from app.services.progress_store import progress_store
+from app.services.upload_sessions import upload_sessions
 
 # 配置日志
 logging.basicConfig(
@@ -23,6 +27,7 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
+    from app.api.tasks import manager
     try:
         # 启动时初始化数据库
         await init_db()
@@ -33,12 +38,33 @@ async def lifespan(app: FastAPI):
         os.makedirs(settings.OUTPUT_DIR, exist_ok=True)
         logger.info("Upload and output directories created")
         
+        # 启动进度写回缓存
+        await progress_store.start()
+        
+        # 定期清理过期的断点续传会话
+        await upload_sessions.start()
+        
+        # 启动事件总线，多进程部署时通过Redis转发任务进度
+        await manager.start()
+        
+        # 启动任务调度器（恢复数据库中的待处理队列）
+        if settings.EMBEDDED_WORKER:
+            await task_scheduler.start(manager)
+        else:
+            logger.info("Embedded worker disabled, tasks are executed by worker.py")
+        
         yield
         
     except Exception as e:
         logger.error(f"Error during startup: {e}")
         raise
     finally:
+        # 排空：不再开始新任务，等待运行中的任务完成，超时的任务重新排队
+        await task_scheduler.drain()
+        await task_scheduler.stop()
+        await progress_store.stop()
+        await upload_sessions.stop()
+        await manager.stop()
         logger.info("Application shutdown")
 
 # 创建FastAPI应用
@@ -72,6 +98,9 @@ async def root():
 
 @app.get("/health")
 async def health_check():
+    # 排空中返回503，负载均衡器据此停止转发请求
+    if task_scheduler.draining:
+        return JSONResponse(status_code=503, content={"status": "draining", "version": "1.0.0"})
     return {"status": "healthy", "version": "1.0.0"}
 
 if __name__ == "__main__":
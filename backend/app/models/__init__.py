@@ -1 +1,3 @@
-# Models package
\ No newline at end of file
+# Models package
+# 导入全部模型模块，使其注册到Base.metadata（init_db依赖）
+from app.models import task, cache, upload  # noqa: F401
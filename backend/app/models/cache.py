@@ -0,0 +1,59 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text
+from app.core.database import Base
+from pydantic import BaseModel
+
+class ResultCacheEntry(Base):
+    """重新打包结果缓存模型"""
+    __tablename__ = "result_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, index=True, nullable=False)
+
+    # 缓存文件信息
+    file_path = Column(String(500), nullable=False)
+    output_filename = Column(String(300), nullable=False)
+    file_size = Column(Integer, default=0)
+    source_task_id = Column(String(50), nullable=True)
+
+    # 使用信息
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    last_used_at = Column(DateTime(timezone=True), nullable=False)
+
+class ResolutionCacheEntry(Base):
+    """依赖解析结果缓存模型"""
+    __tablename__ = "resolution_cache"
+
+    id = Column(Integer, primary_key=True, index=True)
+    cache_key = Column(String(64), unique=True, index=True, nullable=False)
+
+    # 解析条件
+    platform = Column(String(100), nullable=True)
+    python_version = Column(String(20), nullable=True)
+
+    # 解析结果（JSON格式的依赖文件列表）
+    distributions = Column(Text, nullable=False)
+
+    # 使用信息
+    hit_count = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    last_used_at = Column(DateTime(timezone=True), nullable=False)
+
+# Pydantic模型
+class CacheStats(BaseModel):
+    """缓存统计模型"""
+    enabled: bool
+    hits: int
+    misses: int
+    entries: int
+    total_size: int
+    max_size: int
+    max_age: int
+
+class ResolutionCacheStats(BaseModel):
+    """依赖解析缓存统计模型"""
+    enabled: bool
+    hits: int
+    misses: int
+    entries: int
+    ttl: int
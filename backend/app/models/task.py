@@ -1,8 +1,9 @@
 from sqlalchemy import Column, Integer, String, DateTime, Text, Float, Boolean
 from sqlalchemy.sql import func
+from sqlalchemy.orm import deferred
 from app.core.database import Base
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from datetime import datetime
 from enum import Enum
 
@@ -32,12 +33,31 @@ class Task(Base):
     mode = Column(String(20), nullable=False)  # market, github, local
     status = Column(String(20), default=TaskStatus.PENDING)
     
+    # 调度信息（数值越大越优先）
+    priority = Column(Integer, default=0, index=True)
+    # 所属批次
+    batch_id = Column(String(50), nullable=True, index=True)
+    
+    # 结果缓存键（由规范化参数生成）
+    cache_key = Column(String(64), nullable=True, index=True)
+    # 合并到的相同进行中任务（跟随者共享其进度和结果）
+    leader_task_id = Column(String(50), nullable=True)
+    
+    # 执行租约：认领任务的执行节点及租约到期时间（节点定期续约，过期未续约的任务重新排队）
+    lease_owner = Column(String(100), nullable=True)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    # 已开始执行的次数，及执行中断后重新排队的最早开始时间（指数退避）
+    attempts = Column(Integer, default=0)
+    retry_at = Column(DateTime(timezone=True), nullable=True)
+    
     # 任务参数（JSON字符串）
     parameters = Column(Text, nullable=True)
     
     # 文件信息
     input_file_path = Column(String(500), nullable=True)
     output_file_path = Column(String(500), nullable=True)
+    # 多平台任务的全部输出文件（JSON字符串）
+    output_files = Column(Text, nullable=True)
     file_size = Column(Integer, nullable=True)
     
     # 进度信息
@@ -52,13 +72,27 @@ class Task(Base):
     
     # 结果信息
     error_message = Column(Text, nullable=True)
-    log_content = Column(Text, nullable=True)
+    # 旧版本保存的完整日志，新任务的日志写入LOG_DIR（延迟加载，避免查询任务时读取大文本）
+    log_content = deferred(Column(Text, nullable=True))
+    # 各阶段耗时和字节数（JSON字符串）
+    stage_metrics = Column(Text, nullable=True)
+
+class TaskBatch(Base):
+    """任务批次模型"""
+    __tablename__ = "task_batches"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    batch_id = Column(String(50), unique=True, index=True, nullable=False)
+    name = Column(String(200), nullable=True)
+    total = Column(Integer, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
 
 # Pydantic模型
 class TaskCreate(BaseModel):
     """创建任务请求模型"""
     mode: ProcessMode
     parameters: Dict[str, Any]
+    priority: int = 0
 
 class TaskResponse(BaseModel):
     """任务响应模型"""
@@ -68,6 +102,13 @@ class TaskResponse(BaseModel):
     mode: str
     status: str
     parameters: Optional[Dict[str, Any]] = None
+    priority: int = 0
+    queue_position: Optional[int] = None  # 排队位置（从1开始，仅pending任务）
+    queue_depth: Optional[int] = None  # 当前排队任务总数
+    leader_task_id: Optional[str] = None
+    batch_id: Optional[str] = None
+    attempts: int = 0
+    retry_at: Optional[datetime] = None  # 执行中断后重新排队的任务最早的重试时间
     progress: float
     current_step: Optional[str] = None
     total_steps: int
@@ -76,12 +117,34 @@ class TaskResponse(BaseModel):
     completed_at: Optional[datetime] = None
     input_file_path: Optional[str] = None
     output_file_path: Optional[str] = None
+    output_files: Optional[List[Dict[str, Any]]] = None
     file_size: Optional[int] = None
     error_message: Optional[str] = None
+    stage_metrics: Optional[List[Dict[str, Any]]] = None
     
     class Config:
         from_attributes = True
 
+class BatchCreate(BaseModel):
+    """批量创建任务请求模型"""
+    name: Optional[str] = None
+    tasks: List[TaskCreate]
+    priority: Optional[int] = None  # 指定时覆盖每个任务的优先级
+
+class BatchResponse(BaseModel):
+    """批次响应模型"""
+    batch_id: str
+    name: Optional[str] = None
+    total: int
+    queued: int = 0
+    running: int = 0
+    completed: int = 0
+    failed: int = 0
+    cancelled: int = 0
+    progress: float = 0.0  # 整体进度（已结束的任务按完成计）
+    created_at: Optional[datetime] = None
+    task_ids: Optional[List[str]] = None
+
 class TaskProgress(BaseModel):
     """任务进度模型"""
     task_id: str
@@ -91,6 +154,11 @@ class TaskProgress(BaseModel):
     message: str
     timestamp: datetime
 
+class PlatformTarget(BaseModel):
+    """多平台打包的单个目标"""
+    platform: Optional[str] = None
+    suffix: Optional[str] = None  # 为空时使用platform
+
 class MarketParams(BaseModel):
     """Market模式参数"""
     author: str
@@ -98,6 +166,7 @@ class MarketParams(BaseModel):
     version: str
     platform: Optional[str] = None
     suffix: Optional[str] = "offline"
+    targets: Optional[List[PlatformTarget]] = None  # 指定时忽略platform和suffix
 
 class GithubParams(BaseModel):
     """Github模式参数"""
@@ -106,10 +175,13 @@ class GithubParams(BaseModel):
     asset_name: str
     platform: Optional[str] = None
     suffix: Optional[str] = "offline"
+    targets: Optional[List[PlatformTarget]] = None  # 指定时忽略platform和suffix
 
 class LocalParams(BaseModel):
     """Local模式参数"""
     file_name: str
     original_filename: Optional[str] = None
+    file_sha256: Optional[str] = None
     platform: Optional[str] = None
-    suffix: Optional[str] = "offline"
\ No newline at end of file
+    suffix: Optional[str] = "offline"
+    targets: Optional[List[PlatformTarget]] = None  # 指定时忽略platform和suffix
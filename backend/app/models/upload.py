@@ -0,0 +1,65 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text
+from app.core.database import Base
+from pydantic import BaseModel
+from typing import Optional, List
+from datetime import datetime
+
+from app.models.task import PlatformTarget
+
+class UploadSession(Base):
+    """断点续传上传会话模型"""
+    __tablename__ = "upload_sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    upload_id = Column(String(50), unique=True, index=True, nullable=False)
+
+    # 文件信息（file_path为预分配的临时文件，分块直接写入其中的对应位置）
+    filename = Column(String(300), nullable=False)
+    file_size = Column(Integer, nullable=False)
+    file_path = Column(String(500), nullable=False)
+    # 客户端声明的sha256，完成时校验
+    sha256 = Column(String(64), nullable=True)
+
+    # 完成后创建Local任务的参数（JSON字符串）
+    parameters = Column(Text, nullable=True)
+    priority = Column(Integer, default=0)
+
+    # uploading（接收分块中）、completing（校验中）、completed（已创建任务）
+    status = Column(String(20), default="uploading")
+    task_id = Column(String(50), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    # 每收到一个分块顺延，过期后会话和临时文件被删除
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class UploadChunk(Base):
+    """上传会话已接收的分块"""
+    __tablename__ = "upload_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    upload_id = Column(String(50), index=True, nullable=False)
+    offset = Column(Integer, nullable=False)
+    length = Column(Integer, nullable=False)
+
+class UploadSessionCreate(BaseModel):
+    """创建上传会话请求模型"""
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+    platform: Optional[str] = None
+    suffix: Optional[str] = "offline"
+    targets: Optional[List[PlatformTarget]] = None
+    priority: int = 0
+
+class UploadSessionResponse(BaseModel):
+    """上传会话响应模型"""
+    upload_id: str
+    filename: str
+    size: int
+    status: str
+    received: List[List[int]] = []  # 已接收的字节范围 [start, end)，按起始位置排序并合并
+    received_bytes: int = 0
+    chunk_size: int  # 建议的分块大小
+    task_id: Optional[str] = None
+    created_at: datetime
+    expires_at: datetime
@@ -0,0 +1,261 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, delete, func
+
+from app.models.cache import ResultCacheEntry, CacheStats
+from app.core.config import settings
+from app.services.workspace import build_targets
+
+logger = logging.getLogger(__name__)
+
+def compute_file_sha256(file_path: str, chunk_size: int = 1024 * 1024) -> str:
+    """计算文件的sha256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def link_or_copy(src: str, dst: str):
+    """优先使用硬链接，跨文件系统时退回复制；目标已存在时原子替换"""
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        return
+
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    # 临时文件名由mkstemp保证唯一（同一进程内的多个线程也不会冲突）
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(dst), prefix=f".{os.path.basename(dst)}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        try:
+            # 硬链接不能覆盖已存在的文件，先删除占位文件
+            os.remove(tmp_path)
+            os.link(src, tmp_path)
+        except OSError:
+            shutil.copy2(src, tmp_path)
+        os.replace(tmp_path, dst)
+    except BaseException:
+        _remove_file(tmp_path)
+        raise
+
+def task_output_path(task_id: str, filename: str) -> str:
+    """任务产物路径（每个任务一个子目录，同名产物互不覆盖）"""
+    return os.path.join(settings.OUTPUT_DIR, task_id, os.path.basename(filename))
+
+def _remove_file(file_path: str):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+def _normalize(value: Any) -> str:
+    return str(value or "").strip()
+
+def _normalize_github_repo(repo: Any) -> str:
+    """统一Github仓库标识（去掉站点前缀、结尾斜杠和.git）"""
+    repo = _normalize(repo).rstrip("/")
+    prefix = settings.DEFAULT_GITHUB_API_URL.rstrip("/") + "/"
+    if repo.startswith(prefix):
+        repo = repo[len(prefix):]
+    if repo.endswith(".git"):
+        repo = repo[:-4]
+    return repo
+
+class ResultCache:
+    """重新打包结果缓存
+
+    以规范化后的任务参数（Local模式为上传文件的sha256）作为键，缓存生成的离线包，
+    相同请求直接复用已有产物。缓存按存活时间和总大小（LRU）淘汰。
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def results_dir(self) -> str:
+        return os.path.join(settings.CACHE_DIR, "results")
+
+    def build_key(self, mode: str, parameters: Dict[str, Any]) -> Optional[str]:
+        """根据模式和参数生成缓存键，无法确定内容时返回None"""
+        if mode == "market":
+            identity = {
+                "author": _normalize(parameters.get("author")),
+                "name": _normalize(parameters.get("name")),
+                "version": _normalize(parameters.get("version"))
+            }
+        elif mode == "github":
+            identity = {
+                "repo": _normalize_github_repo(parameters.get("repo")),
+                "release": _normalize(parameters.get("release")),
+                "asset_name": _normalize(parameters.get("asset_name"))
+            }
+        elif mode == "local":
+            file_sha256 = _normalize(parameters.get("file_sha256"))
+            if not file_sha256:
+                return None
+            identity = {"sha256": file_sha256}
+        else:
+            return None
+
+        payload = {
+            "mode": mode,
+            **identity,
+            "platform": _normalize(parameters.get("platform")),
+            "suffix": _normalize(parameters.get("suffix")) or "offline"
+        }
+        if parameters.get("targets"):
+            # 多平台任务的产物由全部目标共同决定
+            payload.pop("platform")
+            payload.pop("suffix")
+            try:
+                payload["targets"] = build_targets(parameters)
+            except ValueError:
+                return None
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def lookup(self, db: AsyncSession, cache_key: Optional[str]) -> Optional[ResultCacheEntry]:
+        """查找缓存，过期或文件丢失的条目视为未命中并被清理"""
+        if not settings.RESULT_CACHE_ENABLED or not cache_key:
+            return None
+
+        result = await db.execute(select(ResultCacheEntry).where(ResultCacheEntry.cache_key == cache_key))
+        entry = result.scalar_one_or_none()
+
+        if entry and (self._is_expired(entry) or not os.path.exists(entry.file_path)):
+            await self._delete_entry(db, entry)
+            await db.commit()
+            entry = None
+
+        if not entry:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        entry.hit_count = (entry.hit_count or 0) + 1
+        entry.last_used_at = datetime.now()
+        await db.commit()
+        return entry
+
+    async def lookup_many(self, db: AsyncSession, cache_keys: List[str]) -> Dict[str, ResultCacheEntry]:
+        """批量查找缓存（一次查询），返回命中的 缓存键 -> 条目"""
+        cache_keys = list({key for key in cache_keys if key})
+        if not settings.RESULT_CACHE_ENABLED or not cache_keys:
+            return {}
+
+        result = await db.execute(select(ResultCacheEntry).where(ResultCacheEntry.cache_key.in_(cache_keys)))
+        entries = {}
+        now = datetime.now()
+        for entry in result.scalars().all():
+            if self._is_expired(entry) or not os.path.exists(entry.file_path):
+                await self._delete_entry(db, entry)
+                continue
+            entry.hit_count = (entry.hit_count or 0) + 1
+            entry.last_used_at = now
+            entries[entry.cache_key] = entry
+        await db.commit()
+
+        self.hits += len(entries)
+        self.misses += len(cache_keys) - len(entries)
+        return entries
+
+    async def materialize(self, entry: ResultCacheEntry, task_id: str) -> str:
+        """将缓存产物放到任务的输出目录，返回输出文件路径"""
+        output_path = task_output_path(task_id, entry.output_filename)
+        await asyncio.to_thread(link_or_copy, entry.file_path, output_path)
+        return output_path
+
+    async def store(self, db: AsyncSession, cache_key: Optional[str], output_path: str, task_id: Optional[str] = None):
+        """将任务产物写入缓存"""
+        if not settings.RESULT_CACHE_ENABLED or not cache_key or not os.path.exists(output_path):
+            return
+
+        try:
+            cache_path = os.path.join(self.results_dir, f"{cache_key}.difypkg")
+            await asyncio.to_thread(link_or_copy, output_path, cache_path)
+
+            await db.execute(delete(ResultCacheEntry).where(ResultCacheEntry.cache_key == cache_key))
+            now = datetime.now()
+            db.add(ResultCacheEntry(
+                cache_key=cache_key,
+                file_path=cache_path,
+                output_filename=os.path.basename(output_path),
+                file_size=os.path.getsize(cache_path),
+                source_task_id=task_id,
+                hit_count=0,
+                created_at=now,
+                last_used_at=now
+            ))
+            await db.commit()
+
+            await self.evict(db)
+        except Exception as e:
+            logger.warning(f"Failed to store result cache for task {task_id}: {e}")
+
+    async def evict(self, db: AsyncSession) -> int:
+        """淘汰过期条目，并按最近使用时间淘汰超出总大小限制的条目"""
+        removed = 0
+        result = await db.execute(select(ResultCacheEntry).order_by(ResultCacheEntry.last_used_at))
+        entries = list(result.scalars().all())
+
+        kept = []
+        for entry in entries:
+            if self._is_expired(entry):
+                await self._delete_entry(db, entry)
+                removed += 1
+            else:
+                kept.append(entry)
+
+        total_size = sum(entry.file_size or 0 for entry in kept)
+        for entry in kept:
+            if total_size <= settings.RESULT_CACHE_MAX_SIZE:
+                break
+            total_size -= entry.file_size or 0
+            await self._delete_entry(db, entry)
+            removed += 1
+
+        await db.commit()
+        return removed
+
+    async def clear(self, db: AsyncSession) -> int:
+        """清空缓存"""
+        result = await db.execute(select(ResultCacheEntry))
+        entries = list(result.scalars().all())
+        for entry in entries:
+            await self._delete_entry(db, entry)
+        await db.commit()
+        return len(entries)
+
+    async def stats(self, db: AsyncSession) -> CacheStats:
+        """获取缓存统计"""
+        result = await db.execute(
+            select(func.count(ResultCacheEntry.id), func.coalesce(func.sum(ResultCacheEntry.file_size), 0))
+        )
+        entries, total_size = result.one()
+        return CacheStats(
+            enabled=settings.RESULT_CACHE_ENABLED,
+            hits=self.hits,
+            misses=self.misses,
+            entries=entries,
+            total_size=total_size,
+            max_size=settings.RESULT_CACHE_MAX_SIZE,
+            max_age=settings.RESULT_CACHE_MAX_AGE
+        )
+
+    def _is_expired(self, entry: ResultCacheEntry) -> bool:
+        created_at = entry.created_at.replace(tzinfo=None)
+        return datetime.now() - created_at > timedelta(seconds=settings.RESULT_CACHE_MAX_AGE)
+
+    async def _delete_entry(self, db: AsyncSession, entry: ResultCacheEntry):
+        await asyncio.to_thread(_remove_file, entry.file_path)
+        await db.delete(entry)
+
+# 全局结果缓存
+result_cache = ResultCache()
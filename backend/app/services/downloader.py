@@ -0,0 +1,352 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from typing import Optional, Dict, Set, Callable, Awaitable
+
+import aiofiles
+import httpx
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from app.core.config import settings
+from app.services.cache_service import compute_file_sha256
+
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+# 等待其他进程释放部分文件锁时的轮询间隔（秒）
+LOCK_POLL_INTERVAL = 0.2
+
+# 没有fcntl的平台（Windows）不创建锁文件，只在进程内互斥，仅支持单进程部署
+_held_locally: Set[str] = set()
+
+class DownloadError(Exception):
+    """下载错误"""
+    pass
+
+class _RetryableDownloadError(DownloadError):
+    pass
+
+class _RangeNotSatisfiable(Exception):
+    """部分文件与服务端资源不一致，续传范围无效"""
+    pass
+
+@dataclass
+class DownloadProgress:
+    """下载进度"""
+    bytes_done: int
+    bytes_total: Optional[int]
+    speed: float  # 字节/秒（本次传输）
+
+    @property
+    def eta(self) -> Optional[float]:
+        """预计剩余秒数"""
+        if not self.bytes_total or not self.speed:
+            return None
+        return max(self.bytes_total - self.bytes_done, 0) / self.speed
+
+class PartialFileLock:
+    """部分文件的跨进程排他锁
+
+    同一地址的下载共用一个部分文件，多个进程（API与独立工作进程）同时下载时通过
+    对旁路锁文件加flock串行执行。释放时删除锁文件，获取锁后检查锁文件未被替换，
+    避免在已删除的锁文件上加锁。没有fcntl的平台退化为进程内互斥。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    async def __aenter__(self) -> "PartialFileLock":
+        if fcntl is None:
+            while self.path in _held_locally:
+                await asyncio.sleep(LOCK_POLL_INTERVAL)
+            _held_locally.add(self.path)
+            return self
+
+        while True:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                while not _try_flock(fd):
+                    await asyncio.sleep(LOCK_POLL_INTERVAL)
+            except BaseException:
+                os.close(fd)
+                raise
+            if _same_file(fd, self.path):
+                self._fd = fd
+                return self
+            # 上一个持有者已删除该锁文件，重新打开
+            os.close(fd)
+
+    async def __aexit__(self, *exc_info):
+        if fcntl is None:
+            _held_locally.discard(self.path)
+            return
+
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        os.close(self._fd)
+        self._fd = None
+
+def _try_flock(fd: int) -> bool:
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
+
+def _same_file(fd: int, path: str) -> bool:
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return False
+    opened = os.fstat(fd)
+    return (stat.st_dev, stat.st_ino) == (opened.st_dev, opened.st_ino)
+
+def expected_sha256_from_headers(headers: httpx.Headers) -> Optional[str]:
+    """从响应头中获取文件的sha256（X-Checksum-Sha256、Digest或Repr-Digest）"""
+    checksum = headers.get("X-Checksum-Sha256")
+    if checksum:
+        return checksum.strip().lower()
+
+    for name in ("Repr-Digest", "Digest"):
+        value = headers.get(name)
+        if not value:
+            continue
+        for item in value.split(","):
+            algorithm, _, digest = item.strip().partition("=")
+            if algorithm.lower() != "sha-256" or not digest:
+                continue
+            try:
+                return base64.b64decode(digest.strip(":")).hex()
+            except ValueError:
+                continue
+    return None
+
+class ResumableDownloader:
+    """支持断点续传的流式下载器
+
+    未完成的下载保存在CACHE_DIR/downloads中（按地址命名），失败重试或任务重新提交时
+    通过Range请求从已下载的位置继续，服务端资源变化（ETag/Last-Modified不一致）时重新下载。
+    响应头提供sha256时在完成后校验，进度按已接收字节数与Content-Length节流汇报。
+    同一地址的下载通过PartialFileLock跨进程串行执行。
+    """
+
+    def __init__(
+        self,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        on_progress: Optional[Callable[[DownloadProgress], Awaitable[None]]] = None,
+        on_log: Optional[Callable[[str], Awaitable[None]]] = None,
+        progress_interval: float = 0.5
+    ):
+        self.retries = settings.DOWNLOAD_RETRIES if retries is None else retries
+        self.backoff = settings.DOWNLOAD_BACKOFF if backoff is None else backoff
+        self.on_progress = on_progress
+        self.on_log = on_log
+        self.progress_interval = progress_interval
+        self._last_report = 0.0
+
+    @property
+    def partial_dir(self) -> str:
+        return os.path.join(settings.CACHE_DIR, "downloads")
+
+    def partial_path(self, url: str) -> str:
+        """获取地址对应的部分文件路径"""
+        return os.path.join(self.partial_dir, hashlib.sha256(url.encode("utf-8")).hexdigest() + ".part")
+
+    async def download(self, url: str, dest_path: str, expected_sha256: Optional[str] = None) -> int:
+        """下载文件到dest_path，返回文件大小"""
+        os.makedirs(self.partial_dir, exist_ok=True)
+        await asyncio.to_thread(self.cleanup_stale)
+
+        partial_path = self.partial_path(url)
+        async with PartialFileLock(f"{partial_path}.lock"):
+            for attempt in range(self.retries + 1):
+                try:
+                    checksum = await self._transfer(url, partial_path)
+                    break
+                except _RetryableDownloadError as e:
+                    if attempt >= self.retries:
+                        raise DownloadError(f"下载失败（已重试{self.retries}次）: {e}")
+                    delay = self.backoff * (2 ** attempt)
+                    await self._log(f"Download interrupted ({e}), resume in {delay:.1f}s ...")
+                    await asyncio.sleep(delay)
+
+            expected = (expected_sha256 or checksum or "").lower()
+            if expected:
+                actual = await asyncio.to_thread(compute_file_sha256, partial_path)
+                if actual != expected:
+                    self._discard(partial_path)
+                    raise DownloadError(f"sha256校验失败: 期望 {expected}，实际 {actual}")
+                await self._log(f"Checksum verified: sha256={actual}")
+
+            await asyncio.to_thread(shutil.move, partial_path, dest_path)
+            self._remove_meta(partial_path)
+        return os.path.getsize(dest_path)
+
+    async def _transfer(self, url: str, partial_path: str) -> Optional[str]:
+        """执行一次（可能是续传的）传输，返回响应头中的sha256；续传范围无效时删除部分文件从头下载"""
+        try:
+            return await self._transfer_once(url, partial_path)
+        except _RangeNotSatisfiable:
+            self._discard(partial_path)
+            await self._log("Partial download does not match the server file, restarting from the beginning ...")
+            return await self._transfer_once(url, partial_path)
+
+    async def _transfer_once(self, url: str, partial_path: str) -> Optional[str]:
+        meta = self._read_meta(partial_path)
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        if offset and not meta.get("validator"):
+            # 无法确认服务端资源未变化，不续传
+            offset = 0
+
+        headers = {}
+        if offset:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = meta["validator"]
+
+        timeout = httpx.Timeout(60.0, connect=30.0)
+        started = time.monotonic()
+        received = 0
+        try:
+            async with httpx.AsyncClient(follow_redirects=True, timeout=timeout) as client:
+                async with client.stream("GET", url, headers=headers) as response:
+                    if response.status_code == 416 and offset:
+                        if meta.get("total") == offset:
+                            # 部分文件已完整
+                            return meta.get("sha256")
+                        # 元数据与服务端不一致（如部分文件比新资源更长）
+                        raise _RangeNotSatisfiable()
+                    if response.status_code in RETRYABLE_STATUS_CODES:
+                        raise _RetryableDownloadError(f"HTTP {response.status_code}")
+                    if response.status_code not in (200, 206):
+                        self._discard(partial_path)
+                        raise DownloadError(f"下载失败: HTTP {response.status_code} {url}")
+
+                    if response.status_code == 206:
+                        await self._log(f"Resuming download from {offset} bytes ...")
+                        mode = "ab"
+                    else:
+                        offset = 0
+                        mode = "wb"
+
+                    total = self._total_size(response, offset)
+                    meta = {
+                        "url": url,
+                        "validator": response.headers.get("ETag") or response.headers.get("Last-Modified") or meta.get("validator"),
+                        "total": total,
+                        "sha256": expected_sha256_from_headers(response.headers) or meta.get("sha256")
+                    }
+                    self._write_meta(partial_path, meta)
+
+                    async with aiofiles.open(partial_path, mode) as f:
+                        async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                            await f.write(chunk)
+                            received += len(chunk)
+                            await self._report(offset + received, total, received, started)
+
+                    if total is not None and offset + received < total:
+                        raise _RetryableDownloadError(f"连接提前关闭（{offset + received}/{total} 字节）")
+        except httpx.TransportError as e:
+            raise _RetryableDownloadError(str(e) or e.__class__.__name__)
+
+        await self._report(offset + received, total, received, started, force=True)
+        return meta.get("sha256")
+
+    def cleanup_stale(self):
+        """删除超过DOWNLOAD_PARTIAL_MAX_AGE未更新的部分文件"""
+        if not os.path.exists(self.partial_dir):
+            return
+        deadline = time.time() - settings.DOWNLOAD_PARTIAL_MAX_AGE
+        for name in os.listdir(self.partial_dir):
+            path = os.path.join(self.partial_dir, name)
+            if name.endswith(".lock"):
+                # 锁文件由持有者释放时删除，这里只清理异常退出留下且无人持有的锁文件
+                self._remove_unheld_lock(path)
+                continue
+            try:
+                if os.path.getmtime(path) < deadline:
+                    os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _remove_unheld_lock(self, path: str):
+        if fcntl is None:
+            return
+        try:
+            fd = os.open(path, os.O_RDWR)
+        except FileNotFoundError:
+            return
+        try:
+            if _try_flock(fd) and _same_file(fd, path):
+                os.remove(path)
+        finally:
+            os.close(fd)
+
+    def _total_size(self, response: httpx.Response, offset: int) -> Optional[int]:
+        if response.status_code == 206:
+            content_range = response.headers.get("Content-Range", "")
+            total = content_range.rpartition("/")[2]
+            if total.isdigit():
+                return int(total)
+        content_length = response.headers.get("Content-Length")
+        if content_length and content_length.isdigit():
+            return offset + int(content_length)
+        return None
+
+    def _read_meta(self, partial_path: str) -> Dict:
+        try:
+            with open(f"{partial_path}.json", "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _write_meta(self, partial_path: str, meta: Dict):
+        with open(f"{partial_path}.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def _remove_meta(self, partial_path: str):
+        try:
+            os.remove(f"{partial_path}.json")
+        except FileNotFoundError:
+            pass
+
+    def _discard(self, partial_path: str):
+        """删除部分文件及其元数据"""
+        try:
+            os.remove(partial_path)
+        except FileNotFoundError:
+            pass
+        self._remove_meta(partial_path)
+
+    async def _report(self, bytes_done: int, bytes_total: Optional[int], received: int, started: float, force: bool = False):
+        """节流汇报下载进度"""
+        if not self.on_progress:
+            return
+        now = time.monotonic()
+        if not force and now - self._last_report < self.progress_interval:
+            return
+        self._last_report = now
+        elapsed = now - started
+        await self.on_progress(DownloadProgress(
+            bytes_done=bytes_done,
+            bytes_total=bytes_total,
+            speed=received / elapsed if elapsed > 0 else 0.0
+        ))
+
+    async def _log(self, line: str):
+        if self.on_log:
+            await self.on_log(line)
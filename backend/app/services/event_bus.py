@@ -0,0 +1,140 @@
+import asyncio
+import json
+import logging
+from typing import Optional, Dict, Any, Callable
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 事件处理函数：在每个进程中把事件推送给本进程的WebSocket连接
+EventHandler = Callable[[Dict[str, Any]], None]
+
+class EventBus:
+    """任务事件总线
+
+    任务执行进程发布进度和日志事件，所有进程（包括发布者自身）收到后推送给各自的WebSocket连接，
+    使WebSocket连接与任务不在同一个进程时也能收到实时进度。publish只做非阻塞入队。
+    """
+
+    def __init__(self):
+        self.handler: Optional[EventHandler] = None
+
+    async def start(self, handler: EventHandler):
+        """开始接收事件"""
+        self.handler = handler
+
+    async def stop(self):
+        """停止接收事件"""
+        pass
+
+    def publish(self, event: Dict[str, Any]):
+        """发布事件"""
+        raise NotImplementedError
+
+class InMemoryEventBus(EventBus):
+    """单进程事件总线：直接交给本进程处理"""
+
+    def publish(self, event: Dict[str, Any]):
+        if self.handler:
+            self.handler(event)
+
+class RedisEventBus(EventBus):
+    """基于Redis发布/订阅的跨进程事件总线
+
+    发布的事件先进入本地队列，由发送协程批量写入Redis，Redis不可用时丢弃并记录日志，不影响任务执行；
+    订阅协程断线后按退避间隔自动重连。
+    """
+
+    def __init__(self, url: Optional[str] = None, channel: Optional[str] = None):
+        super().__init__()
+        self.url = url or settings.REDIS_URL
+        self.channel = channel or settings.EVENT_BUS_CHANNEL
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=settings.EVENT_BUS_QUEUE_SIZE)
+        self._client = None
+        self._tasks: list = []
+        self.dropped = 0
+
+    async def start(self, handler: EventHandler):
+        import redis.asyncio as redis
+
+        await super().start(handler)
+        self._client = redis.from_url(self.url)
+        # 启动时检查连接，配置错误时尽早失败
+        await self._client.ping()
+        self._tasks = [
+            asyncio.create_task(self._publish_loop()),
+            asyncio.create_task(self._subscribe_loop())
+        ]
+        logger.info(f"Redis event bus started on channel {self.channel}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        if self._client:
+            await self._client.aclose()
+            self._client = None
+
+    def publish(self, event: Dict[str, Any]):
+        try:
+            self._queue.put_nowait(json.dumps(event, ensure_ascii=False))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning(f"Event bus queue full, dropped {self.dropped} events")
+
+    async def _publish_loop(self):
+        while True:
+            payload = await self._queue.get()
+            # 合并积压的事件，一次往返写入
+            payloads = [payload]
+            while not self._queue.empty() and len(payloads) < 500:
+                payloads.append(self._queue.get_nowait())
+            try:
+                async with self._client.pipeline(transaction=False) as pipe:
+                    for item in payloads:
+                        pipe.publish(self.channel, item)
+                    await pipe.execute()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.dropped += len(payloads)
+                logger.error(f"Failed to publish {len(payloads)} events to redis: {e}")
+
+    async def _subscribe_loop(self):
+        delay = 1.0
+        while True:
+            try:
+                async with self._client.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    delay = 1.0
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        try:
+                            event = json.loads(message["data"])
+                        except ValueError:
+                            continue
+                        if self.handler:
+                            self.handler(event)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Redis event bus subscription lost: {e}, reconnecting in {delay:.0f}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+def create_event_bus(backend: Optional[str] = None) -> EventBus:
+    """按EVENT_BUS配置创建事件总线（memory或redis）"""
+    backend = (backend or settings.EVENT_BUS).lower()
+    if backend == "redis":
+        return RedisEventBus()
+    if backend != "memory":
+        raise ValueError(f"不支持的事件总线类型: {backend}")
+    return InMemoryEventBus()
@@ -0,0 +1,319 @@
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, Set, Callable
+from sqlalchemy import select, update, func, or_
+
+from app.models.task import Task, TaskStatus, TaskProgress
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.services.progress_store import progress_store
+
+logger = logging.getLogger(__name__)
+
+# 执行中的任务状态（持有租约）
+RUNNING_STATUSES = (TaskStatus.DOWNLOADING.value, TaskStatus.EXTRACTING.value, TaskStatus.PACKAGING.value)
+# 执行节点自行结束的任务状态（租约即将释放，不视为失去租约）
+FINISHED_STATUSES = (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value)
+
+def new_owner_id() -> str:
+    """生成执行节点标识（主机名:进程号:随机后缀）"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def retry_delay(attempts: int) -> float:
+    """第attempts次执行中断后，重新开始前的等待时间（指数退避）"""
+    delay = settings.TASK_RETRY_BACKOFF * (2 ** max(attempts - 1, 0))
+    return min(delay, settings.TASK_RETRY_BACKOFF_MAX)
+
+def retry_due(now: Optional[datetime] = None):
+    """可以开始执行的pending任务条件（未设置重试时间或已到重试时间）"""
+    return or_(Task.retry_at.is_(None), Task.retry_at <= (now or datetime.now()))
+
+def _owner_dead(owner: str) -> bool:
+    """租约持有者是否为本机上已退出的进程（无法判断时返回False，等待租约过期）"""
+    host, _, rest = owner.partition(":")
+    pid, _, _ = rest.partition(":")
+    if host != socket.gethostname() or not pid.isdigit() or os.name != "posix":
+        return False
+    if int(pid) == os.getpid():
+        # 进程号相同而标识不同，说明是重启前的同一进程（容器中常见）
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    return False
+
+class LeaseKeeper:
+    """任务执行租约
+
+    执行节点（API进程内的调度器或独立的worker进程）通过条件更新认领pending任务并获得租约，
+    每隔WORKER_HEARTBEAT_INTERVAL秒为持有的任务续约，同时把其他节点过期未续约的任务重新排队。
+    续约失败（任务已被重新排队或取消）时调用on_lost，由执行节点停止对应任务。
+    """
+
+    def __init__(self, owner: Optional[str] = None, on_lost: Optional[Callable[[str], None]] = None):
+        self.owner = owner or new_owner_id()
+        self.on_lost = on_lost
+        self.held: Set[str] = set()
+        self._heartbeat: Optional[asyncio.Task] = None
+
+    def _expires_at(self) -> datetime:
+        return datetime.now() + timedelta(seconds=settings.WORKER_LEASE_TTL)
+
+    async def start(self):
+        """恢复中断的任务，并启动续约和过期检查"""
+        if self._heartbeat is None:
+            try:
+                await self.recover()
+            except Exception as e:
+                logger.error(f"Failed to recover interrupted tasks: {e}")
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        """停止续约"""
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+
+    async def claim(self, task_id: str) -> bool:
+        """原子地将任务从pending切换为运行状态并获得租约，已被取消或已被认领时返回False"""
+        async with async_session_maker() as db:
+            result = await db.execute(
+                update(Task)
+                .where(Task.task_id == task_id, Task.status == TaskStatus.PENDING.value, retry_due())
+                .values(
+                    status=TaskStatus.DOWNLOADING.value,
+                    started_at=datetime.now(),
+                    current_step="已分配执行槽位",
+                    lease_owner=self.owner,
+                    lease_expires_at=self._expires_at(),
+                    attempts=func.coalesce(Task.attempts, 0) + 1,
+                    retry_at=None
+                )
+            )
+            await db.commit()
+        if result.rowcount != 1:
+            return False
+        self.held.add(task_id)
+        return True
+
+    async def release(self, task_id: str):
+        """任务结束后释放租约"""
+        self.held.discard(task_id)
+        async with async_session_maker() as db:
+            await db.execute(
+                update(Task)
+                .where(Task.task_id == task_id, Task.lease_owner == self.owner)
+                .values(lease_owner=None, lease_expires_at=None)
+            )
+            await db.commit()
+
+    async def renew(self) -> List[str]:
+        """为持有的任务续约，返回已失去租约的任务（已被重新排队、被其他节点认领或被取消）"""
+        if not self.held:
+            return []
+        held = list(self.held)
+        async with async_session_maker() as db:
+            await db.execute(
+                update(Task)
+                .where(Task.task_id.in_(held), Task.lease_owner == self.owner, Task.status.in_(RUNNING_STATUSES))
+                .values(lease_expires_at=self._expires_at())
+            )
+            result = await db.execute(
+                select(Task.task_id)
+                .where(
+                    Task.task_id.in_(held),
+                    Task.lease_owner == self.owner,
+                    Task.status.in_(RUNNING_STATUSES + FINISHED_STATUSES)
+                )
+            )
+            kept = set(result.scalars().all())
+            await db.commit()
+        return [task_id for task_id in held if task_id not in kept and task_id in self.held]
+
+    async def requeue(self, task_ids: List[str], reason: str) -> List[str]:
+        """将本节点主动中止的任务立即重新排队（不计入重试退避），返回重新排队的任务"""
+        if not task_ids:
+            return []
+        for task_id in task_ids:
+            await progress_store.discard(task_id)
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(Task.task_id)
+                .where(Task.task_id.in_(task_ids), Task.status.in_(RUNNING_STATUSES))
+            )
+            requeued = list(result.scalars().all())
+            if requeued:
+                await db.execute(
+                    update(Task)
+                    .where(Task.task_id.in_(requeued), Task.status.in_(RUNNING_STATUSES))
+                    .values(
+                        status=TaskStatus.PENDING.value,
+                        progress=0.0,
+                        current_step=reason,
+                        started_at=None,
+                        retry_at=None,
+                        lease_owner=None,
+                        lease_expires_at=None
+                    )
+                )
+            await db.commit()
+        return requeued
+
+    async def drain(self, tasks: Dict[str, asyncio.Task], grace: Optional[float] = None, websocket_manager=None) -> List[str]:
+        """等待运行中的任务在grace秒内完成，超时的任务终止（连同子进程）后重新排队，返回重新排队的任务
+
+        tasks为执行节点的 task_id -> 执行协程，任务结束时由执行节点自行移除。
+        """
+        grace = settings.SHUTDOWN_GRACE_PERIOD if grace is None else grace
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + grace
+        while tasks:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            await asyncio.wait(set(tasks.values()), timeout=remaining)
+
+        interrupted = dict(tasks)
+        if not interrupted:
+            return []
+
+        logger.warning(f"Stopping {len(interrupted)} tasks still running after {grace:g}s: {list(interrupted)}")
+        for task in interrupted.values():
+            task.cancel()
+        await asyncio.wait(set(interrupted.values()), timeout=settings.CANCEL_GRACE_PERIOD + 5)
+
+        reason = "服务停止，任务重新排队"
+        requeued = await self.requeue(list(interrupted), reason)
+        if websocket_manager:
+            for task_id in requeued:
+                await websocket_manager.send_progress(task_id, TaskProgress(
+                    task_id=task_id,
+                    status=TaskStatus.PENDING.value,
+                    progress=0.0,
+                    current_step=reason,
+                    message=reason,
+                    timestamp=datetime.now()
+                ))
+        return requeued
+
+    async def requeue_expired(self) -> List[str]:
+        """将租约过期的运行中任务重新排队（或达到最大执行次数时标记为失败），返回这些任务"""
+        expired = await self._requeue(Task.lease_expires_at < datetime.now(), "执行节点失联")
+        if expired:
+            logger.warning(f"Requeued {len(expired)} tasks with expired leases: {expired}")
+        return expired
+
+    async def recover(self) -> List[str]:
+        """启动时处理上次运行中断的任务
+
+        没有租约、租约已过期或持有者是本机已退出进程的运行中任务视为孤儿任务，
+        按重试策略重新排队或标记为失败；同时清理已结束任务残留的工作目录
+        （重新排队的任务再次执行时会清空原有工作目录）。
+        """
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(Task.lease_owner)
+                .where(Task.status.in_(RUNNING_STATUSES), Task.lease_owner.is_not(None))
+                .distinct()
+            )
+            dead_owners = [owner for owner in result.scalars().all() if owner != self.owner and _owner_dead(owner)]
+
+        orphaned = await self._requeue(
+            or_(
+                Task.lease_owner.is_(None),
+                Task.lease_expires_at < datetime.now(),
+                Task.lease_owner.in_(dead_owners)
+            ),
+            "服务重启导致执行中断"
+        )
+        if orphaned:
+            logger.warning(f"Recovered {len(orphaned)} interrupted tasks: {orphaned}")
+        await self._cleanup_workspaces()
+        return orphaned
+
+    async def _requeue(self, condition, reason: str) -> List[str]:
+        """将满足条件的运行中任务重新排队，执行次数达到TASK_MAX_ATTEMPTS的任务标记为失败"""
+        now = datetime.now()
+        requeued = []
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(Task.task_id, Task.attempts)
+                .where(Task.status.in_(RUNNING_STATUSES), condition)
+            )
+            for task_id, attempts in result.all():
+                attempts = attempts or 1
+                if attempts >= settings.TASK_MAX_ATTEMPTS:
+                    error_message = f"{reason}，已执行{attempts}次，不再重试"
+                    values = {
+                        "status": TaskStatus.FAILED.value,
+                        "current_step": f"执行失败: {error_message}",
+                        "error_message": error_message,
+                        "completed_at": now
+                    }
+                else:
+                    delay = retry_delay(attempts)
+                    values = {
+                        "status": TaskStatus.PENDING.value,
+                        "progress": 0.0,
+                        "current_step": f"{reason}，{delay:g}秒后重新执行（第{attempts + 1}次）",
+                        "started_at": None,
+                        "retry_at": now + timedelta(seconds=delay)
+                    }
+                updated = await db.execute(
+                    update(Task)
+                    .where(Task.task_id == task_id, Task.status.in_(RUNNING_STATUSES), condition)
+                    .values(attempts=attempts, lease_owner=None, lease_expires_at=None, **values)
+                )
+                if updated.rowcount == 1:
+                    requeued.append(task_id)
+            await db.commit()
+        return requeued
+
+    async def _cleanup_workspaces(self):
+        """删除已结束或已删除任务残留的工作目录"""
+        if not os.path.isdir(settings.WORK_DIR):
+            return
+        names = set(os.listdir(settings.WORK_DIR))
+        if not names:
+            return
+
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(Task.task_id)
+                .where(Task.task_id.in_(names), Task.status.in_(RUNNING_STATUSES + (TaskStatus.PENDING.value,)))
+            )
+            active = set(result.scalars().all())
+
+        stale = [os.path.join(settings.WORK_DIR, name) for name in names - active]
+        stale = [path for path in stale if os.path.isdir(path)]
+        for path in stale:
+            await asyncio.to_thread(shutil.rmtree, path, True)
+        if stale:
+            logger.info(f"Removed {len(stale)} stale task workspaces")
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(settings.WORKER_HEARTBEAT_INTERVAL)
+            try:
+                for task_id in await self.renew():
+                    logger.warning(f"Lost lease of task {task_id}, stopping it")
+                    self.held.discard(task_id)
+                    if self.on_lost:
+                        self.on_lost(task_id)
+                await self.requeue_expired()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Lease heartbeat failed: {e}")
@@ -0,0 +1,518 @@
+import asyncio
+import os
+import platform as platform_module
+import shutil
+import stat
+import sys
+import time
+import zipfile
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict, Any, List, Tuple, Callable, Awaitable
+from urllib.parse import urlparse
+
+from app.core.config import settings
+from app.services.workspace import TaskWorkspace, package_stem, output_filename
+from app.services.resolver import ResolvedDistribution, build_resolve_args, parse_pip_report
+from app.services.wheelhouse import wheelhouse
+from app.services.resolution_cache import resolution_cache
+from app.services.downloader import ResumableDownloader, DownloadError, DownloadProgress
+from app.services.wheel_fetcher import WheelFetcher, FetchError, FetchProgress
+from app.services.processes import process_registry, new_session_kwargs
+from app.services.progress import (
+    PipelineEvent, StageStarted, StageFinished, BytesProgress, WheelProgress, LogLine,
+    STAGE_DOWNLOAD, STAGE_EXTRACT, STAGE_DEPENDENCIES, STAGE_PACKAGE, STAGE_LABELS
+)
+
+# requirements.txt中指向本地wheels目录的离线安装配置
+OFFLINE_REQUIREMENTS_HEADER = "--no-index --find-links=./wheels/"
+
+class PipelineError(Exception):
+    """流水线执行错误"""
+    pass
+
+class StageTimeoutError(PipelineError):
+    """阶段或任务整体执行超时"""
+
+    def __init__(self, stage: Optional[str], limit: float, target: Optional[str] = None, overall: bool = False):
+        self.stage = stage
+        self.limit = limit
+        self.target = target
+        self.overall = overall
+        label = STAGE_LABELS.get(stage, stage) if stage else "准备"
+        if target:
+            label = f"[{target}] {label}"
+        if overall:
+            message = f"任务执行超时（超过{limit:g}秒），超时时处于阶段: {label}"
+        else:
+            message = f"阶段超时: {label}（超过{limit:g}秒）"
+        super().__init__(message)
+
+def stage_timeout(stage: str) -> float:
+    """获取阶段的执行时间上限（秒），0表示不限制"""
+    return {
+        STAGE_DOWNLOAD: settings.STAGE_TIMEOUT_DOWNLOAD,
+        STAGE_EXTRACT: settings.STAGE_TIMEOUT_EXTRACT,
+        STAGE_DEPENDENCIES: settings.STAGE_TIMEOUT_DEPENDENCIES,
+        STAGE_PACKAGE: settings.STAGE_TIMEOUT_PACKAGE
+    }.get(stage, 0)
+
+@dataclass
+class StageMetrics:
+    """阶段执行统计"""
+    name: str
+    duration: float = 0.0
+    bytes: int = 0
+    target: Optional[str] = None  # 多平台任务中对应的目标后缀
+    timed_out: bool = False
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+def market_download_url(author: str, name: str, version: str) -> str:
+    """Dify Marketplace插件下载地址"""
+    base_url = settings.DEFAULT_MARKETPLACE_API_URL.rstrip("/")
+    return f"{base_url}/api/v1/plugins/{author}/{name}/{version}/download"
+
+def github_download_url(repo: str, release: str, asset_name: str) -> str:
+    """Github Release资源下载地址"""
+    github_url = settings.DEFAULT_GITHUB_API_URL.rstrip("/")
+    repo = repo.rstrip("/")
+    if not repo.startswith(github_url):
+        repo = f"{github_url}/{repo}"
+    return f"{repo}/releases/download/{release}/{asset_name}"
+
+def dify_plugin_binary() -> str:
+    """获取当前系统对应的dify-plugin打包工具路径"""
+    os_type = platform_module.system().lower()
+    arch = "arm64" if platform_module.machine().lower() in ("arm64", "aarch64") else "amd64"
+    return os.path.join(settings.DIFY_PLUGIN_BIN_DIR, f"dify-plugin-{os_type}-{arch}-5g")
+
+def extract_package(package_path: str, target_dir: str) -> int:
+    """解压插件包（保留文件权限），返回解压后的总字节数"""
+    total_bytes = 0
+    with zipfile.ZipFile(package_path) as archive:
+        for member in archive.infolist():
+            extracted_path = archive.extract(member, target_dir)
+            mode = (member.external_attr >> 16) & 0o777
+            if mode and not member.is_dir():
+                os.chmod(extracted_path, mode)
+            total_bytes += member.file_size
+    return total_bytes
+
+def rewrite_requirements(plugin_dir: str):
+    """在requirements.txt首行加入离线安装配置"""
+    requirements_path = os.path.join(plugin_dir, "requirements.txt")
+    if not os.path.exists(requirements_path):
+        return
+
+    with open(requirements_path, "r", encoding="utf-8") as f:
+        content = f.read()
+
+    if content.splitlines()[:1] == [OFFLINE_REQUIREMENTS_HEADER]:
+        return
+
+    with open(requirements_path, "w", encoding="utf-8") as f:
+        f.write(f"{OFFLINE_REQUIREMENTS_HEADER}\n{content}")
+
+def fix_ignore_file(plugin_dir: str):
+    """从.difyignore（不存在时为.gitignore）中移除wheels/规则，确保依赖被打包"""
+    ignore_path = os.path.join(plugin_dir, ".difyignore")
+    if not os.path.exists(ignore_path):
+        ignore_path = os.path.join(plugin_dir, ".gitignore")
+    if not os.path.exists(ignore_path):
+        return
+
+    with open(ignore_path, "r", encoding="utf-8") as f:
+        lines = f.readlines()
+
+    kept_lines = [line for line in lines if not line.startswith("wheels/")]
+    if len(kept_lines) != len(lines):
+        with open(ignore_path, "w", encoding="utf-8") as f:
+            f.writelines(kept_lines)
+
+def directory_size(path: str) -> int:
+    """统计目录下文件总大小"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+class RepackagePipeline:
+    """插件重新打包流水线
+
+    在进程内依次完成下载、解压、离线依赖准备（requirements.txt改写、.difyignore修正）和打包，
+    仅依赖解析和最终打包调用外部程序。依赖文件通过共享仓库跨任务复用，每个阶段记录耗时和字节数。
+    指定多个目标平台时，插件包只下载解压一次，再为每个目标分别准备依赖并打包，
+    与平台无关的依赖文件经共享仓库在目标之间复用。
+    执行过程通过on_event回调输出类型化事件（阶段开始/结束、字节进度、依赖下载进度和日志）。
+    """
+
+    def __init__(
+        self,
+        workspace: TaskWorkspace,
+        targets: Optional[List[Dict[str, str]]] = None,
+        on_event: Optional[Callable[[PipelineEvent], Awaitable[None]]] = None
+    ):
+        self.workspace = workspace
+        # 目标平台列表，每项包含platform和suffix（见workspace.build_targets）
+        self.targets = targets or [{"platform": "", "suffix": "offline"}]
+        self.on_event = on_event
+        self.metrics: List[StageMetrics] = []
+        # 多目标时当前目标的序号和目标总数
+        self._target_span = (0, 1)
+        # 正在执行的阶段和目标，整体超时时用于记录超时阶段
+        self._current_stage: Tuple[Optional[str], Optional[str]] = (None, None)
+
+    @staticmethod
+    def stages_for(mode: str) -> List[str]:
+        """获取指定模式会经过的阶段"""
+        stages = [STAGE_EXTRACT, STAGE_DEPENDENCIES, STAGE_PACKAGE]
+        if mode in ("market", "github"):
+            stages.insert(0, STAGE_DOWNLOAD)
+        return stages
+
+    async def run(self, mode: str, parameters: Dict[str, Any]) -> List[Dict[str, str]]:
+        """执行完整流水线，返回每个目标的输出文件信息（platform、suffix、工作目录中的path）
+
+        整体执行时间超过TASK_TIMEOUT时终止（运行中的外部命令连同子进程一起结束），并抛出StageTimeoutError。
+        """
+        timeout = asyncio.timeout(settings.TASK_TIMEOUT or None)
+        try:
+            async with timeout:
+                return await self._run(mode, parameters)
+        except TimeoutError:
+            if not timeout.expired():
+                raise
+            stage, target = self._current_stage
+            for metrics in self.metrics:
+                if metrics.name == stage and metrics.target == target:
+                    metrics.timed_out = True
+            raise StageTimeoutError(stage, settings.TASK_TIMEOUT, target, overall=True) from None
+
+    async def _run(self, mode: str, parameters: Dict[str, Any]) -> List[Dict[str, str]]:
+        stem = package_stem(mode, parameters)
+
+        if mode == "market":
+            url = market_download_url(parameters.get("author"), parameters.get("name"), parameters.get("version"))
+            package_path = await self.download(url, self.workspace.file_path(f"{stem}.difypkg"))
+        elif mode == "github":
+            url = github_download_url(parameters.get("repo"), parameters.get("release"), parameters.get("asset_name"))
+            package_path = await self.download(url, self.workspace.file_path(f"{stem}.difypkg"))
+        elif mode == "local":
+            package_path = os.path.join(settings.UPLOAD_DIR, parameters.get("file_name"))
+            if not os.path.exists(package_path):
+                raise PipelineError(f"文件不存在: {package_path}")
+        else:
+            raise PipelineError(f"不支持的处理模式: {mode}")
+
+        plugin_dir = await self.extract(package_path, self.workspace.file_path(stem))
+
+        # 每个目标使用独立的插件目录副本（最后一个目标直接使用解压目录）
+        target_dirs = []
+        for index, target in enumerate(self.targets):
+            if index == len(self.targets) - 1:
+                target_dirs.append(plugin_dir)
+            else:
+                target_dir = self.workspace.file_path(f"{stem}-{target['suffix']}")
+                await asyncio.to_thread(shutil.copytree, plugin_dir, target_dir, symlinks=True)
+                target_dirs.append(target_dir)
+
+        # 依次为各目标准备依赖，后面的目标可直接复用前面下载的平台无关依赖
+        for index, (target, target_dir) in enumerate(zip(self.targets, target_dirs)):
+            self._target_span = (index, len(self.targets))
+            await self.prepare_dependencies(target_dir, target["platform"] or None, self._target_label(target))
+        self._target_span = (0, 1)
+
+        outputs = []
+        for index, (target, target_dir) in enumerate(zip(self.targets, target_dirs)):
+            self._target_span = (index, len(self.targets))
+            output_path = self.workspace.file_path(output_filename(mode, {**parameters, "suffix": target["suffix"]}))
+            await self.package(target_dir, output_path, self._target_label(target))
+            outputs.append({"platform": target["platform"], "suffix": target["suffix"], "path": output_path})
+        self._target_span = (0, 1)
+        return outputs
+
+    async def download(self, url: str, dest_path: str) -> str:
+        """断点续传下载插件包"""
+        async with self._stage(STAGE_DOWNLOAD) as metrics:
+            await self._log(f"Downloading {url} ...")
+            downloader = ResumableDownloader(on_progress=self._download_progress, on_log=self._log)
+            try:
+                metrics.bytes = await downloader.download(url, dest_path)
+            except DownloadError as e:
+                raise PipelineError(str(e))
+
+            await self._log("Download success.")
+        return dest_path
+
+    async def _download_progress(self, progress: DownloadProgress):
+        await self._emit(BytesProgress(
+            stage=STAGE_DOWNLOAD,
+            done=progress.bytes_done,
+            total=progress.bytes_total,
+            speed=progress.speed
+        ))
+
+    async def extract(self, package_path: str, target_dir: str) -> str:
+        """解压插件包"""
+        async with self._stage(STAGE_EXTRACT) as metrics:
+            await self._log(f"Extracting {os.path.basename(package_path)} ...")
+            try:
+                metrics.bytes = await asyncio.to_thread(extract_package, package_path, target_dir)
+            except zipfile.BadZipFile as e:
+                raise PipelineError(f"解压失败，插件包已损坏: {e}")
+            await self._log("Extract success.")
+        return target_dir
+
+    async def prepare_dependencies(self, plugin_dir: str, platform: Optional[str] = None, target: Optional[str] = None):
+        """下载离线依赖，并改写requirements.txt和忽略文件"""
+        async with self._stage(STAGE_DEPENDENCIES, target) as metrics:
+            wheels_dir = os.path.join(plugin_dir, "wheels")
+            requirements_path = os.path.join(plugin_dir, "requirements.txt")
+
+            if os.path.exists(requirements_path):
+                # 依赖下载与忽略文件修正互不依赖，并行执行
+                await asyncio.gather(
+                    self.download_dependencies(plugin_dir, requirements_path, wheels_dir, platform),
+                    asyncio.to_thread(fix_ignore_file, plugin_dir)
+                )
+                await asyncio.to_thread(rewrite_requirements, plugin_dir)
+                metrics.bytes = await asyncio.to_thread(directory_size, wheels_dir)
+            else:
+                await self._log("requirements.txt not found, skip dependency download.")
+                await asyncio.to_thread(fix_ignore_file, plugin_dir)
+
+    async def download_dependencies(self, plugin_dir: str, requirements_path: str, wheels_dir: str, platform: Optional[str] = None):
+        """准备wheels目录：解析依赖（优先使用解析缓存）后从共享仓库链接已有文件，仅并发下载缺失的文件"""
+        if settings.DEPENDENCY_DOWNLOADER == "pip":
+            await self.pip_download(plugin_dir, requirements_path, wheels_dir, platform)
+            return
+
+        cache_key = await asyncio.to_thread(self._resolution_cache_key, requirements_path, platform)
+        distributions = await resolution_cache.lookup(cache_key)
+        if distributions is not None:
+            await self._log(f"Resolved {len(distributions)} distributions from resolution cache.")
+            try:
+                await self.link_distributions(distributions, wheels_dir)
+                return
+            except PipelineError as e:
+                # 缓存的下载地址可能已失效，清除条目后重新解析
+                await self._log(f"Cached resolution failed, resolving again: {e}")
+                await resolution_cache.invalidate(cache_key)
+
+        distributions = await self.resolve_dependencies(plugin_dir, requirements_path, platform)
+        if distributions is None:
+            # 存在无法直接下载的依赖，退回pip download
+            await self._log("Fallback to pip download.")
+            await self.pip_download(plugin_dir, requirements_path, wheels_dir, platform)
+            return
+
+        await resolution_cache.store(cache_key, distributions, platform, self.python_version)
+        await self.link_distributions(distributions, wheels_dir)
+
+    async def link_distributions(self, distributions: List[ResolvedDistribution], wheels_dir: str):
+        """从共享仓库链接已有的依赖文件，并发下载缺失的文件"""
+        os.makedirs(wheels_dir, exist_ok=True)
+        missing = []
+        for distribution in distributions:
+            store_path = wheelhouse.lookup(distribution.filename, distribution.sha256)
+            if store_path:
+                await asyncio.to_thread(wheelhouse.link_into, store_path, wheels_dir, distribution.filename)
+            else:
+                missing.append(distribution)
+
+        await self._log(
+            f"Resolved {len(distributions)} distributions, "
+            f"{len(distributions) - len(missing)} from wheelhouse, {len(missing)} to download."
+        )
+
+        if missing:
+            await self.fetch_distributions(missing, wheels_dir)
+            await asyncio.to_thread(wheelhouse.evict)
+
+    async def resolve_dependencies(self, plugin_dir: str, requirements_path: str, platform: Optional[str] = None) -> Optional[List[ResolvedDistribution]]:
+        """使用pip解析依赖（不下载安装），得到精确的文件列表和哈希"""
+        mirror_url = settings.DEFAULT_PIP_MIRROR_URL
+        report_path = self.workspace.file_path("pip-report.json")
+        args = build_resolve_args(
+            sys.executable,
+            requirements_path,
+            report_path,
+            self.workspace.file_path("pip-target"),
+            mirror_url,
+            urlparse(mirror_url).hostname or "",
+            platform,
+            settings.PIP_PYTHON_VERSION or None
+        )
+        await self._log("Resolving dependencies ...")
+        await self._run_command(args, cwd=plugin_dir, error_message="Pip resolve failed")
+        return await asyncio.to_thread(parse_pip_report, report_path)
+
+    async def fetch_distributions(self, distributions: List[ResolvedDistribution], wheels_dir: str):
+        """并发下载依赖文件，校验后加入共享仓库并链接到wheels目录"""
+        download_dir = self.workspace.file_path("wheel-downloads")
+        fetcher = WheelFetcher(on_progress=self._fetch_progress, on_log=self._log)
+        try:
+            fetched = await fetcher.fetch_all(distributions, download_dir)
+        except* FetchError as group:
+            raise PipelineError(f"依赖下载失败: {group.exceptions[0]}")
+        except* OSError as group:
+            raise PipelineError(f"依赖下载失败: {group.exceptions[0]}")
+
+        for distribution in distributions:
+            tmp_path = fetched[distribution.filename]
+            try:
+                store_path = await asyncio.to_thread(
+                    wheelhouse.add, tmp_path, distribution.filename, distribution.sha256, bool(distribution.sha256)
+                )
+                await asyncio.to_thread(wheelhouse.link_into, store_path, wheels_dir, distribution.filename)
+            except ValueError as e:
+                raise PipelineError(str(e))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    async def _fetch_progress(self, progress: FetchProgress):
+        index, count = self._target_span
+        await self._emit(WheelProgress(
+            done=progress.files_done,
+            total=progress.files_total,
+            bytes_done=progress.bytes_done,
+            bytes_total=progress.bytes_total,
+            target=self.targets[index]["suffix"] if count > 1 else None,
+            index=index,
+            count=count
+        ))
+
+    async def pip_download(self, plugin_dir: str, requirements_path: str, wheels_dir: str, platform: Optional[str] = None):
+        """使用pip下载依赖到wheels目录"""
+        mirror_url = settings.DEFAULT_PIP_MIRROR_URL
+        args = [sys.executable, "-m", "pip", "download"]
+        if platform:
+            args.extend(["--platform", platform])
+        if settings.PIP_PYTHON_VERSION:
+            args.extend(["--python-version", settings.PIP_PYTHON_VERSION])
+        if platform or settings.PIP_PYTHON_VERSION:
+            args.append("--only-binary=:all:")
+        args.extend([
+            "-r", requirements_path,
+            "-d", wheels_dir,
+            "--index-url", mirror_url,
+            "--trusted-host", urlparse(mirror_url).hostname or ""
+        ])
+        await self._run_command(args, cwd=plugin_dir, error_message="Pip download failed")
+
+    @property
+    def python_version(self) -> str:
+        """依赖解析的目标Python版本"""
+        return settings.PIP_PYTHON_VERSION or f"{sys.version_info.major}.{sys.version_info.minor}"
+
+    def _resolution_cache_key(self, requirements_path: str, platform: Optional[str]) -> Optional[str]:
+        with open(requirements_path, "r", encoding="utf-8") as f:
+            content = f.read()
+        return resolution_cache.build_key(content, platform, self.python_version, settings.DEFAULT_PIP_MIRROR_URL)
+
+    def _target_label(self, target: Dict[str, str]) -> Optional[str]:
+        """多目标任务中用于日志和统计的目标标识"""
+        return target["suffix"] if len(self.targets) > 1 else None
+
+    async def package(self, plugin_dir: str, output_path: str, target: Optional[str] = None):
+        """调用dify-plugin工具生成离线插件包"""
+        async with self._stage(STAGE_PACKAGE, target) as metrics:
+            binary = dify_plugin_binary()
+            if not os.path.exists(binary):
+                raise PipelineError(f"未找到打包工具: {binary}")
+
+            if not os.access(binary, os.X_OK):
+                try:
+                    os.chmod(binary, os.stat(binary).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+                except OSError:
+                    pass
+
+            await self._log(f"Repackaging {os.path.basename(output_path)} ...")
+            await self._run_command(
+                [binary, "plugin", "package", plugin_dir, "-o", output_path],
+                cwd=self.workspace.path,
+                error_message="Package failed"
+            )
+            if not os.path.exists(output_path):
+                raise PipelineError(f"未生成输出文件: {os.path.basename(output_path)}")
+
+            metrics.bytes = os.path.getsize(output_path)
+            await self._log("Repackage success.")
+
+    async def _run_command(self, args: List[str], cwd: str, error_message: str):
+        """执行外部命令并逐行转发输出（任务被取消时终止整个进程组）"""
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            **new_session_kwargs()
+        )
+        process_registry.register(self.workspace.task_id, process)
+
+        try:
+            while True:
+                line_bytes = await process.stdout.readline()
+                if not line_bytes:
+                    break
+                line = line_bytes.decode("utf-8", errors="ignore").rstrip()
+                if line:
+                    await self._log(line)
+
+            returncode = await process.wait()
+        finally:
+            process_registry.unregister(self.workspace.task_id, process)
+            if process.returncode is None:
+                await asyncio.shield(process_registry.terminate(process))
+
+        if returncode != 0:
+            raise PipelineError(f"{error_message}，返回码: {returncode}")
+
+    @asynccontextmanager
+    async def _stage(self, name: str, target: Optional[str] = None):
+        """输出阶段开始/结束事件，并记录阶段耗时和字节数"""
+        index, count = self._target_span
+        await self._emit(StageStarted(stage=name, target=target, index=index, count=count))
+
+        metrics = StageMetrics(name=name, target=target)
+        self._current_stage = (name, target)
+        limit = stage_timeout(name)
+        timeout = asyncio.timeout(limit or None)
+        started = time.monotonic()
+        interrupted = False
+        try:
+            async with timeout:
+                yield metrics
+        except TimeoutError:
+            if not timeout.expired():
+                raise
+            metrics.timed_out = True
+            raise StageTimeoutError(name, limit, target) from None
+        except asyncio.CancelledError:
+            # 被整体超时中断时保留当前阶段，由run()记录超时阶段
+            interrupted = True
+            raise
+        finally:
+            if not interrupted:
+                self._current_stage = (None, None)
+            metrics.duration = round(time.monotonic() - started, 3)
+            self.metrics.append(metrics)
+            label = f"{name}[{target}]" if target else name
+            await self._log(f"[stage] {label}: {metrics.duration:.2f}s, {metrics.bytes} bytes")
+
+        # 阶段失败时不输出结束事件
+        await self._emit(StageFinished(
+            stage=name, duration=metrics.duration, bytes=metrics.bytes,
+            target=target, index=index, count=count
+        ))
+
+    async def _log(self, line: str):
+        await self._emit(LogLine(line=line))
+
+    async def _emit(self, event: PipelineEvent):
+        if self.on_event:
+            await self.on_event(event)
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+import os
+import signal
+from typing import Dict, Set, Any
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+def new_session_kwargs() -> Dict[str, Any]:
+    """子进程在新的会话（进程组）中启动，终止时可以连同其子进程一起结束"""
+    if os.name == "posix":
+        return {"start_new_session": True}
+    return {}
+
+def _signal_group(process: asyncio.subprocess.Process, sig: int):
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, sig)
+        elif sig == signal.SIGTERM:
+            process.terminate()
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+class ProcessRegistry:
+    """任务子进程登记表
+
+    流水线启动的外部命令（pip、dify-plugin等）按任务登记，取消或超时时先向整个进程组发送SIGTERM，
+    超过CANCEL_GRACE_PERIOD仍未退出再发送SIGKILL。
+    """
+
+    def __init__(self):
+        self._processes: Dict[str, Set[asyncio.subprocess.Process]] = {}
+
+    def register(self, task_id: str, process: asyncio.subprocess.Process):
+        """登记任务的子进程"""
+        self._processes.setdefault(task_id, set()).add(process)
+
+    def unregister(self, task_id: str, process: asyncio.subprocess.Process):
+        """移除已结束的子进程"""
+        processes = self._processes.get(task_id)
+        if processes is None:
+            return
+        processes.discard(process)
+        if not processes:
+            del self._processes[task_id]
+
+    async def terminate(self, process: asyncio.subprocess.Process, grace: float = None):
+        """终止子进程及其进程组"""
+        if process.returncode is not None:
+            return
+        grace = settings.CANCEL_GRACE_PERIOD if grace is None else grace
+
+        _signal_group(process, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), timeout=grace)
+        except asyncio.TimeoutError:
+            logger.warning(f"Process {process.pid} did not exit after SIGTERM, killing it")
+            _signal_group(process, signal.SIGKILL)
+            await process.wait()
+
+        # 进程组中可能仍有脱离父进程的子进程
+        if os.name == "posix":
+            _signal_group(process, signal.SIGKILL)
+
+# 全局子进程登记表
+process_registry = ProcessRegistry()
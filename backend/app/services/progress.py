@@ -0,0 +1,167 @@
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict, Any, List
+
+from app.models.task import TaskStatus
+
+# 流水线阶段
+STAGE_DOWNLOAD = "download"
+STAGE_EXTRACT = "extract"
+STAGE_DEPENDENCIES = "dependencies"
+STAGE_PACKAGE = "package"
+
+# 各阶段在总进度中的权重（按实际耗时占比估计，只计算任务实际包含的阶段）
+STAGE_WEIGHTS = {
+    STAGE_DOWNLOAD: 0.15,
+    STAGE_EXTRACT: 0.05,
+    STAGE_DEPENDENCIES: 0.6,
+    STAGE_PACKAGE: 0.2
+}
+
+# 各阶段对应的任务状态
+STAGE_STATUS = {
+    STAGE_DOWNLOAD: TaskStatus.DOWNLOADING,
+    STAGE_EXTRACT: TaskStatus.EXTRACTING,
+    STAGE_DEPENDENCIES: TaskStatus.PACKAGING,
+    STAGE_PACKAGE: TaskStatus.PACKAGING
+}
+
+# 各阶段的步骤描述
+STAGE_LABELS = {
+    STAGE_DOWNLOAD: "下载插件包",
+    STAGE_EXTRACT: "解压插件包",
+    STAGE_DEPENDENCIES: "下载离线依赖",
+    STAGE_PACKAGE: "生成离线插件包"
+}
+
+@dataclass
+class PipelineEvent:
+    """流水线事件基类
+
+    index/count表示多平台任务中当前目标的序号和目标总数，单目标任务为0/1。
+    """
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.__class__.__name__, **asdict(self)}
+
+@dataclass
+class StageStarted(PipelineEvent):
+    """阶段开始"""
+    stage: str
+    target: Optional[str] = None
+    index: int = 0
+    count: int = 1
+
+@dataclass
+class StageFinished(PipelineEvent):
+    """阶段结束"""
+    stage: str
+    duration: float
+    bytes: int
+    target: Optional[str] = None
+    index: int = 0
+    count: int = 1
+
+@dataclass
+class BytesProgress(PipelineEvent):
+    """阶段内的字节进度（total未知时为None）"""
+    stage: str
+    done: int
+    total: Optional[int] = None
+    speed: float = 0.0  # 字节/秒
+    target: Optional[str] = None
+    index: int = 0
+    count: int = 1
+
+@dataclass
+class WheelProgress(PipelineEvent):
+    """依赖文件下载进度（第n个/共m个）"""
+    done: int
+    total: int
+    bytes_done: int
+    bytes_total: int
+    target: Optional[str] = None
+    index: int = 0
+    count: int = 1
+
+@dataclass
+class LogLine(PipelineEvent):
+    """日志输出（仅用于展示，不参与进度计算）"""
+    line: str
+
+@dataclass
+class ProgressUpdate:
+    """由事件计算出的任务进度"""
+    status: TaskStatus
+    progress: float
+    current_step: str
+
+def _format_mb(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f}MB"
+
+class ProgressTracker:
+    """根据流水线事件计算任务进度
+
+    各阶段按权重划分[start, end)区间，阶段内进度来自字节数或文件数，
+    多平台任务再按目标序号细分。进度只增不减，与上次相同的结果不重复汇报。
+    """
+
+    def __init__(self, stages: List[str], start: float = 0.1, end: float = 0.99):
+        total_weight = sum(STAGE_WEIGHTS[stage] for stage in stages) or 1.0
+        self.ranges: Dict[str, tuple] = {}
+        offset = start
+        for stage in stages:
+            span = (end - start) * STAGE_WEIGHTS[stage] / total_weight
+            self.ranges[stage] = (offset, offset + span)
+            offset += span
+        self.progress = start
+        self._last: Optional[ProgressUpdate] = None
+
+    def update(self, event: PipelineEvent) -> Optional[ProgressUpdate]:
+        """处理一个事件，需要更新任务进度时返回ProgressUpdate"""
+        if isinstance(event, StageStarted):
+            return self._advance(event.stage, event.index, event.count, 0.0, self._step(event.stage, event.target))
+
+        if isinstance(event, StageFinished):
+            return self._advance(event.stage, event.index, event.count, 1.0, self._step(event.stage, event.target))
+
+        if isinstance(event, BytesProgress):
+            fraction = min(event.done / event.total, 1.0) if event.total else 0.0
+            detail = _format_mb(event.done)
+            if event.total:
+                detail = f"{detail}/{_format_mb(event.total)}"
+            if event.speed:
+                detail += f" {_format_mb(event.speed)}/s"
+                if event.total:
+                    detail += f" 剩余{int(max(event.total - event.done, 0) / event.speed)}秒"
+            return self._advance(event.stage, event.index, event.count, fraction, self._step(event.stage, event.target, detail))
+
+        if isinstance(event, WheelProgress):
+            if event.bytes_total:
+                fraction = min(event.bytes_done / event.bytes_total, 1.0)
+            else:
+                fraction = event.done / event.total if event.total else 1.0
+            detail = f"{event.done}/{event.total} ({_format_mb(event.bytes_done)})"
+            return self._advance(STAGE_DEPENDENCIES, event.index, event.count, fraction, self._step(STAGE_DEPENDENCIES, event.target, detail))
+
+        return None
+
+    def _advance(self, stage: str, index: int, count: int, fraction: float, current_step: str) -> Optional[ProgressUpdate]:
+        if stage not in self.ranges:
+            return None
+        low, high = self.ranges[stage]
+        progress = low + (high - low) * (index + fraction) / max(count, 1)
+        self.progress = max(self.progress, round(progress, 3))
+        update = ProgressUpdate(status=STAGE_STATUS[stage], progress=self.progress, current_step=current_step)
+        if update == self._last:
+            # 与上次相同的进度不再重复汇报
+            return None
+        self._last = update
+        return update
+
+    def _step(self, stage: str, target: Optional[str] = None, detail: Optional[str] = None) -> str:
+        step = STAGE_LABELS[stage]
+        if target:
+            step = f"[{target}] {step}"
+        if detail:
+            step = f"{step} {detail}"
+        return step
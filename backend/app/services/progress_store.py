@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from typing import Optional, Dict, Any
+from sqlalchemy import update
+
+from app.models.task import Task, TaskStatus
+from app.core.config import settings
+from app.core.database import async_session_maker
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value)
+
+class ProgressStore:
+    """任务进度的写回缓存
+
+    进度更新先合并到内存中，每隔PROGRESS_FLUSH_INTERVAL秒把所有任务的变更放在一个事务里写入数据库；
+    任务状态发生变化（如开始打包、完成、失败）时立即写入。WebSocket推送不经过这里，始终实时发送。
+    未启动时（如脚本中直接调用）退化为逐次写入。
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._statuses: Dict[str, str] = {}
+        # _lock只保护内存中的待写变更；_write_lock使多次写入按顺序提交，写库期间不阻塞update()
+        self._lock = asyncio.Lock()
+        self._write_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.updates = 0
+
+    @property
+    def started(self) -> bool:
+        return self._flusher is not None
+
+    async def start(self):
+        """启动定时写入"""
+        if self.started:
+            return
+        self._flusher = asyncio.create_task(self._flush_loop())
+        logger.info(f"Progress store started (flush interval {settings.PROGRESS_FLUSH_INTERVAL}s)")
+
+    async def stop(self):
+        """停止定时写入并写入剩余变更"""
+        if self._flusher:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        await self.flush()
+
+    async def update(self, task_id: str, values: Dict[str, Any]):
+        """记录任务的字段变更，状态变化时立即写入"""
+        self.updates += 1
+        async with self._lock:
+            self._pending.setdefault(task_id, {}).update(values)
+
+            status = values.get("status")
+            transition = status is not None and self._statuses.get(task_id) != status
+            if status is not None:
+                self._statuses[task_id] = status
+
+        if transition or not self.started:
+            await self.flush()
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """获取尚未写入数据库的变更"""
+        pending = self._pending.get(task_id)
+        return dict(pending) if pending else None
+
+    async def discard(self, task_id: str):
+        """丢弃任务尚未写入的变更（如任务被取消）"""
+        async with self._lock:
+            self._pending.pop(task_id, None)
+            self._statuses.pop(task_id, None)
+
+    async def flush(self):
+        """在一个事务中写入所有任务的待写变更"""
+        async with self._write_lock:
+            async with self._lock:
+                if not self._pending:
+                    return
+                pending = self._pending
+                self._pending = {}
+
+            try:
+                async with async_session_maker() as db:
+                    for task_id, values in pending.items():
+                        # 已取消的任务不再被执行节点残留的进度覆盖
+                        await db.execute(
+                            update(Task)
+                            .where(Task.task_id == task_id, Task.status != TaskStatus.CANCELLED.value)
+                            .values(**values)
+                        )
+                    await db.commit()
+                self.flushes += 1
+            except Exception as e:
+                logger.error(f"Failed to flush task progress: {e}")
+                # 写入失败时保留变更，等待下次重试（不覆盖期间产生的新值）
+                async with self._lock:
+                    for task_id, values in pending.items():
+                        self._pending[task_id] = {**values, **self._pending.get(task_id, {})}
+                return
+
+            # 已结束（完成、失败或取消）的任务不再需要记录状态
+            async with self._lock:
+                for task_id, values in pending.items():
+                    if values.get("status") in FINISHED_STATUSES and self._statuses.get(task_id) == values["status"]:
+                        self._statuses.pop(task_id, None)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(settings.PROGRESS_FLUSH_INTERVAL)
+            await self.flush()
+
+# 全局进度写回缓存
+progress_store = ProgressStore()
@@ -0,0 +1,129 @@
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Optional, List
+from sqlalchemy import select, delete, func
+
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.models.cache import ResolutionCacheEntry, ResolutionCacheStats
+from app.services.resolver import ResolvedDistribution, normalize_requirements
+
+logger = logging.getLogger(__name__)
+
+class ResolutionCache:
+    """依赖解析结果缓存
+
+    以规范化后的requirements.txt内容、目标平台、目标Python版本和镜像地址作为键，
+    缓存pip解析得到的精确依赖文件列表（文件名、下载地址和sha256），命中时跳过解析。
+    条目超过RESOLUTION_CACHE_TTL后失效，也可以通过接口手动清除。
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def build_key(self, requirements_content: str, platform: Optional[str], python_version: Optional[str], index_url: str) -> Optional[str]:
+        """生成缓存键，requirements引用外部文件时返回None"""
+        requirements = normalize_requirements(requirements_content)
+        if requirements is None:
+            return None
+
+        payload = {
+            "requirements": requirements,
+            "platform": (platform or "").strip(),
+            "python_version": (python_version or "").strip(),
+            "index_url": index_url.rstrip("/")
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+    async def lookup(self, cache_key: Optional[str]) -> Optional[List[ResolvedDistribution]]:
+        """查找解析结果，过期条目视为未命中并被删除"""
+        if not settings.RESOLUTION_CACHE_ENABLED or not cache_key:
+            return None
+
+        try:
+            async with async_session_maker() as db:
+                result = await db.execute(
+                    select(ResolutionCacheEntry).where(ResolutionCacheEntry.cache_key == cache_key)
+                )
+                entry = result.scalar_one_or_none()
+
+                if entry and self._is_expired(entry):
+                    await db.delete(entry)
+                    await db.commit()
+                    entry = None
+
+                if not entry:
+                    self.misses += 1
+                    return None
+
+                distributions = [ResolvedDistribution(**item) for item in json.loads(entry.distributions)]
+                entry.hit_count = (entry.hit_count or 0) + 1
+                entry.last_used_at = datetime.now()
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Failed to read resolution cache {cache_key}: {e}")
+            return None
+
+        self.hits += 1
+        return distributions
+
+    async def store(
+        self,
+        cache_key: Optional[str],
+        distributions: List[ResolvedDistribution],
+        platform: Optional[str] = None,
+        python_version: Optional[str] = None
+    ):
+        """保存解析结果"""
+        if not settings.RESOLUTION_CACHE_ENABLED or not cache_key:
+            return
+
+        try:
+            async with async_session_maker() as db:
+                await db.execute(delete(ResolutionCacheEntry).where(ResolutionCacheEntry.cache_key == cache_key))
+                now = datetime.now()
+                db.add(ResolutionCacheEntry(
+                    cache_key=cache_key,
+                    platform=platform,
+                    python_version=python_version,
+                    distributions=json.dumps([item.to_dict() for item in distributions]),
+                    hit_count=0,
+                    created_at=now,
+                    last_used_at=now
+                ))
+                await db.commit()
+        except Exception as e:
+            logger.warning(f"Failed to store resolution cache {cache_key}: {e}")
+
+    async def invalidate(self, cache_key: Optional[str] = None) -> int:
+        """删除指定条目（cache_key为空时清空全部），返回删除的条目数"""
+        async with async_session_maker() as db:
+            statement = delete(ResolutionCacheEntry)
+            if cache_key:
+                statement = statement.where(ResolutionCacheEntry.cache_key == cache_key)
+            result = await db.execute(statement)
+            await db.commit()
+            return result.rowcount or 0
+
+    async def stats(self) -> ResolutionCacheStats:
+        """获取缓存统计"""
+        async with async_session_maker() as db:
+            result = await db.execute(select(func.count(ResolutionCacheEntry.id)))
+            entries = result.scalar_one()
+        return ResolutionCacheStats(
+            enabled=settings.RESOLUTION_CACHE_ENABLED,
+            hits=self.hits,
+            misses=self.misses,
+            entries=entries,
+            ttl=settings.RESOLUTION_CACHE_TTL
+        )
+
+    def _is_expired(self, entry: ResolutionCacheEntry) -> bool:
+        created_at = entry.created_at.replace(tzinfo=None)
+        return datetime.now() - created_at > timedelta(seconds=settings.RESOLUTION_CACHE_TTL)
+
+# 全局依赖解析缓存
+resolution_cache = ResolutionCache()
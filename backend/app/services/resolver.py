@@ -0,0 +1,92 @@
+import json
+import os
+import re
+from dataclasses import dataclass, asdict
+from typing import Optional, List, Dict, Any
+from urllib.parse import urlparse, unquote
+
+@dataclass
+class ResolvedDistribution:
+    """解析得到的单个依赖分发文件"""
+    name: str
+    version: str
+    filename: str
+    url: str
+    sha256: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+# 引用其他文件或本地路径的requirements行，其解析结果不只取决于requirements.txt本身
+_EXTERNAL_REQUIREMENT_PREFIXES = ("-r", "--requirement", "-c", "--constraint", "-e", "--editable", ".", "/", "file:")
+
+def normalize_requirements(content: str) -> Optional[str]:
+    """规范化requirements.txt内容（去掉注释、空行和多余空白并排序），引用外部文件时返回None"""
+    lines = []
+    for raw_line in content.splitlines():
+        line = re.sub(r"(^|\s)#.*$", "", raw_line).strip()
+        if not line:
+            continue
+        if line.startswith(_EXTERNAL_REQUIREMENT_PREFIXES) or "@ file:" in line:
+            return None
+        lines.append(re.sub(r"\s+", " ", line))
+    return "\n".join(sorted(lines))
+
+def build_resolve_args(
+    python: str,
+    requirements_path: str,
+    report_path: str,
+    target_dir: str,
+    index_url: str,
+    trusted_host: str,
+    platform: Optional[str] = None,
+    python_version: Optional[str] = None
+) -> List[str]:
+    """构建只解析不安装的pip命令（pip install --dry-run --report）"""
+    args = [
+        python, "-m", "pip", "install",
+        "--dry-run", "--ignore-installed", "--quiet",
+        "--report", report_path,
+        # 指定platform时pip要求提供--target，dry-run不会写入该目录
+        "--target", target_dir
+    ]
+    if platform:
+        args.extend(["--platform", platform])
+    if python_version:
+        args.extend(["--python-version", python_version])
+    if platform or python_version:
+        # 指定目标环境时只能使用二进制包
+        args.append("--only-binary=:all:")
+    args.extend([
+        "-r", requirements_path,
+        "--index-url", index_url,
+        "--trusted-host", trusted_host
+    ])
+    return args
+
+def parse_pip_report(report_path: str) -> Optional[List[ResolvedDistribution]]:
+    """解析pip安装报告，存在无法直接下载的依赖（如VCS、本地目录）时返回None"""
+    with open(report_path, "r", encoding="utf-8") as f:
+        report = json.load(f)
+
+    distributions = []
+    for item in report.get("install", []):
+        download_info = item.get("download_info") or {}
+        archive_info = download_info.get("archive_info")
+        url = download_info.get("url")
+        if archive_info is None or not url:
+            return None
+
+        sha256 = (archive_info.get("hashes") or {}).get("sha256")
+        if not sha256 and (archive_info.get("hash") or "").startswith("sha256="):
+            sha256 = archive_info["hash"][len("sha256="):]
+
+        metadata = item.get("metadata") or {}
+        distributions.append(ResolvedDistribution(
+            name=metadata.get("name", ""),
+            version=metadata.get("version", ""),
+            filename=unquote(os.path.basename(urlparse(url).path)),
+            url=url,
+            sha256=sha256
+        ))
+    return distributions
@@ -0,0 +1,392 @@
+import asyncio
+import heapq
+import logging
+from datetime import datetime
+from typing import Optional, Dict, List, Set, Tuple
+from sqlalchemy import select, update
+
+from app.models.task import Task, TaskStatus
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.services.leases import LeaseKeeper, retry_due
+
+logger = logging.getLogger(__name__)
+
+class TaskScheduler:
+    """任务调度器
+
+    以tasks表中的pending记录作为持久化队列，按优先级（数值大者优先）和创建顺序出队，
+    由固定数量的工作协程执行，保证同时运行的任务数不超过MAX_CONCURRENT_TASKS。
+    结果缓存键相同的任务只执行一次：后到的任务作为跟随者挂在正在排队或运行的领队任务上，
+    共享其WebSocket进度和最终结果。
+    认领任务时获得执行租约并定期续约，可以与独立的worker进程共用同一个队列；
+    其他节点失联或服务重启而中断的任务按退避时间重新排队，到期后由定期轮询加入本地队列。
+    """
+
+    def __init__(self, max_workers: Optional[int] = None):
+        self.max_workers = max_workers or settings.MAX_CONCURRENT_TASKS
+        # 堆元素: (-priority, id, task_id)，被移除的任务采用惰性删除
+        self._heap: List[Tuple[int, int, str]] = []
+        self._queued: Set[str] = set()
+        self._running: Set[str] = set()
+        # 单飞合并：cache_key -> 领队任务，领队任务 -> 跟随者列表
+        self._leaders: Dict[str, str] = {}
+        self._leader_keys: Dict[str, str] = {}
+        self._followers: Dict[str, List[str]] = {}
+        self._follower_meta: Dict[str, Tuple[int, int]] = {}
+        self._condition: Optional[asyncio.Condition] = None
+        self._workers: List[asyncio.Task] = []
+        self._websocket_manager = None
+        # 执行中任务的协程，失去租约时取消
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self.leases = LeaseKeeper(on_lost=self._on_lease_lost)
+        self._poller: Optional[asyncio.Task] = None
+        # 排空模式：不再开始新任务，新建任务保留在数据库队列中由其他节点或重启后执行
+        self.draining = False
+
+    @property
+    def started(self) -> bool:
+        return bool(self._workers)
+
+    def start_draining(self):
+        """进入排空模式"""
+        if not self.draining:
+            logger.info(f"Task scheduler draining, {len(self._running)} tasks running, {len(self._queued)} tasks queued")
+        self.draining = True
+
+    async def drain(self, grace: Optional[float] = None) -> List[str]:
+        """进入排空模式并等待运行中的任务完成，超过grace秒仍在运行的任务终止后重新排队
+
+        未开始的任务始终以pending状态保存在数据库中，无需额外持久化。
+        """
+        self.start_draining()
+        if not self.started:
+            return []
+        requeued = await self.leases.drain(self._tasks, grace, self._websocket_manager)
+        # 等待工作协程完成收尾（释放租约、同步跟随者）后再停止
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.CANCEL_GRACE_PERIOD + 5
+        while self._running and loop.time() < deadline:
+            await asyncio.sleep(0.1)
+        if requeued:
+            logger.info(f"Requeued {len(requeued)} interrupted tasks: {requeued}")
+        return requeued
+
+    async def start(self, websocket_manager):
+        """启动工作池，并从数据库恢复待处理队列"""
+        if self.started:
+            return
+
+        self._websocket_manager = websocket_manager
+        self._condition = asyncio.Condition()
+        # 先恢复上次运行中断的任务，使重新排队的任务一并加载
+        await self.leases.start()
+        await self._load_pending()
+
+        self._workers = [
+            asyncio.create_task(self._worker(index))
+            for index in range(self.max_workers)
+        ]
+        self._poller = asyncio.create_task(self._poll_loop())
+        logger.info(f"Task scheduler started with {self.max_workers} workers, {len(self._queued)} pending tasks")
+
+    async def stop(self):
+        """停止工作池"""
+        if self._poller:
+            self._poller.cancel()
+            self._poller = None
+        await self.leases.stop()
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        logger.info("Task scheduler stopped")
+
+    async def submit(self, task_id: str, priority: int = 0, row_id: int = 0, cache_key: Optional[str] = None) -> Optional[str]:
+        """将任务加入队列，存在相同的进行中任务时挂为跟随者并返回领队任务ID"""
+        if not self.started or self.draining:
+            # 调度器未启动或正在排空时任务保持pending状态，由其他节点或启动后从数据库恢复
+            return None
+
+        async with self._condition:
+            leader_id = self._enqueue(task_id, priority, row_id, cache_key)
+            if not leader_id:
+                self._condition.notify()
+            return leader_id
+
+    async def submit_many(self, tasks: List[Tuple[str, int, int, Optional[str]]]) -> Dict[str, str]:
+        """批量加入队列（task_id, priority, row_id, cache_key），返回 跟随者任务ID -> 领队任务ID"""
+        if not self.started or self.draining:
+            return {}
+
+        leaders = {}
+        async with self._condition:
+            for task_id, priority, row_id, cache_key in tasks:
+                leader_id = self._enqueue(task_id, priority, row_id, cache_key)
+                if leader_id:
+                    leaders[task_id] = leader_id
+            self._condition.notify_all()
+        return leaders
+
+    async def remove(self, task_id: str) -> bool:
+        """从队列中移除尚未开始的任务（包括跟随者）"""
+        if not self.started:
+            return False
+
+        async with self._condition:
+            for leader_id, followers in self._followers.items():
+                if task_id in followers:
+                    followers.remove(task_id)
+                    self._follower_meta.pop(task_id, None)
+                    self._websocket_manager.remove_follower(leader_id, task_id)
+                    return True
+
+            if task_id in self._queued:
+                self._queued.discard(task_id)
+                cache_key = self._release_leader(task_id)
+                new_leader = self._promote_followers(task_id, cache_key)
+                if new_leader:
+                    await self._reassign_followers(new_leader)
+                    self._condition.notify()
+                return True
+        return False
+
+    def queue_position(self, task_id: str) -> Optional[int]:
+        """获取任务的排队位置（从1开始），不在队列中返回None"""
+        if task_id not in self._queued:
+            return None
+
+        entries = sorted(entry for entry in self._heap if entry[2] in self._queued)
+        for position, entry in enumerate(entries, start=1):
+            if entry[2] == task_id:
+                return position
+        return None
+
+    def queue_depth(self) -> int:
+        """获取当前排队任务数"""
+        return len(self._queued)
+
+    def running_count(self) -> int:
+        """获取当前运行中的任务数"""
+        return len(self._running)
+
+    def _push(self, task_id: str, priority: int, row_id: int):
+        if task_id in self._queued or task_id in self._running:
+            return
+        heapq.heappush(self._heap, (-(priority or 0), row_id or 0, task_id))
+        self._queued.add(task_id)
+
+    def _enqueue(self, task_id: str, priority: int, row_id: int, cache_key: Optional[str]) -> Optional[str]:
+        """入队或挂为跟随者，返回领队任务ID（未合并时返回None）"""
+        leader_id = self._leaders.get(cache_key) if cache_key else None
+        if leader_id and leader_id != task_id:
+            followers = self._followers.setdefault(leader_id, [])
+            if task_id not in followers:
+                followers.append(task_id)
+                self._follower_meta[task_id] = (priority or 0, row_id or 0)
+                self._websocket_manager.add_follower(leader_id, task_id)
+            return leader_id
+
+        self._push(task_id, priority, row_id)
+        if cache_key:
+            self._leaders[cache_key] = task_id
+            self._leader_keys[task_id] = cache_key
+        return None
+
+    def _release_leader(self, task_id: str) -> Optional[str]:
+        """解除任务的领队身份，返回其cache_key"""
+        cache_key = self._leader_keys.pop(task_id, None)
+        if cache_key and self._leaders.get(cache_key) == task_id:
+            del self._leaders[cache_key]
+        return cache_key
+
+    def _promote_followers(self, leader_id: str, cache_key: Optional[str] = None) -> Optional[str]:
+        """领队任务未能产出结果时，将第一个跟随者提升为新的领队并入队"""
+        followers = self._followers.pop(leader_id, [])
+        self._websocket_manager.remove_followers(leader_id)
+        if not followers:
+            return None
+
+        new_leader, rest = followers[0], followers[1:]
+        priority, row_id = self._follower_meta.pop(new_leader, (0, 0))
+        self._push(new_leader, priority, row_id)
+        if cache_key:
+            self._leaders[cache_key] = new_leader
+            self._leader_keys[new_leader] = cache_key
+        if rest:
+            self._followers[new_leader] = rest
+            for follower_id in rest:
+                self._websocket_manager.add_follower(new_leader, follower_id)
+        return new_leader
+
+    async def _load_pending(self):
+        """从tasks表加载所有pending任务（等待重试的任务到期后由轮询加入）"""
+        async with async_session_maker() as db:
+            result = await db.execute(
+                select(Task.id, Task.task_id, Task.priority, Task.cache_key)
+                .where(Task.status == TaskStatus.PENDING.value, retry_due())
+                .order_by(Task.priority.desc(), Task.id)
+            )
+            for row_id, task_id, priority, cache_key in result.all():
+                self._enqueue(task_id, priority or 0, row_id, cache_key)
+
+    async def _next(self) -> str:
+        """取出下一个待执行任务，队列为空或正在排空时等待"""
+        async with self._condition:
+            while True:
+                while self._heap and not self.draining:
+                    _, _, task_id = heapq.heappop(self._heap)
+                    if task_id in self._queued:
+                        self._queued.discard(task_id)
+                        return task_id
+                await self._condition.wait()
+
+    async def _poll_loop(self):
+        """定期加入其他进程创建或失联后重新排队的pending任务"""
+        while True:
+            await asyncio.sleep(settings.WORKER_HEARTBEAT_INTERVAL)
+            try:
+                async with self._condition:
+                    await self._load_pending()
+                    if self._queued:
+                        self._condition.notify_all()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to poll pending tasks: {e}")
+
+    async def _claim(self, task_id: str) -> bool:
+        """原子地将任务从pending切换为运行状态并获得租约，已被取消或已被其他节点认领时返回False"""
+        return await self.leases.claim(task_id)
+
+    async def cancel_running(self, task_id: str) -> bool:
+        """取消本进程中正在执行的任务，等待子进程树终止、工作目录清理完成后返回（执行槽位随即释放）"""
+        task = self._tasks.get(task_id)
+        if task is None:
+            return False
+        task.cancel()
+        await asyncio.wait({task}, timeout=settings.CANCEL_GRACE_PERIOD + 5)
+        return True
+
+    def _on_lease_lost(self, task_id: str):
+        """任务已被重新排队或取消，停止本地执行"""
+        task = self._tasks.get(task_id)
+        if task:
+            task.cancel()
+
+    async def _run(self, task_id: str):
+        """执行任务"""
+        from app.services.task_service import TaskService
+
+        async with async_session_maker() as db:
+            await TaskService(db)._process_task(task_id, self._websocket_manager)
+
+    async def _finish(self, task_id: str):
+        """领队任务结束后，将结果同步给跟随者；未产出结果时提升跟随者重新执行"""
+        async with self._condition:
+            cache_key = self._release_leader(task_id)
+            followers = self._followers.get(task_id, [])
+            if not followers:
+                self._followers.pop(task_id, None)
+                return
+
+            async with async_session_maker() as db:
+                result = await db.execute(
+                    select(Task.status, Task.output_file_path, Task.output_files, Task.error_message, Task.current_step)
+                    .where(Task.task_id == task_id)
+                )
+                leader = result.first()
+
+            if not leader or leader.status not in (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value):
+                new_leader = self._promote_followers(task_id, cache_key)
+                if new_leader:
+                    await self._reassign_followers(new_leader)
+                    self._condition.notify()
+                return
+
+            self._followers.pop(task_id, None)
+            self._websocket_manager.remove_followers(task_id)
+            for follower_id in followers:
+                self._follower_meta.pop(follower_id, None)
+
+        await self._resolve_followers(task_id, followers, leader)
+
+    async def _reassign_followers(self, leader_id: str):
+        """在数据库中记录新的领队任务"""
+        followers = self._followers.get(leader_id, [])
+        async with async_session_maker() as db:
+            await db.execute(
+                update(Task).where(Task.task_id == leader_id).values(leader_task_id=None)
+            )
+            if followers:
+                await db.execute(
+                    update(Task).where(Task.task_id.in_(followers)).values(leader_task_id=leader_id)
+                )
+            await db.commit()
+
+    async def _resolve_followers(self, leader_id: str, followers: List[str], leader):
+        """将领队任务的最终状态和产物同步给跟随者"""
+        from app.models.task import TaskProgress
+
+        completed = leader.status == TaskStatus.COMPLETED.value
+        progress = 1.0 if completed else 0.0
+        current_step = "任务完成（复用相同任务结果）" if completed else f"相同任务失败: {leader.error_message or ''}"
+        now = datetime.now()
+
+        async with async_session_maker() as db:
+            await db.execute(
+                update(Task)
+                .where(Task.task_id.in_(followers), Task.status == TaskStatus.PENDING.value)
+                .values(
+                    status=leader.status,
+                    progress=progress,
+                    current_step=current_step,
+                    output_file_path=leader.output_file_path,
+                    output_files=leader.output_files,
+                    error_message=leader.error_message,
+                    started_at=now,
+                    completed_at=now
+                )
+            )
+            await db.commit()
+
+        for follower_id in followers:
+            await self._websocket_manager.send_progress(follower_id, TaskProgress(
+                task_id=follower_id,
+                status=leader.status,
+                progress=progress,
+                current_step=current_step,
+                message=leader.error_message or current_step,
+                timestamp=now
+            ))
+
+    async def _worker(self, index: int):
+        """工作协程"""
+        while True:
+            task_id = await self._next()
+            self._running.add(task_id)
+            try:
+                if await self._claim(task_id):
+                    run = asyncio.create_task(self._run(task_id))
+                    self._tasks[task_id] = run
+                    try:
+                        await run
+                    finally:
+                        self._tasks.pop(task_id, None)
+                        await self.leases.release(task_id)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+                logger.warning(f"Task {task_id} was stopped by worker {index}")
+            except Exception as e:
+                logger.error(f"Worker {index} failed to run task {task_id}: {e}")
+            finally:
+                self._running.discard(task_id)
+
+            try:
+                await self._finish(task_id)
+            except Exception as e:
+                logger.error(f"Failed to resolve followers of task {task_id}: {e}")
+
+# 全局调度器
+task_scheduler = TaskScheduler()
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import time
+from typing import Optional, List, Dict, Any
+
+from app.core.config import settings
+
+# 写入缓冲的大小和时间上限，超过任意一个即落盘
+LOG_FLUSH_BYTES = 64 * 1024
+LOG_FLUSH_INTERVAL = 0.5
+
+# 反向读取日志尾部时每次读取的块大小
+TAIL_BLOCK_SIZE = 64 * 1024
+
+def log_path(task_id: str) -> str:
+    """获取任务日志文件路径"""
+    return os.path.join(settings.LOG_DIR, f"{task_id}.log")
+
+def _append(path: str, data: bytes):
+    with open(path, "ab") as f:
+        f.write(data)
+
+def read_range(task_id: str, offset: int = 0, limit: int = 64 * 1024) -> Optional[Dict[str, Any]]:
+    """按字节偏移读取日志（只返回完整的行），日志不存在时返回None"""
+    path = log_path(task_id)
+    if not os.path.exists(path):
+        return None
+
+    size = os.path.getsize(path)
+    offset = min(max(offset, 0), size)
+    with open(path, "rb") as f:
+        f.seek(offset)
+        data = f.read(limit)
+
+    # 截断到最后一个完整的行；单行超过limit时整行返回
+    if offset + len(data) < size:
+        end = data.rfind(b"\n")
+        if end >= 0:
+            data = data[:end + 1]
+        else:
+            with open(path, "rb") as f:
+                f.seek(offset + len(data))
+                rest = f.readline()
+            data += rest
+
+    return {
+        "offset": offset,
+        "next_offset": offset + len(data),
+        "size": size,
+        "content": data.decode("utf-8", errors="replace")
+    }
+
+def read_tail(task_id: str, lines: int = 200) -> Optional[Dict[str, Any]]:
+    """读取日志最后若干行，日志不存在时返回None"""
+    path = log_path(task_id)
+    if not os.path.exists(path):
+        return None
+
+    size = os.path.getsize(path)
+    position = size
+    data = b""
+    with open(path, "rb") as f:
+        while position > 0 and data.count(b"\n") <= lines:
+            read_size = min(TAIL_BLOCK_SIZE, position)
+            position -= read_size
+            f.seek(position)
+            data = f.read(read_size) + data
+
+    parts = data.splitlines(keepends=True)[-lines:] if lines > 0 else []
+    tail = b"".join(parts)
+    return {
+        "offset": size - len(tail),
+        "next_offset": size,
+        "size": size,
+        "lines": [part.decode("utf-8", errors="replace").rstrip("\n") for part in parts]
+    }
+
+class TaskLogWriter:
+    """任务日志写入器
+
+    日志逐行追加到LOG_DIR/<task_id>.log（只追加不改写），读取方按字节偏移分段获取。
+    写入在内存中缓冲，超过LOG_FLUSH_BYTES或距上次落盘超过LOG_FLUSH_INTERVAL时在线程中写入，
+    任务中途崩溃时最多丢失最后一个缓冲周期的日志。
+    """
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.path = log_path(task_id)
+        self._buffer: List[bytes] = []
+        self._buffered = 0
+        self._last_flush = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def open(self) -> "TaskLogWriter":
+        """创建日志文件（重新执行的任务清空旧日志）"""
+        os.makedirs(settings.LOG_DIR, exist_ok=True)
+        await asyncio.to_thread(lambda: open(self.path, "wb").close())
+        return self
+
+    async def write(self, line: str):
+        """追加一行日志"""
+        data = f"{line}\n".encode("utf-8")
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= LOG_FLUSH_BYTES or time.monotonic() - self._last_flush >= LOG_FLUSH_INTERVAL:
+            await self.flush()
+
+    async def flush(self):
+        """将缓冲的日志写入文件"""
+        async with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._buffer:
+                return
+            data = b"".join(self._buffer)
+            self._buffer = []
+            self._buffered = 0
+            await asyncio.to_thread(_append, self.path, data)
+
+    async def __aenter__(self) -> "TaskLogWriter":
+        return await self.open()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.flush()
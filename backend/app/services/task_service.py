@@ -2,16 +2,30 @@ import asyncio
 import uuid
 import json
 import os
-import subprocess
 import shutil
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update
+from sqlalchemy import select, update, func
 
-from app.models.task import Task, TaskCreate, TaskStatus, TaskProgress
+from app.models.task import Task, TaskBatch, TaskCreate, BatchCreate, TaskStatus, TaskProgress
 from app.core.config import settings
 from app.services.websocket_service import WebSocketManager
+from app.services.scheduler import task_scheduler
+from app.services.leases import RUNNING_STATUSES
+from app.services.cache_service import result_cache, task_output_path
+from app.services.workspace import TaskWorkspace, build_targets
+from app.services.task_logs import TaskLogWriter
+from app.services.progress_store import progress_store
+from app.services.pipeline import RepackagePipeline, StageMetrics
+from app.services.progress import PipelineEvent, LogLine, ProgressTracker
+
+# 处理模式显示名称
+MODE_LABELS = {
+    "market": "Market",
+    "github": "Github",
+    "local": "Local"
+}
 
 class TaskService:
     """任务服务"""
@@ -23,6 +37,9 @@ class TaskService:
         """创建新任务"""
         task_id = str(uuid.uuid4())
         
+        # 校验目标平台（后缀重复时抛出ValueError）
+        build_targets(task_data.parameters)
+        
         # 生成任务名称
         task_name = self._generate_task_name(task_data.mode.value, task_data.parameters)
         
@@ -33,6 +50,8 @@ class TaskService:
             mode=task_data.mode.value,
             parameters=json.dumps(task_data.parameters, ensure_ascii=False),
             status=TaskStatus.PENDING,
+            priority=task_data.priority,
+            cache_key=result_cache.build_key(task_data.mode.value, task_data.parameters),
             progress=0.0,
             total_steps=5
         )
@@ -41,8 +60,157 @@ class TaskService:
         await self.db.commit()
         await self.db.refresh(task)
         
+        # 命中结果缓存时直接完成任务
+        await self._complete_from_cache(task)
+        
         return task
     
+    async def _complete_from_cache(self, task: Task) -> bool:
+        """使用缓存中的产物直接完成任务"""
+        entry = await result_cache.lookup(self.db, task.cache_key)
+        if not entry:
+            return False
+        
+        try:
+            output_path = await result_cache.materialize(entry, task.task_id)
+        except Exception as e:
+            print(f"缓存产物复用失败: {e}")
+            return False
+        
+        now = datetime.now()
+        await self.db.execute(
+            update(Task).where(Task.task_id == task.task_id).values(
+                status=TaskStatus.COMPLETED.value,
+                progress=1.0,
+                current_step="命中结果缓存，任务完成",
+                output_file_path=output_path,
+                started_at=now,
+                completed_at=now
+            )
+        )
+        await self.db.commit()
+        await self.db.refresh(task)
+        return True
+    
+    async def create_batch(self, batch_data: BatchCreate) -> Tuple[TaskBatch, List[Task]]:
+        """批量创建任务（单个事务写入），命中结果缓存的任务直接完成"""
+        batch = TaskBatch(
+            batch_id=str(uuid.uuid4()),
+            name=batch_data.name,
+            total=len(batch_data.tasks)
+        )
+        
+        tasks = []
+        for task_data in batch_data.tasks:
+            build_targets(task_data.parameters)
+            priority = batch_data.priority if batch_data.priority is not None else task_data.priority
+            tasks.append(Task(
+                task_id=str(uuid.uuid4()),
+                task_name=self._generate_task_name(task_data.mode.value, task_data.parameters),
+                mode=task_data.mode.value,
+                parameters=json.dumps(task_data.parameters, ensure_ascii=False),
+                status=TaskStatus.PENDING.value,
+                priority=priority,
+                batch_id=batch.batch_id,
+                cache_key=result_cache.build_key(task_data.mode.value, task_data.parameters),
+                progress=0.0,
+                total_steps=5
+            ))
+        
+        self.db.add(batch)
+        self.db.add_all(tasks)
+        await self.db.commit()
+        
+        await self._complete_many_from_cache(tasks)
+        return batch, tasks
+    
+    async def _complete_many_from_cache(self, tasks: List[Task]):
+        """批量使用缓存产物完成任务（一次查询、一次提交）"""
+        entries = await result_cache.lookup_many(self.db, [task.cache_key for task in tasks])
+        if not entries:
+            return
+        
+        now = datetime.now()
+        for task in tasks:
+            entry = entries.get(task.cache_key)
+            if not entry:
+                continue
+            try:
+                output_path = await result_cache.materialize(entry, task.task_id)
+            except Exception as e:
+                print(f"缓存产物复用失败: {e}")
+                continue
+            task.status = TaskStatus.COMPLETED.value
+            task.progress = 1.0
+            task.current_step = "命中结果缓存，任务完成"
+            task.output_file_path = output_path
+            task.started_at = now
+            task.completed_at = now
+        await self.db.commit()
+    
+    async def start_tasks(self, tasks: List[Task]):
+        """批量提交任务到调度队列，跟随者的领队信息一次提交"""
+        pending = [task for task in tasks if task.status == TaskStatus.PENDING.value]
+        leaders = await task_scheduler.submit_many(
+            [(task.task_id, task.priority or 0, task.id, task.cache_key) for task in pending]
+        )
+        if not leaders:
+            return
+        
+        followers_by_leader: Dict[str, List[str]] = {}
+        for follower_id, leader_id in leaders.items():
+            followers_by_leader.setdefault(leader_id, []).append(follower_id)
+        
+        for leader_id, follower_ids in followers_by_leader.items():
+            await self.db.execute(
+                update(Task).where(Task.task_id.in_(follower_ids)).values(
+                    leader_task_id=leader_id,
+                    current_step="等待相同任务完成"
+                )
+            )
+        await self.db.commit()
+    
+    async def get_batch_summary(self, batch_id: str) -> Optional[Dict[str, Any]]:
+        """获取批次的各状态任务数和整体进度（一次分组查询）"""
+        result = await self.db.execute(select(TaskBatch).where(TaskBatch.batch_id == batch_id))
+        batch = result.scalar_one_or_none()
+        if not batch:
+            return None
+        
+        result = await self.db.execute(
+            select(Task.status, func.count(Task.id), func.coalesce(func.sum(Task.progress), 0.0))
+            .where(Task.batch_id == batch_id)
+            .group_by(Task.status)
+        )
+        
+        counts = {"queued": 0, "running": 0, "completed": 0, "failed": 0, "cancelled": 0}
+        progress_sum = 0.0
+        for status, count, status_progress in result.all():
+            # 已结束的任务（包括失败和取消）按完成计入批次进度
+            if status in (TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value):
+                progress_sum += count
+            else:
+                progress_sum += status_progress
+            if status == TaskStatus.PENDING.value:
+                counts["queued"] += count
+            elif status == TaskStatus.COMPLETED.value:
+                counts["completed"] += count
+            elif status == TaskStatus.FAILED.value:
+                counts["failed"] += count
+            elif status == TaskStatus.CANCELLED.value:
+                counts["cancelled"] += count
+            else:
+                counts["running"] += count
+        
+        return {
+            "batch_id": batch.batch_id,
+            "name": batch.name,
+            "total": batch.total,
+            **counts,
+            "progress": round(progress_sum / batch.total, 4) if batch.total else 0.0,
+            "created_at": batch.created_at
+        }
+    
     def _generate_task_name(self, mode: str, parameters: Dict[str, Any]) -> str:
         """根据模式和参数生成任务名称"""
         timestamp = datetime.now().strftime("%H%M%S")
@@ -83,8 +251,25 @@ class TaskService:
     
     async def start_task(self, task_id: str, websocket_manager: WebSocketManager):
         """启动任务处理"""
-        # 在后台异步执行任务
-        asyncio.create_task(self._process_task(task_id, websocket_manager))
+        # 提交到调度队列，由调度器在有空闲槽位时执行
+        result = await self.db.execute(
+            select(Task.id, Task.priority, Task.status, Task.cache_key).where(Task.task_id == task_id)
+        )
+        row = result.first()
+        if not row or row.status != TaskStatus.PENDING.value:
+            # 任务不存在或已完成（如命中缓存）时无需调度
+            return
+        
+        leader_id = await task_scheduler.submit(task_id, row.priority or 0, row.id, row.cache_key)
+        if leader_id:
+            # 已有相同任务在排队或运行，挂为跟随者共享其结果
+            await self.db.execute(
+                update(Task).where(Task.task_id == task_id).values(
+                    leader_task_id=leader_id,
+                    current_step="等待相同任务完成"
+                )
+            )
+            await self.db.commit()
     
     async def _process_task(self, task_id: str, websocket_manager: WebSocketManager):
         """处理任务的核心逻辑"""
@@ -116,15 +301,13 @@ class TaskService:
                 # 解析参数
                 parameters = json.loads(task.parameters) if task.parameters else {}
                 
-                if task.mode == "market":
-                    print(f"[DEBUG] 处理Market任务: {task_id}")
-                    await self._process_market_task_with_db(db, task_id, parameters, websocket_manager)
-                elif task.mode == "github":
-                    print(f"[DEBUG] 处理Github任务: {task_id}")
-                    await self._process_github_task_with_db(db, task_id, parameters, websocket_manager)
-                elif task.mode == "local":
-                    print(f"[DEBUG] 处理Local任务: {task_id}")
-                    await self._process_local_task_with_db(db, task_id, parameters, websocket_manager)
+                # 每个任务使用独立的临时工作目录，结束时（包括失败和取消）自动删除
+                async with TaskWorkspace(task_id) as workspace:
+                    print(f"[DEBUG] 处理{MODE_LABELS.get(task.mode, task.mode)}任务: {task_id}")
+                    await self._run_pipeline_with_db(db, task_id, task.mode, parameters, websocket_manager, workspace)
+                
+                # 成功完成的任务写入结果缓存
+                await self._store_result_cache(db, task_id)
                 
                 print(f"[DEBUG] 任务处理完成: {task_id}")
                 
@@ -135,191 +318,97 @@ class TaskService:
                     websocket_manager, error_message=str(e)
                 )
     
-    async def _process_market_task_with_db(self, db: AsyncSession, task_id: str, params: Dict[str, Any], websocket_manager: WebSocketManager):
-        """处理Market模式任务（带数据库会话）"""
-        try:
-            author = params.get("author")
-            name = params.get("name")
-            version = params.get("version")
-            platform = params.get("platform", "")
-            suffix = params.get("suffix", "offline")
-            
-            # 构建shell命令参数
-            cmd_args = ["bash", "plugin_repackaging.sh"]
-            if platform:
-                cmd_args.extend(["-p", platform])
-            if suffix != "offline":
-                cmd_args.extend(["-s", suffix])
-            cmd_args.extend(["market", author, name, version])
-            
-            await self._execute_shell_command_with_db(db, task_id, cmd_args, websocket_manager)
-            
-        except Exception as e:
-            raise Exception(f"Market任务处理失败: {str(e)}")
-    
-    async def _process_github_task_with_db(self, db: AsyncSession, task_id: str, params: Dict[str, Any], websocket_manager: WebSocketManager):
-        """处理Github模式任务（带数据库会话）"""
-        try:
-            repo = params.get("repo")
-            release = params.get("release")
-            asset_name = params.get("asset_name")
-            platform = params.get("platform", "")
-            suffix = params.get("suffix", "offline")
-            
-            # 构建shell命令参数
-            cmd_args = ["bash", "plugin_repackaging.sh"]
-            if platform:
-                cmd_args.extend(["-p", platform])
-            if suffix != "offline":
-                cmd_args.extend(["-s", suffix])
-            cmd_args.extend(["github", repo, release, asset_name])
-            
-            await self._execute_shell_command_with_db(db, task_id, cmd_args, websocket_manager)
-            
-        except Exception as e:
-            raise Exception(f"Github任务处理失败: {str(e)}")
-    
-    async def _process_local_task_with_db(self, db: AsyncSession, task_id: str, params: Dict[str, Any], websocket_manager: WebSocketManager):
-        """处理Local模式任务（带数据库会话）"""
-        try:
-            file_name = params.get("file_name")
-            platform = params.get("platform", "")
-            suffix = params.get("suffix", "offline")
-            
-            # 文件路径
-            file_path = os.path.join(settings.UPLOAD_DIR, file_name)
-            if not os.path.exists(file_path):
-                raise Exception(f"文件不存在: {file_path}")
-            
-            # 构建shell命令参数
-            cmd_args = ["bash", "plugin_repackaging.sh"]
-            if platform:
-                cmd_args.extend(["-p", platform])
-            if suffix != "offline":
-                cmd_args.extend(["-s", suffix])
-            cmd_args.extend(["local", file_path])
-            
-            await self._execute_shell_command_with_db(db, task_id, cmd_args, websocket_manager)
-            
-        except Exception as e:
-            raise Exception(f"Local任务处理失败: {str(e)}")
+    async def _run_pipeline_with_db(
+        self,
+        db: AsyncSession,
+        task_id: str,
+        mode: str,
+        params: Dict[str, Any],
+        websocket_manager: WebSocketManager,
+        workspace: TaskWorkspace
+    ):
+        """执行重新打包流水线（带数据库会话）"""
+        async with TaskLogWriter(task_id) as log_writer:
+            await self._run_pipeline_with_log(db, task_id, mode, params, websocket_manager, workspace, log_writer)
     
-    async def _execute_shell_command_with_db(self, db: AsyncSession, task_id: str, cmd_args: list, websocket_manager: WebSocketManager):
-        """执行shell命令（带数据库会话）"""
+    async def _run_pipeline_with_log(
+        self,
+        db: AsyncSession,
+        task_id: str,
+        mode: str,
+        params: Dict[str, Any],
+        websocket_manager: WebSocketManager,
+        workspace: TaskWorkspace,
+        log_writer: TaskLogWriter
+    ):
+        """执行流水线，日志逐行追加到任务日志文件"""
+        tracker = ProgressTracker(RepackagePipeline.stages_for(mode))
+        
+        async def on_event(event: PipelineEvent):
+            if isinstance(event, LogLine):
+                await log_writer.write(event.line)
+                # 发送实时日志到WebSocket
+                await websocket_manager.send_log(task_id, event.line)
+                return
+            
+            # 进度只由阶段和字节事件计算
+            update = tracker.update(event)
+            if update:
+                await self._update_task_status_with_db(
+                    db, task_id, update.status, update.progress, update.current_step,
+                    websocket_manager
+                )
+        
+        pipeline = RepackagePipeline(
+            workspace,
+            targets=build_targets(params),
+            on_event=on_event
+        )
+        
         try:
-            # 添加环境调试信息
-            import sys
-            print(f"[DEBUG] Python版本: {sys.version}")
-            print(f"[DEBUG] 任务ID: {task_id}")
-            
-            await self._update_task_status_with_db(
-                db, task_id, TaskStatus.DOWNLOADING, 0.2, "开始下载插件...",
-                websocket_manager
+            outputs = await pipeline.run(mode, params)
+            
+            # 移动文件到输出目录
+            output_files = []
+            for output in outputs:
+                final_output_path = task_output_path(task_id, output["path"])
+                os.makedirs(os.path.dirname(final_output_path), exist_ok=True)
+                await asyncio.to_thread(shutil.move, output["path"], final_output_path)
+                output_files.append({
+                    "platform": output["platform"],
+                    "suffix": output["suffix"],
+                    "file_name": os.path.basename(final_output_path),
+                    "file_path": final_output_path,
+                    "file_size": os.path.getsize(final_output_path)
+                })
+            
+            # 更新任务记录（多平台任务同时记录全部输出文件）
+            await self._update_task_file_path_with_db(
+                db, task_id, output_files[0]["file_path"],
+                output_files if len(output_files) > 1 else None
             )
-            
-            # 切换到项目根目录
-            cwd = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            print(f"[DEBUG] 工作目录: {cwd}")
-            print(f"[DEBUG] 执行命令: {' '.join(cmd_args)}")
-            
-            # 执行命令（不使用text参数，手动处理编码）
-            process = await asyncio.create_subprocess_exec(
-                *cmd_args,
-                cwd=cwd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT
+            await self._update_task_status_with_db(
+                db, task_id, TaskStatus.COMPLETED, 1.0, "任务完成",
+                websocket_manager, stage_metrics=pipeline.metrics
             )
-            
-            log_content = ""
-            
-            # 实时读取输出
-            while True:
-                line_bytes = await process.stdout.readline()
-                if not line_bytes:
-                    break
-                
-                # 手动解码字节为字符串
-                try:
-                    line = line_bytes.decode('utf-8').strip()
-                except UnicodeDecodeError:
-                    line = line_bytes.decode('utf-8', errors='ignore').strip()
-                
-                if line:
-                    log_content += line + "\n"
-                    print(f"[SHELL OUTPUT] {line}")  # 调试：显示脚本输出
-                    
-                    # 发送实时日志到WebSocket
-                    await websocket_manager.send_log(task_id, line)
-                    
-                    # 根据输出判断进度并更新状态
-                    if "downloading" in line.lower() or "download" in line.lower():
-                        await self._update_task_status_with_db(
-                            db, task_id, TaskStatus.DOWNLOADING, 0.3, f"下载中: {line}",
-                            websocket_manager
-                        )
-                    elif "unziping" in line.lower() or "unzip" in line.lower() or "extract" in line.lower():
-                        await self._update_task_status_with_db(
-                            db, task_id, TaskStatus.EXTRACTING, 0.5, f"解压中: {line}",
-                            websocket_manager
-                        )
-                    elif "repackaging" in line.lower() or "package" in line.lower() or "building" in line.lower():
-                        await self._update_task_status_with_db(
-                            db, task_id, TaskStatus.PACKAGING, 0.7, f"重新打包中: {line}",
-                            websocket_manager
-                        )
-                    elif "success" in line.lower() or "complete" in line.lower():
-                        await self._update_task_status_with_db(
-                            db, task_id, TaskStatus.PACKAGING, 0.9, f"处理中: {line}",
-                            websocket_manager
-                        )
-                    elif "error" in line.lower() or "failed" in line.lower():
-                        await self._update_task_status_with_db(
-                            db, task_id, TaskStatus.FAILED, 0.0, f"错误: {line}",
-                            websocket_manager, error_message=line
-                        )
-                        break
-            
-            # 等待进程完成
-            await process.wait()
-            
-            if process.returncode == 0:
-                # 查找输出文件
-                output_file = await self._find_output_file(cwd)
-                if output_file:
-                    # 移动文件到输出目录
-                    output_filename = os.path.basename(output_file)
-                    final_output_path = os.path.join(settings.OUTPUT_DIR, output_filename)
-                    shutil.move(output_file, final_output_path)
-                    
-                    # 更新任务记录
-                    await self._update_task_file_path_with_db(db, task_id, final_output_path)
-                
-                await self._update_task_status_with_db(
-                    db, task_id, TaskStatus.COMPLETED, 1.0, "任务完成",
-                    websocket_manager, log_content=log_content
-                )
-            else:
-                raise Exception(f"命令执行失败，返回码: {process.returncode}")
-                
         except Exception as e:
+            label = MODE_LABELS.get(mode, mode)
+            error_message = f"{label}任务处理失败: {str(e)}"
             await self._update_task_status_with_db(
-                db, task_id, TaskStatus.FAILED, 0.0, f"执行失败: {str(e)}",
-                websocket_manager, error_message=str(e)
+                db, task_id, TaskStatus.FAILED, 0.0, f"执行失败: {error_message}",
+                websocket_manager, error_message=error_message,
+                stage_metrics=pipeline.metrics
             )
     
-    async def _find_output_file(self, base_dir: str) -> Optional[str]:
-        """查找输出文件"""
-        try:
-            for root, dirs, files in os.walk(base_dir):
-                for file in files:
-                    if file.endswith('-offline.difypkg') or file.endswith('.difypkg'):
-                        # 排除原始输入文件
-                        file_path = os.path.join(root, file)
-                        if 'uploads' not in file_path:
-                            return file_path
-            return None
-        except Exception:
-            return None
+    async def _store_result_cache(self, db: AsyncSession, task_id: str):
+        """将已完成任务的产物写入结果缓存"""
+        result = await db.execute(
+            select(Task.status, Task.cache_key, Task.output_file_path, Task.output_files).where(Task.task_id == task_id)
+        )
+        row = result.first()
+        # 结果缓存每个条目只保存一个文件，多平台任务不写入
+        if row and row.status == TaskStatus.COMPLETED.value and row.output_file_path and not row.output_files:
+            await result_cache.store(db, row.cache_key, row.output_file_path, task_id)
     
     async def _update_task_status_with_db(
         self, 
@@ -330,7 +419,7 @@ class TaskService:
         current_step: str,
         websocket_manager: WebSocketManager,
         error_message: str = None,
-        log_content: str = None
+        stage_metrics: List[StageMetrics] = None
     ):
         """使用指定数据库会话更新任务状态"""
         try:
@@ -351,235 +440,13 @@ class TaskService:
             if error_message:
                 update_data["error_message"] = error_message
             
-            if log_content:
-                update_data["log_content"] = log_content
+            if stage_metrics:
+                update_data["stage_metrics"] = json.dumps([m.to_dict() for m in stage_metrics])
             
-            # 更新数据库
-            await db.execute(
-                update(Task).where(Task.task_id == task_id).values(**update_data)
-            )
-            await db.commit()
-            
-            # 发送WebSocket消息
-            progress_data = TaskProgress(
-                task_id=task_id,
-                status=status.value,
-                progress=progress,
-                current_step=current_step,
-                message=error_message or current_step,
-                timestamp=datetime.now()
-            )
-            
-            await websocket_manager.send_progress(task_id, progress_data)
-            
-        except Exception as e:
-            print(f"更新任务状态失败: {e}")
-    
-    # 以下是保留的原始方法，用于HTTP请求中的数据库操作
-    async def _process_market_task(self, task_id: str, params: Dict[str, Any], websocket_manager: WebSocketManager):
-        """处理Market模式任务"""
-        try:
-            author = params.get("author")
-            name = params.get("name")
-            version = params.get("version")
-            platform = params.get("platform", "")
-            suffix = params.get("suffix", "offline")
-            
-            # 构建shell命令参数
-            cmd_args = ["bash", "plugin_repackaging.sh"]
-            if platform:
-                cmd_args.extend(["-p", platform])
-            if suffix != "offline":
-                cmd_args.extend(["-s", suffix])
-            cmd_args.extend(["market", author, name, version])
-            
-            await self._execute_shell_command(task_id, cmd_args, websocket_manager)
-            
-        except Exception as e:
-            raise Exception(f"Market任务处理失败: {str(e)}")
-    
-    async def _process_github_task(self, task_id: str, params: Dict[str, Any], websocket_manager: WebSocketManager):
-        """处理Github模式任务"""
-        try:
-            repo = params.get("repo")
-            release = params.get("release")
-            asset_name = params.get("asset_name")
-            platform = params.get("platform", "")
-            suffix = params.get("suffix", "offline")
-            
-            # 构建shell命令参数
-            cmd_args = ["bash", "plugin_repackaging.sh"]
-            if platform:
-                cmd_args.extend(["-p", platform])
-            if suffix != "offline":
-                cmd_args.extend(["-s", suffix])
-            cmd_args.extend(["github", repo, release, asset_name])
-            
-            await self._execute_shell_command(task_id, cmd_args, websocket_manager)
-            
-        except Exception as e:
-            raise Exception(f"Github任务处理失败: {str(e)}")
-    
-    async def _process_local_task(self, task_id: str, params: Dict[str, Any], websocket_manager: WebSocketManager):
-        """处理Local模式任务"""
-        try:
-            file_name = params.get("file_name")
-            platform = params.get("platform", "")
-            suffix = params.get("suffix", "offline")
-            
-            # 文件路径
-            file_path = os.path.join(settings.UPLOAD_DIR, file_name)
-            if not os.path.exists(file_path):
-                raise Exception(f"文件不存在: {file_path}")
-            
-            # 构建shell命令参数
-            cmd_args = ["bash", "plugin_repackaging.sh"]
-            if platform:
-                cmd_args.extend(["-p", platform])
-            if suffix != "offline":
-                cmd_args.extend(["-s", suffix])
-            cmd_args.extend(["local", file_path])
-            
-            await self._execute_shell_command(task_id, cmd_args, websocket_manager)
-            
-        except Exception as e:
-            raise Exception(f"Local任务处理失败: {str(e)}")
-    
-    async def _execute_shell_command(self, task_id: str, cmd_args: list, websocket_manager: WebSocketManager):
-        """执行shell命令"""
-        try:
-            await self._update_task_status(
-                task_id, TaskStatus.DOWNLOADING, 0.2, "开始下载插件...",
-                websocket_manager
-            )
-            
-            # 切换到项目根目录
-            cwd = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-            
-            # 执行命令（不使用text参数，手动处理编码）
-            process = await asyncio.create_subprocess_exec(
-                *cmd_args,
-                cwd=cwd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.STDOUT
-            )
-            
-            log_content = ""
-            
-            # 实时读取输出
-            while True:
-                line_bytes = await process.stdout.readline()
-                if not line_bytes:
-                    break
-                
-                # 手动解码字节为字符串
-                try:
-                    line = line_bytes.decode('utf-8').strip()
-                except UnicodeDecodeError:
-                    line = line_bytes.decode('utf-8', errors='ignore').strip()
-                
-                if line:
-                    log_content += line + "\n"
-                    print(f"[SHELL OUTPUT] {line}")  # 调试：显示脚本输出
-                    
-                    # 发送实时日志到WebSocket
-                    await websocket_manager.send_log(task_id, line)
-                    
-                    # 根据输出判断进度并更新状态
-                    if "downloading" in line.lower() or "download" in line.lower():
-                        await self._update_task_status(
-                            task_id, TaskStatus.DOWNLOADING, 0.3, f"下载中: {line}",
-                            websocket_manager
-                        )
-                    elif "unziping" in line.lower() or "unzip" in line.lower() or "extract" in line.lower():
-                        await self._update_task_status(
-                            task_id, TaskStatus.EXTRACTING, 0.5, f"解压中: {line}",
-                            websocket_manager
-                        )
-                    elif "repackaging" in line.lower() or "package" in line.lower() or "building" in line.lower():
-                        await self._update_task_status(
-                            task_id, TaskStatus.PACKAGING, 0.7, f"重新打包中: {line}",
-                            websocket_manager
-                        )
-                    elif "success" in line.lower() or "complete" in line.lower():
-                        await self._update_task_status(
-                            task_id, TaskStatus.PACKAGING, 0.9, f"处理中: {line}",
-                            websocket_manager
-                        )
-                    elif "error" in line.lower() or "failed" in line.lower():
-                        await self._update_task_status(
-                            task_id, TaskStatus.FAILED, 0.0, f"错误: {line}",
-                            websocket_manager, error_message=line
-                        )
-                        break
-            
-            # 等待进程完成
-            await process.wait()
-            
-            if process.returncode == 0:
-                # 查找输出文件
-                output_file = await self._find_output_file(cwd)
-                if output_file:
-                    # 移动文件到输出目录
-                    output_filename = os.path.basename(output_file)
-                    final_output_path = os.path.join(settings.OUTPUT_DIR, output_filename)
-                    shutil.move(output_file, final_output_path)
-                    
-                    # 更新任务记录
-                    await self._update_task_file_path(task_id, final_output_path)
-                
-                await self._update_task_status(
-                    task_id, TaskStatus.COMPLETED, 1.0, "任务完成",
-                    websocket_manager, log_content=log_content
-                )
-            else:
-                raise Exception(f"命令执行失败，返回码: {process.returncode}")
-                
-        except Exception as e:
-            await self._update_task_status(
-                task_id, TaskStatus.FAILED, 0.0, f"执行失败: {str(e)}",
-                websocket_manager, error_message=str(e)
-            )
-    
-    async def _update_task_status(
-        self, 
-        task_id: str, 
-        status: TaskStatus, 
-        progress: float, 
-        current_step: str,
-        websocket_manager: WebSocketManager,
-        error_message: str = None,
-        log_content: str = None
-    ):
-        """更新任务状态"""
-        try:
-            # 构建更新数据 - 使用字符串键而不是 Column 对象
-            update_data = {
-                "status": status.value,
-                "progress": progress,
-                "current_step": current_step
-            }
-            
-            if status == TaskStatus.DOWNLOADING and not hasattr(self, f"started_{task_id}"):
-                update_data["started_at"] = datetime.now()
-                setattr(self, f"started_{task_id}", True)
-            
-            if status == TaskStatus.COMPLETED:
-                update_data["completed_at"] = datetime.now()
-            
-            if error_message:
-                update_data["error_message"] = error_message
-            
-            if log_content:
-                update_data["log_content"] = log_content
-            
-            # 更新数据库
-            await self.db.execute(
-                update(Task).where(Task.task_id == task_id).values(**update_data)
-            )
-            await self.db.commit()
-            
-            # 发送WebSocket消息
+            # 写入进度缓存（状态变化时立即落库，其余按间隔批量写入）
+            await progress_store.update(task_id, update_data)
+
+            # 发送WebSocket消息（实时，不等待落库）
             progress_data = TaskProgress(
                 task_id=task_id,
                 status=status.value,
@@ -604,30 +471,50 @@ class TaskService:
         )
         await self.db.commit()
     
-    async def _update_task_file_path(self, task_id: str, output_path: str):
-        """更新任务输出文件路径"""
-        await self.db.execute(
-            update(Task).where(Task.task_id == task_id).values(
-                output_file_path=output_path
-            )
-        )
-        await self.db.commit()
-    
-    async def _update_task_file_path_with_db(self, db: AsyncSession, task_id: str, output_path: str):
+    async def _update_task_file_path_with_db(
+        self,
+        db: AsyncSession,
+        task_id: str,
+        output_path: str,
+        output_files: Optional[List[Dict[str, Any]]] = None
+    ):
         """使用指定数据库会话更新任务输出文件路径"""
         await db.execute(
             update(Task).where(Task.task_id == task_id).values(
-                output_file_path=output_path
+                output_file_path=output_path,
+                output_files=json.dumps(output_files, ensure_ascii=False) if output_files else None
             )
         )
         await db.commit()
     
-    async def cancel_task(self, task_id: str):
-        """取消任务"""
-        await self.db.execute(
-            update(Task).where(Task.task_id == task_id).values(
+    async def cancel_task(self, task_id: str) -> bool:
+        """取消任务，任务不存在或已结束时返回False
+        
+        排队中的任务直接移出队列；本进程中运行的任务终止其子进程树并清理工作目录，
+        在其他节点运行的任务由该节点在下一次续约时发现取消状态后停止。
+        """
+        # 尚未开始的任务直接移出队列
+        await task_scheduler.remove(task_id)
+        # 丢弃尚未落库的进度，避免覆盖取消状态
+        await progress_store.discard(task_id)
+        
+        # 只取消排队中和运行中的任务，不覆盖已完成、失败或已取消的状态
+        result = await self.db.execute(
+            update(Task).where(
+                Task.task_id == task_id,
+                Task.status.in_((TaskStatus.PENDING.value,) + RUNNING_STATUSES)
+            ).values(
                 status=TaskStatus.CANCELLED.value,
-                completed_at=datetime.now()
+                current_step="任务已取消",
+                completed_at=datetime.now(),
+                lease_owner=None,
+                lease_expires_at=None
             )
         )
-        await self.db.commit()
\ No newline at end of file
+        await self.db.commit()
+        if result.rowcount != 1:
+            return False
+        
+        # 先记录取消状态，再停止运行中的任务
+        await task_scheduler.cancel_running(task_id)
+        return True
\ No newline at end of file
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional, List, Tuple, Callable, AsyncIterator
+from sqlalchemy import select, update, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.upload import UploadSession, UploadChunk, UploadSessionCreate
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.services.cache_service import compute_file_sha256
+from app.services.uploads import UploadError, UploadTooLarge, check_package_filename, validate_package
+
+logger = logging.getLogger(__name__)
+
+STATUS_UPLOADING = "uploading"
+STATUS_COMPLETING = "completing"
+STATUS_COMPLETED = "completed"
+
+def merge_ranges(chunks: List[Tuple[int, int]]) -> List[List[int]]:
+    """将 (offset, length) 分块合并为有序且不重叠的 [start, end) 范围"""
+    ranges: List[List[int]] = []
+    for offset, length in sorted(chunks):
+        end = offset + length
+        if ranges and offset <= ranges[-1][1]:
+            ranges[-1][1] = max(ranges[-1][1], end)
+        else:
+            ranges.append([offset, end])
+    return ranges
+
+def _preallocate(path: str, size: int):
+    """创建临时文件并预分配空间（磁盘空间不足时立即失败）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(fd, 0, size)
+        else:
+            os.ftruncate(fd, size)
+    finally:
+        os.close(fd)
+
+def _pwrite(fd: int, data: bytes, offset: int):
+    """在指定位置写入数据（并行写入同一文件的不同位置互不影响）"""
+    view = memoryview(data)
+    while view:
+        if hasattr(os, "pwrite"):
+            written = os.pwrite(fd, view, offset)
+        else:
+            os.lseek(fd, offset, os.SEEK_SET)
+            written = os.write(fd, view)
+        view = view[written:]
+        offset += written
+
+def _move_no_overwrite(src: str, dst: str):
+    """移动文件，目标已存在时失败而不是覆盖"""
+    os.link(src, dst)
+    os.remove(src)
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+class UploadSessionStore:
+    """断点续传上传会话
+
+    创建会话时按文件大小预分配临时文件，客户端以任意顺序（可并行）PUT带偏移量的分块，
+    分块直接写入临时文件的对应位置并记录已接收范围；全部范围接收完成后校验哈希和插件包结构，
+    将临时文件改名为上传文件（不产生第二份完整拷贝）。会话在UPLOAD_SESSION_TTL内没有新分块时过期，
+    过期会话每隔UPLOAD_SESSION_CLEANUP_INTERVAL秒以及创建新会话时清理，释放预分配的磁盘空间。
+    """
+
+    def __init__(self):
+        self._sweeper: Optional[asyncio.Task] = None
+
+    async def start(self):
+        """启动过期会话的定期清理"""
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        """停止定期清理"""
+        if self._sweeper:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                async with async_session_maker() as db:
+                    await self.cleanup_expired(db)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to clean up expired upload sessions: {e}")
+            await asyncio.sleep(settings.UPLOAD_SESSION_CLEANUP_INTERVAL)
+
+    @property
+    def session_dir(self) -> str:
+        return os.path.join(settings.UPLOAD_DIR, ".sessions")
+
+    def _expires_at(self) -> datetime:
+        return datetime.now() + timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+    async def create(self, db: AsyncSession, data: UploadSessionCreate) -> UploadSession:
+        """创建上传会话并预分配临时文件"""
+        filename = check_package_filename(data.filename)
+        if data.size <= 0:
+            raise UploadError("文件大小必须大于0")
+        if data.size > settings.MAX_FILE_SIZE:
+            raise UploadTooLarge()
+
+        await self.cleanup_expired(db)
+
+        upload_id = str(uuid.uuid4())
+        file_path = os.path.join(self.session_dir, f"{upload_id}.part")
+        try:
+            await asyncio.to_thread(_preallocate, file_path, data.size)
+        except OSError as e:
+            await asyncio.to_thread(_remove, file_path)
+            raise UploadError(f"无法分配上传空间: {e}", status_code=507)
+
+        parameters = {
+            "platform": data.platform,
+            "suffix": data.suffix or "offline",
+            "targets": [target.dict() for target in data.targets] if data.targets else None
+        }
+        session = UploadSession(
+            upload_id=upload_id,
+            filename=filename,
+            file_size=data.size,
+            file_path=file_path,
+            sha256=data.sha256.lower() if data.sha256 else None,
+            parameters=json.dumps(parameters, ensure_ascii=False),
+            priority=data.priority,
+            status=STATUS_UPLOADING,
+            created_at=datetime.now(),
+            expires_at=self._expires_at()
+        )
+        db.add(session)
+        await db.commit()
+        await db.refresh(session)
+        return session
+
+    async def get(self, db: AsyncSession, upload_id: str) -> UploadSession:
+        """获取未过期的上传会话"""
+        result = await db.execute(select(UploadSession).where(UploadSession.upload_id == upload_id))
+        session = result.scalar_one_or_none()
+        if session is None or session.expires_at < datetime.now():
+            raise UploadError("上传会话不存在或已过期", status_code=404)
+        return session
+
+    async def received_ranges(self, db: AsyncSession, upload_id: str) -> List[List[int]]:
+        """获取已接收的字节范围"""
+        result = await db.execute(
+            select(UploadChunk.offset, UploadChunk.length).where(UploadChunk.upload_id == upload_id)
+        )
+        return merge_ranges([tuple(row) for row in result.all()])
+
+    async def _ensure_uploading(self, db: AsyncSession, upload_id: str):
+        """从数据库重新读取会话状态（传入的会话对象可能已过时），不在接收分块状态时抛出409"""
+        result = await db.execute(select(UploadSession.status).where(UploadSession.upload_id == upload_id))
+        if result.scalar_one_or_none() != STATUS_UPLOADING:
+            raise UploadError("上传正在完成或已完成，不能继续写入分块", status_code=409)
+
+    async def write_chunk(self, db: AsyncSession, session: UploadSession, offset: int, stream: AsyncIterator[bytes], length: Optional[int] = None) -> int:
+        """将请求体作为从offset开始的分块写入临时文件，返回写入的字节数"""
+        await self._ensure_uploading(db, session.upload_id)
+        if offset < 0 or offset >= session.file_size:
+            raise UploadError("分块偏移量超出文件范围")
+        limit = session.file_size - offset
+        if length is not None and length > limit:
+            raise UploadError("分块超出文件范围")
+
+        try:
+            fd = await asyncio.to_thread(os.open, session.file_path, os.O_WRONLY)
+        except FileNotFoundError:
+            # 临时文件已被同时进行的完成请求移走
+            raise UploadError("上传正在完成或已完成，不能继续写入分块", status_code=409)
+        received = 0
+        buffer = bytearray()
+        try:
+            async for data in stream:
+                received += len(data)
+                if received > limit:
+                    raise UploadError("分块超出文件范围")
+                buffer += data
+                if len(buffer) >= settings.UPLOAD_CHUNK_SIZE:
+                    await asyncio.to_thread(_pwrite, fd, bytes(buffer), offset + received - len(buffer))
+                    buffer.clear()
+            if buffer:
+                await asyncio.to_thread(_pwrite, fd, bytes(buffer), offset + received - len(buffer))
+        finally:
+            await asyncio.to_thread(os.close, fd)
+
+        if received == 0:
+            raise UploadError("分块内容为空")
+
+        # 分块完整写入后才记录，中断的分块由客户端重新发送；
+        # 与complete使用相同的状态条件，写入期间会话已开始完成时拒绝该分块
+        result = await db.execute(
+            update(UploadSession)
+            .where(UploadSession.upload_id == session.upload_id, UploadSession.status == STATUS_UPLOADING)
+            .values(expires_at=self._expires_at())
+        )
+        if result.rowcount != 1:
+            await db.rollback()
+            raise UploadError("上传正在完成或已完成，不能继续写入分块", status_code=409)
+        db.add(UploadChunk(upload_id=session.upload_id, offset=offset, length=received))
+        await db.commit()
+        return received
+
+    async def complete(self, db: AsyncSession, session: UploadSession, path_for: Callable[[str], str]) -> Tuple[str, str]:
+        """校验全部分块已接收、哈希和插件包结构，将临时文件移动到path_for返回的路径
+
+        返回 (文件路径, sha256)。校验失败时会话恢复为uploading状态，客户端可以补传分块后重试。
+        """
+        result = await db.execute(
+            update(UploadSession)
+            .where(UploadSession.upload_id == session.upload_id, UploadSession.status == STATUS_UPLOADING)
+            .values(status=STATUS_COMPLETING)
+        )
+        await db.commit()
+        if result.rowcount != 1:
+            raise UploadError("上传会话正在完成或已完成", status_code=409)
+
+        try:
+            ranges = await self.received_ranges(db, session.upload_id)
+            if ranges != [[0, session.file_size]]:
+                missing = session.file_size - sum(end - start for start, end in ranges)
+                raise UploadError(f"文件尚未上传完整，还缺少{missing}字节", status_code=409)
+
+            sha256 = await asyncio.to_thread(compute_file_sha256, session.file_path)
+            if session.sha256 and sha256 != session.sha256:
+                raise UploadError("文件sha256校验失败，请重新上传")
+            await asyncio.to_thread(validate_package, session.file_path)
+
+            file_path = path_for(session.filename)
+            await asyncio.to_thread(_move_no_overwrite, session.file_path, file_path)
+        except BaseException:
+            await db.execute(
+                update(UploadSession)
+                .where(UploadSession.upload_id == session.upload_id)
+                .values(status=STATUS_UPLOADING)
+            )
+            await db.commit()
+            raise
+
+        await db.execute(delete(UploadChunk).where(UploadChunk.upload_id == session.upload_id))
+        await db.commit()
+        return file_path, sha256
+
+    async def mark_completed(self, db: AsyncSession, session: UploadSession, task_id: str):
+        """记录会话创建的任务（重复完成请求直接返回该任务）"""
+        await db.execute(
+            update(UploadSession)
+            .where(UploadSession.upload_id == session.upload_id)
+            .values(status=STATUS_COMPLETED, task_id=task_id)
+        )
+        await db.commit()
+
+    async def abort(self, db: AsyncSession, session: UploadSession):
+        """取消上传，删除会话和临时文件"""
+        await self._delete(db, [session])
+        await db.commit()
+
+    async def cleanup_expired(self, db: AsyncSession) -> int:
+        """删除过期的会话及其临时文件"""
+        result = await db.execute(select(UploadSession).where(UploadSession.expires_at < datetime.now()))
+        expired = list(result.scalars().all())
+        if expired:
+            await self._delete(db, expired)
+            await db.commit()
+            logger.info(f"Removed {len(expired)} expired upload sessions")
+        return len(expired)
+
+    async def _delete(self, db: AsyncSession, sessions: List[UploadSession]):
+        upload_ids = [session.upload_id for session in sessions]
+        for session in sessions:
+            # 已完成会话的临时文件已移动为上传文件
+            if session.status != STATUS_COMPLETED:
+                await asyncio.to_thread(_remove, session.file_path)
+        await db.execute(delete(UploadChunk).where(UploadChunk.upload_id.in_(upload_ids)))
+        await db.execute(delete(UploadSession).where(UploadSession.upload_id.in_(upload_ids)))
+
+# 全局上传会话
+upload_sessions = UploadSessionStore()
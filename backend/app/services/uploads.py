@@ -0,0 +1,230 @@
+import asyncio
+import hashlib
+import os
+import zipfile
+from dataclasses import dataclass, field
+from typing import Optional, Dict, List, Tuple, Callable
+from fastapi import Request
+from multipart.multipart import MultipartParser, parse_options_header
+from multipart.exceptions import MultipartParseError
+
+from app.core.config import settings
+
+# 插件包扩展名
+PACKAGE_EXTENSION = ".difypkg"
+# 插件包根目录必须包含的清单文件
+PACKAGE_MANIFEST = "manifest.yaml"
+# 表单中普通字段的总大小上限（字节）
+MAX_FORM_FIELDS_SIZE = 64 * 1024
+
+class UploadError(Exception):
+    """上传内容不合法"""
+
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+class UploadTooLarge(UploadError):
+    """上传文件超过MAX_FILE_SIZE"""
+
+    def __init__(self):
+        super().__init__(f"文件大小超过限制({settings.MAX_FILE_SIZE / 1024 / 1024}MB)", status_code=413)
+
+class UploadWriter:
+    """将上传内容分块写入文件，同时计算sha256
+
+    数据先在内存中攒够UPLOAD_CHUNK_SIZE字节，再在线程中写入磁盘并更新哈希，避免阻塞事件循环；
+    累计字节数超过max_size时立即中止。
+    """
+
+    def __init__(self, path: str, max_size: Optional[int] = None):
+        self.path = path
+        self.max_size = settings.MAX_FILE_SIZE if max_size is None else max_size
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._buffer = bytearray()
+        self._file = None
+        # 文件是否由本对象创建，abort()只删除自己创建的文件
+        self._created = False
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+    async def open(self) -> "UploadWriter":
+        """创建文件（文件已存在时失败，不会覆盖其他上传的文件）"""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._file = await asyncio.to_thread(open, self.path, "xb")
+        self._created = True
+        return self
+
+    async def write(self, data: bytes):
+        """追加数据，超过大小限制时抛出UploadTooLarge"""
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadTooLarge()
+        self._buffer += data
+        if len(self._buffer) >= settings.UPLOAD_CHUNK_SIZE:
+            await self.flush()
+
+    async def flush(self):
+        if self._buffer:
+            data = bytes(self._buffer)
+            self._buffer.clear()
+            await asyncio.to_thread(self._write, data)
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+        self._sha256.update(data)
+
+    async def close(self):
+        """写入剩余数据并关闭文件"""
+        if self._file is None:
+            return
+        try:
+            await self.flush()
+        finally:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+
+    async def abort(self):
+        """关闭并删除未完成的文件"""
+        self._buffer.clear()
+        if self._file is not None:
+            await asyncio.to_thread(self._file.close)
+            self._file = None
+        if self._created and os.path.exists(self.path):
+            os.remove(self.path)
+        self._created = False
+
+@dataclass
+class ReceivedUpload:
+    """已接收的上传文件及表单字段"""
+    filename: str  # 客户端提供的原始文件名
+    path: str
+    size: int
+    sha256: str
+    fields: Dict[str, str] = field(default_factory=dict)
+
+def check_package_filename(filename: Optional[str]) -> str:
+    """校验插件包文件名，返回去除路径后的文件名"""
+    filename = os.path.basename((filename or "").replace("\\", "/"))
+    if not filename.endswith(PACKAGE_EXTENSION):
+        raise UploadError(f"只支持{PACKAGE_EXTENSION}文件")
+    return filename
+
+def validate_package(path: str):
+    """读取zip中央目录校验插件包结构（不解压文件内容）"""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            names = archive.namelist()
+    except (zipfile.BadZipFile, OSError) as e:
+        raise UploadError(f"插件包已损坏或不是有效的zip文件: {e}")
+    if PACKAGE_MANIFEST not in names:
+        raise UploadError(f"插件包缺少{PACKAGE_MANIFEST}")
+
+class _MultipartEvents:
+    """收集multipart解析回调产生的事件，由协程异步处理（回调本身不能await）"""
+
+    def __init__(self):
+        self.events: List[Tuple[str, object]] = []
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+        self._headers: Dict[bytes, bytes] = {}
+
+    def callbacks(self) -> Dict[str, Callable]:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_part_data": self._on_part_data,
+            "on_part_end": lambda: self.events.append(("end", None)),
+            "on_header_field": lambda data, start, end: self._header_field.extend(data[start:end]),
+            "on_header_value": lambda data, start, end: self._header_value.extend(data[start:end]),
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": lambda: self.events.append(("headers", self._headers))
+        }
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        self.events.append(("data", data[start:end]))
+
+    def _on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+async def receive_upload(request: Request, path_for: Callable[[str], str], file_field: str = "file") -> ReceivedUpload:
+    """流式接收multipart/form-data上传
+
+    文件内容边接收边写入path_for(文件名)返回的路径并计算sha256，超过MAX_FILE_SIZE时立即中止；
+    接收完成后读取zip中央目录校验插件包。出错时删除已写入的文件并抛出UploadError。
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError("请求格式错误，应为multipart/form-data")
+
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > settings.MAX_FILE_SIZE + MAX_FORM_FIELDS_SIZE:
+        raise UploadTooLarge()
+
+    collector = _MultipartEvents()
+    parser = MultipartParser(boundary, collector.callbacks())
+    fields: Dict[str, str] = {}
+    fields_size = 0
+    filename: Optional[str] = None
+    writer: Optional[UploadWriter] = None
+    # 当前分段：("file", None) 或 ("field", 字段名)
+    part: Optional[Tuple[str, Optional[str]]] = None
+    value = bytearray()
+
+    async def handle_events():
+        nonlocal part, filename, writer, fields_size
+        for kind, payload in collector.events:
+            if kind == "headers":
+                _, options = parse_options_header(payload.get(b"content-disposition", b""))
+                name = options.get(b"name", b"").decode("utf-8", "replace")
+                if name == file_field and b"filename" in options:
+                    if writer is not None:
+                        raise UploadError("只能上传一个文件")
+                    filename = check_package_filename(options[b"filename"].decode("utf-8", "replace"))
+                    writer = await UploadWriter(path_for(filename)).open()
+                    part = ("file", None)
+                else:
+                    part = ("field", name)
+                    value.clear()
+            elif kind == "data":
+                if part[0] == "file":
+                    await writer.write(payload)
+                else:
+                    fields_size += len(payload)
+                    if fields_size > MAX_FORM_FIELDS_SIZE:
+                        raise UploadError("表单字段过大")
+                    value.extend(payload)
+            elif kind == "end":
+                if part and part[0] == "field":
+                    fields[part[1]] = value.decode("utf-8", "replace")
+                part = None
+        collector.events.clear()
+
+    try:
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                await handle_events()
+            parser.finalize()
+        except MultipartParseError as e:
+            raise UploadError(f"请求格式错误: {e}")
+        await handle_events()
+
+        if writer is None:
+            raise UploadError("未上传文件")
+        await writer.close()
+        await asyncio.to_thread(validate_package, writer.path)
+    except BaseException:
+        if writer is not None:
+            await writer.abort()
+        raise
+
+    return ReceivedUpload(filename=filename, path=writer.path, size=writer.size, sha256=writer.sha256, fields=fields)
@@ -1,139 +1,396 @@
-from typing import Dict, List
+from typing import Dict, List, Optional, Set, Iterable
+from collections import deque, OrderedDict
 from fastapi import WebSocket
 import json
 import asyncio
 from datetime import datetime
 
 from app.models.task import TaskProgress
+from app.core.config import settings
+from app.services.event_bus import EventBus, InMemoryEventBus, create_event_bus
+
+# 消息类型：日志在队列满时优先丢弃，进度按任务合并只保留最新一条
+KIND_PROGRESS = "progress"
+KIND_LOG = "log"
+KIND_OTHER = "other"
+
+class WebSocketConnection:
+    """单个WebSocket连接及其发送队列
+
+    生产者只做非阻塞入队，由每个连接独立的写协程负责发送，慢连接不会拖慢任务执行。
+    队列满时按WS_OVERFLOW_POLICY处理：drop_oldest丢弃最早的日志（进度始终保留最新一条），
+    disconnect直接断开；单条消息发送超过WS_SEND_TIMEOUT的连接视为慢连接并断开。
+    """
+
+    def __init__(self, websocket: WebSocket, manager: "WebSocketManager"):
+        self.websocket = websocket
+        self.manager = manager
+        self.max_size = max(settings.WS_SEND_QUEUE_SIZE, 1)
+        # 队列元素为[类型, 合并键, 消息文本]，同一任务的进度只保留最新一条
+        self._queue: deque = deque()
+        self._progress: Dict[str, list] = {}
+        self._ready = asyncio.Event()
+        self._writer: Optional[asyncio.Task] = None
+        self.closed = False
+        self.dropped = 0
+        # 订阅的任务ID，以及是否订阅全部任务
+        self.task_ids: Set[str] = set()
+        self.all_tasks = False
+
+    def start(self):
+        """启动写协程"""
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, kind: str, text: str, key: Optional[str] = None):
+        """非阻塞入队"""
+        if self.closed:
+            return
+
+        if kind == KIND_PROGRESS and key is not None:
+            entry = self._progress.pop(key, None)
+            if entry is not None:
+                # 丢弃尚未发出的旧进度，最新进度排到队尾，保证消息按seq顺序发出
+                self._queue.remove(entry)
+
+        if len(self._queue) >= self.max_size and not self._make_room():
+            print("WebSocket send queue overflow, disconnecting slow client")
+            self.manager.remove_connection(self)
+            return
+
+        entry = [kind, key, text]
+        self._queue.append(entry)
+        if kind == KIND_PROGRESS and key is not None:
+            self._progress[key] = entry
+        self._ready.set()
+
+    def send(self, message: dict):
+        """发送控制消息（同样经过发送队列）"""
+        self.enqueue(KIND_OTHER, json.dumps(message, ensure_ascii=False))
+
+    def _make_room(self) -> bool:
+        """按溢出策略腾出一个位置，返回False表示应断开连接"""
+        if settings.WS_OVERFLOW_POLICY == "disconnect":
+            return False
+
+        # 优先丢弃最早的日志，没有日志时丢弃最早的其他消息
+        victim = next((entry for entry in self._queue if entry[0] == KIND_LOG), None)
+        if victim is None:
+            victim = self._queue[0]
+        self._queue.remove(victim)
+        if victim[0] == KIND_PROGRESS:
+            self._progress.pop(victim[1], None)
+        self.dropped += 1
+        return True
+
+    async def _write_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self._queue:
+                    kind, key, _ = entry = self._queue.popleft()
+                    if kind == KIND_PROGRESS:
+                        self._progress.pop(key, None)
+                    await asyncio.wait_for(self.websocket.send_text(entry[2]), timeout=settings.WS_SEND_TIMEOUT)
+                self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except asyncio.TimeoutError:
+            print(f"WebSocket send timed out after {settings.WS_SEND_TIMEOUT}s, disconnecting slow client")
+            self.manager.remove_connection(self)
+        except Exception as e:
+            print(f"Failed to send message to websocket: {e}")
+            self.manager.remove_connection(self)
+
+    def close(self):
+        """停止写协程并关闭连接"""
+        if self.closed:
+            return
+        self.closed = True
+        self._queue.clear()
+        self._progress.clear()
+        if self._writer and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        asyncio.create_task(self._close_socket())
+
+    async def _close_socket(self):
+        try:
+            await self.websocket.close()
+        except Exception:
+            pass
+
+class TaskEventBuffer:
+    """单个任务最近的进度和日志事件（环形缓冲），用于断线重连后补发"""
+
+    def __init__(self, size: int):
+        self.seq = 0
+        self.events: deque = deque(maxlen=max(size, 1))
+
+    def record(self, seq: int, kind: str, message_text: str):
+        """记录事件"""
+        if seq <= self.seq:
+            # 序号回退说明发布方已重置计数（如任务在其他进程重新执行），旧事件不再可用
+            self.events.clear()
+        self.seq = seq
+        self.events.append((seq, kind, message_text))
+
+    def since(self, seq: int) -> Optional[List[tuple]]:
+        """获取序号大于seq的事件，缓冲区已不包含全部缺失事件时返回None"""
+        if seq > self.seq:
+            # 序号大于当前值（如服务重启后计数重置），无法判断缺失的事件
+            return None
+        first_seq = self.events[0][0] if self.events else self.seq + 1
+        if seq + 1 < first_seq:
+            return None
+        return [event for event in self.events if event[0] > seq]
 
 class WebSocketManager:
     """WebSocket连接管理器"""
-    
+
     def __init__(self):
-        # 存储每个任务的WebSocket连接
-        self.connections: Dict[str, List[WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket, task_id: str):
-        """连接WebSocket"""
+        # 存储每个任务的订阅连接
+        self.connections: Dict[str, List[WebSocketConnection]] = {}
+        # 订阅全部任务的连接
+        self.all_connections: List[WebSocketConnection] = []
+        # 所有活动连接（一个连接可以订阅多个任务）
+        self.sockets: Dict[int, WebSocketConnection] = {}
+        # 合并任务的跟随者：领队任务的消息会镜像给跟随者的连接
+        self.followers: Dict[str, List[str]] = {}
+        # 各任务的最近事件（按最近使用淘汰，最多保留WS_REPLAY_MAX_TASKS个任务）
+        self.buffers: "OrderedDict[str, TaskEventBuffer]" = OrderedDict()
+        # 本进程发布的各任务事件序号
+        self.sequences: "OrderedDict[str, int]" = OrderedDict()
+        # 事件总线：未启动时在本进程内直接处理
+        self.bus: EventBus = InMemoryEventBus()
+        self.bus.handler = self._deliver
+
+    async def start(self, bus: Optional[EventBus] = None):
+        """启动事件总线（按EVENT_BUS配置），之后本进程的连接也能收到其他进程发布的事件"""
+        bus = bus or create_event_bus()
+        await bus.start(self._deliver)
+        self.bus = bus
+
+    async def stop(self):
+        """停止事件总线"""
+        bus = self.bus
+        self.bus = InMemoryEventBus()
+        self.bus.handler = self._deliver
+        await bus.stop()
+
+    async def connect(
+        self,
+        websocket: WebSocket,
+        task_id: Optional[str] = None,
+        since: Optional[int] = None
+    ) -> WebSocketConnection:
+        """连接WebSocket，指定task_id时订阅该任务（指定since时先补发序号之后的事件）"""
         await websocket.accept()
-        
-        if task_id not in self.connections:
-            self.connections[task_id] = []
-        
-        self.connections[task_id].append(websocket)
-        print(f"WebSocket connected for task {task_id}, total connections: {len(self.connections[task_id])}")
-    
-    def disconnect(self, websocket: WebSocket, task_id: str):
-        """断开WebSocket连接"""
-        if task_id in self.connections:
-            if websocket in self.connections[task_id]:
-                self.connections[task_id].remove(websocket)
-            
+
+        connection = WebSocketConnection(websocket, self)
+        connection.start()
+        self.sockets[id(websocket)] = connection
+        if task_id:
+            self.subscribe(connection, [task_id], since={task_id: since} if since is not None else None)
+            print(f"WebSocket connected for task {task_id}, total connections: {len(self.connections[task_id])}")
+        else:
+            print(f"WebSocket connected, total sockets: {len(self.sockets)}")
+        return connection
+
+    def subscribe(
+        self,
+        connection: WebSocketConnection,
+        task_ids: Iterable[str] = (),
+        all_tasks: bool = False,
+        since: Optional[Dict[str, int]] = None
+    ):
+        """为连接订阅任务（all_tasks为True时订阅全部任务）
+
+        since为{task_id: seq}时先补发各任务序号之后的事件，再接收实时事件；
+        缓冲区已不包含全部缺失事件时发送replay_gap消息，客户端应通过REST接口重新获取。
+        """
+        for task_id, seq in (since or {}).items():
+            self._replay(connection, task_id, seq)
+
+        for task_id in task_ids:
+            if task_id in connection.task_ids:
+                continue
+            connection.task_ids.add(task_id)
+            self.connections.setdefault(task_id, []).append(connection)
+
+        if all_tasks and not connection.all_tasks:
+            connection.all_tasks = True
+            self.all_connections.append(connection)
+
+    def unsubscribe(self, connection: WebSocketConnection, task_ids: Iterable[str] = (), all_tasks: bool = False):
+        """取消连接对任务的订阅"""
+        for task_id in task_ids:
+            if task_id not in connection.task_ids:
+                continue
+            connection.task_ids.discard(task_id)
+            connections = self.connections.get(task_id, [])
+            if connection in connections:
+                connections.remove(connection)
             # 如果没有连接了，删除task_id
-            if not self.connections[task_id]:
-                del self.connections[task_id]
-        
-        print(f"WebSocket disconnected for task {task_id}")
-    
+            if not connections:
+                self.connections.pop(task_id, None)
+
+        if all_tasks and connection.all_tasks:
+            connection.all_tasks = False
+            self.all_connections.remove(connection)
+
+    def disconnect(self, websocket: WebSocket, task_id: Optional[str] = None):
+        """断开WebSocket连接"""
+        connection = self.sockets.get(id(websocket))
+        if connection:
+            self.remove_connection(connection)
+
+        if task_id:
+            print(f"WebSocket disconnected for task {task_id}")
+        else:
+            print("WebSocket disconnected")
+
+    def remove_connection(self, connection: WebSocketConnection):
+        """移除连接及其全部订阅（客户端断开、发送失败或慢连接）"""
+        connection.close()
+        self.unsubscribe(connection, list(connection.task_ids), all_tasks=True)
+        if self.sockets.get(id(connection.websocket)) is connection:
+            del self.sockets[id(connection.websocket)]
+
+    def add_follower(self, leader_id: str, follower_id: str):
+        """登记跟随者，之后领队任务的消息会同时推送给跟随者"""
+        followers = self.followers.setdefault(leader_id, [])
+        if follower_id not in followers:
+            followers.append(follower_id)
+
+    def remove_follower(self, leader_id: str, follower_id: str):
+        """移除单个跟随者"""
+        followers = self.followers.get(leader_id, [])
+        if follower_id in followers:
+            followers.remove(follower_id)
+        if not followers:
+            self.followers.pop(leader_id, None)
+
+    def remove_followers(self, leader_id: str):
+        """移除领队任务的所有跟随者"""
+        self.followers.pop(leader_id, None)
+
+    def _mirror_targets(self, task_id: str) -> List[str]:
+        """获取需要接收该任务消息的任务ID（自身及其跟随者）"""
+        return [task_id] + self.followers.get(task_id, [])
+
+    def _replay(self, connection: WebSocketConnection, task_id: str, seq: int):
+        """补发任务序号seq之后的事件"""
+        buffer = self.buffers.get(task_id)
+        if buffer is None:
+            # 没有该任务的事件记录（尚未开始或已被淘汰）
+            if seq > 0:
+                connection.send({"task_id": task_id, "type": "replay_gap", "data": {"task_id": task_id, "since": seq, "seq": 0}})
+            return
+
+        events = buffer.since(seq)
+        if events is None:
+            connection.send({"task_id": task_id, "type": "replay_gap", "data": {"task_id": task_id, "since": seq, "seq": buffer.seq}})
+            return
+        for _, kind, message_text in events:
+            connection.enqueue(kind, message_text, key=task_id)
+
+    def _buffer(self, task_id: str) -> TaskEventBuffer:
+        buffer = self.buffers.get(task_id)
+        if buffer is None:
+            buffer = self.buffers[task_id] = TaskEventBuffer(settings.WS_REPLAY_BUFFER_SIZE)
+            while len(self.buffers) > settings.WS_REPLAY_MAX_TASKS:
+                self.buffers.popitem(last=False)
+        else:
+            self.buffers.move_to_end(task_id)
+        return buffer
+
+    def _next_seq(self, task_id: str) -> int:
+        seq = self.sequences.pop(task_id, 0) + 1
+        self.sequences[task_id] = seq
+        while len(self.sequences) > settings.WS_REPLAY_MAX_TASKS:
+            self.sequences.popitem(last=False)
+        return seq
+
+    def _enqueue(self, task_id: Optional[str], kind: str, message: dict):
+        """发布消息，消息带有task_id以便多路复用（task_id为None时发给所有连接）
+
+        进度和日志按任务分配递增序号，其他消息不分配序号。
+        """
+        seq = None
+        if task_id is not None:
+            message = {"task_id": task_id, **message}
+            if kind in (KIND_PROGRESS, KIND_LOG):
+                seq = self._next_seq(task_id)
+                message["seq"] = seq
+
+        self.bus.publish({
+            "task_id": task_id,
+            "kind": kind,
+            "seq": seq,
+            "text": json.dumps(message, ensure_ascii=False)
+        })
+
+    def _deliver(self, event: dict):
+        """处理事件总线收到的事件：记入缓冲区并放入本进程相关连接的发送队列"""
+        task_id = event.get("task_id")
+        kind = event.get("kind", KIND_OTHER)
+        message_text = event["text"]
+
+        if task_id is None:
+            for connection in list(self.sockets.values()):
+                connection.enqueue(kind, message_text)
+            return
+
+        if event.get("seq") is not None:
+            self._buffer(task_id).record(event["seq"], kind, message_text)
+
+        connections = self.connections.get(task_id, [])
+        subscribers = list(connections) + [c for c in self.all_connections if c not in connections]
+        for connection in subscribers:
+            connection.enqueue(kind, message_text, key=task_id)
+
     async def send_progress(self, task_id: str, progress: TaskProgress):
         """发送进度信息"""
-        if task_id not in self.connections:
-            return
-        
-        # 准备消息数据
-        message = {
-            "type": "progress",
-            "data": {
-                "task_id": progress.task_id,
-                "status": progress.status,
-                "progress": progress.progress,
-                "current_step": progress.current_step,
-                "message": progress.message,
-                "timestamp": progress.timestamp.isoformat()
-            }
-        }
-        
-        message_text = json.dumps(message, ensure_ascii=False)
-        
-        # 发送给所有连接
-        disconnected_connections = []
-        
-        for websocket in self.connections[task_id]:
-            try:
-                await websocket.send_text(message_text)
-            except Exception as e:
-                print(f"Failed to send message to websocket: {e}")
-                disconnected_connections.append(websocket)
-        
-        # 清理断开的连接
-        for websocket in disconnected_connections:
-            self.disconnect(websocket, task_id)
-    
+        for target_id in self._mirror_targets(task_id):
+            self._enqueue(target_id, KIND_PROGRESS, {
+                "type": "progress",
+                "data": {
+                    "task_id": target_id,
+                    "status": progress.status,
+                    "progress": progress.progress,
+                    "current_step": progress.current_step,
+                    "message": progress.message,
+                    "timestamp": progress.timestamp.isoformat()
+                }
+            })
+
     async def send_log(self, task_id: str, log_line: str):
         """发送实时日志"""
-        if task_id not in self.connections:
-            return
-        
-        # 准备日志消息
-        message = {
-            "type": "log",
-            "data": {
-                "task_id": task_id,
-                "log": log_line,
-                "timestamp": datetime.now().isoformat()
-            }
-        }
-        
-        message_text = json.dumps(message, ensure_ascii=False)
-        
-        # 发送给所有连接
-        disconnected_connections = []
-        
-        for websocket in self.connections[task_id]:
-            try:
-                await websocket.send_text(message_text)
-            except Exception as e:
-                print(f"Failed to send log to websocket: {e}")
-                disconnected_connections.append(websocket)
-        
-        # 清理断开的连接
-        for websocket in disconnected_connections:
-            self.disconnect(websocket, task_id)
-    
+        for target_id in self._mirror_targets(task_id):
+            self._enqueue(target_id, KIND_LOG, {
+                "type": "log",
+                "data": {
+                    "task_id": target_id,
+                    "log": log_line,
+                    "timestamp": datetime.now().isoformat()
+                }
+            })
+
     async def send_message(self, task_id: str, message_type: str, data: dict):
         """发送自定义消息"""
-        if task_id not in self.connections:
-            return
-        
-        message = {
+        self._enqueue(task_id, KIND_OTHER, {
             "type": message_type,
             "data": data,
             "timestamp": datetime.now().isoformat()
-        }
-        
-        message_text = json.dumps(message, ensure_ascii=False)
-        
-        disconnected_connections = []
-        
-        for websocket in self.connections[task_id]:
-            try:
-                await websocket.send_text(message_text)
-            except Exception as e:
-                print(f"Failed to send custom message to websocket: {e}")
-                disconnected_connections.append(websocket)
-        
-        # 清理断开的连接
-        for websocket in disconnected_connections:
-            self.disconnect(websocket, task_id)
-    
+        })
+
     def get_connection_count(self, task_id: str) -> int:
         """获取指定任务的连接数"""
         return len(self.connections.get(task_id, []))
-    
+
     def get_all_connections_count(self) -> int:
         """获取总连接数"""
-        return sum(len(connections) for connections in self.connections.values())
-    
+        return len(self.sockets)
+
     async def broadcast_system_message(self, message: str):
         """广播系统消息给所有连接"""
         system_message = {
@@ -143,19 +400,5 @@ class WebSocketManager:
                 "timestamp": datetime.now().isoformat()
             }
         }
-        
-        message_text = json.dumps(system_message, ensure_ascii=False)
-        
-        for task_id, connections in self.connections.items():
-            disconnected_connections = []
-            
-            for websocket in connections:
-                try:
-                    await websocket.send_text(message_text)
-                except Exception as e:
-                    print(f"Failed to broadcast system message: {e}")
-                    disconnected_connections.append(websocket)
-            
-            # 清理断开的连接
-            for websocket in disconnected_connections:
-                self.disconnect(websocket, task_id)
\ No newline at end of file
+
+        self._enqueue(None, KIND_OTHER, system_message)
@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from typing import Optional, Dict, List, Callable, Awaitable
+from urllib.parse import urlparse, unquote
+
+import aiofiles
+import httpx
+
+from app.core.config import settings
+from app.services.cache_service import compute_file_sha256
+from app.services.resolver import ResolvedDistribution
+
+FETCH_CHUNK_SIZE = 64 * 1024
+
+# 可重试的HTTP状态码
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class FetchError(Exception):
+    """依赖下载错误"""
+    pass
+
+class _RetryableFetchError(FetchError):
+    pass
+
+@dataclass
+class FetchProgress:
+    """依赖下载进度（bytes_total为按已知文件平均大小估算的总字节数）"""
+    files_done: int
+    files_total: int
+    bytes_done: int
+    bytes_total: int
+
+class WheelFetcher:
+    """并发依赖下载器
+
+    复用同一个keep-alive连接池并发下载已解析的依赖文件，限制总并发数和单个主机的并发数，
+    网络错误和5xx响应按指数退避重试，下载过程中同步校验sha256并按字节汇报进度。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        per_host_limit: Optional[int] = None,
+        retries: Optional[int] = None,
+        backoff: Optional[float] = None,
+        on_progress: Optional[Callable[[FetchProgress], Awaitable[None]]] = None,
+        on_log: Optional[Callable[[str], Awaitable[None]]] = None,
+        progress_interval: float = 0.5
+    ):
+        self.max_concurrency = max_concurrency or settings.WHEEL_FETCH_CONCURRENCY
+        self.per_host_limit = per_host_limit or settings.WHEEL_FETCH_PER_HOST
+        self.retries = settings.WHEEL_FETCH_RETRIES if retries is None else retries
+        self.backoff = settings.WHEEL_FETCH_BACKOFF if backoff is None else backoff
+        self.on_progress = on_progress
+        self.on_log = on_log
+        self.progress_interval = progress_interval
+
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._host_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._files_total = 0
+        self._files_done = 0
+        self._bytes_done = 0
+        self._bytes_expected: Dict[str, int] = {}
+        self._last_report = 0.0
+        self._report_lock = asyncio.Lock()
+
+    async def fetch_all(self, distributions: List[ResolvedDistribution], dest_dir: str) -> Dict[str, str]:
+        """并发下载所有依赖文件，返回 文件名 -> 本地路径"""
+        os.makedirs(dest_dir, exist_ok=True)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._host_semaphores = {}
+        self._files_total = len(distributions)
+        self._files_done = 0
+        self._bytes_done = 0
+        self._bytes_expected = {}
+
+        limits = httpx.Limits(
+            max_connections=self.max_concurrency,
+            max_keepalive_connections=self.max_concurrency
+        )
+        timeout = httpx.Timeout(60.0, connect=30.0)
+        results: Dict[str, str] = {}
+
+        async with httpx.AsyncClient(follow_redirects=True, timeout=timeout, limits=limits) as client:
+            async with asyncio.TaskGroup() as group:
+                for distribution in distributions:
+                    group.create_task(self._fetch_with_retry(client, distribution, dest_dir, results))
+
+        await self._report(force=True)
+        return results
+
+    async def _fetch_with_retry(self, client: httpx.AsyncClient, distribution: ResolvedDistribution, dest_dir: str, results: Dict[str, str]):
+        dest_path = os.path.join(dest_dir, distribution.filename)
+        host = urlparse(distribution.url).netloc
+        host_semaphore = self._host_semaphores.setdefault(host, asyncio.Semaphore(self.per_host_limit))
+
+        for attempt in range(self.retries + 1):
+            try:
+                # 先等待主机槽位再占用全局槽位，排队等待繁忙主机的下载不占用其他主机可用的槽位
+                async with host_semaphore, self._semaphore:
+                    await self._fetch(client, distribution, dest_path)
+                results[distribution.filename] = dest_path
+                self._files_done += 1
+                await self._report(force=True)
+                return
+            except _RetryableFetchError as e:
+                if attempt >= self.retries:
+                    raise FetchError(f"{distribution.filename} 下载失败（已重试{self.retries}次）: {e}")
+                delay = self.backoff * (2 ** attempt)
+                await self._log(f"Retry {distribution.filename} in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def _fetch(self, client: httpx.AsyncClient, distribution: ResolvedDistribution, dest_path: str) -> int:
+        """下载单个文件，返回写入的字节数"""
+        parsed = urlparse(distribution.url)
+        if parsed.scheme == "file":
+            await asyncio.to_thread(shutil.copyfile, unquote(parsed.path), dest_path)
+            if distribution.sha256:
+                actual = await asyncio.to_thread(compute_file_sha256, dest_path)
+                if actual != distribution.sha256:
+                    os.remove(dest_path)
+                    # 本地文件重试也不会变化，直接失败
+                    raise FetchError(f"{distribution.filename} sha256校验失败: 期望 {distribution.sha256}，实际 {actual}")
+            size = os.path.getsize(dest_path)
+            self._bytes_expected[distribution.filename] = size
+            self._bytes_done += size
+            return size
+
+        digest = hashlib.sha256()
+        received = 0
+        try:
+            async with client.stream("GET", distribution.url) as response:
+                if response.status_code in RETRYABLE_STATUS_CODES:
+                    raise _RetryableFetchError(f"HTTP {response.status_code}")
+                if response.status_code != 200:
+                    raise FetchError(f"{distribution.filename} 下载失败: HTTP {response.status_code}")
+
+                content_length = response.headers.get("Content-Length")
+                if content_length and content_length.isdigit():
+                    self._bytes_expected[distribution.filename] = int(content_length)
+
+                async with aiofiles.open(dest_path, "wb") as f:
+                    async for chunk in response.aiter_bytes(FETCH_CHUNK_SIZE):
+                        await f.write(chunk)
+                        digest.update(chunk)
+                        received += len(chunk)
+                        self._bytes_done += len(chunk)
+                        await self._report()
+        except httpx.TransportError as e:
+            self._bytes_done -= received
+            raise _RetryableFetchError(str(e) or e.__class__.__name__)
+        except _RetryableFetchError:
+            self._bytes_done -= received
+            raise
+
+        if distribution.sha256 and digest.hexdigest() != distribution.sha256:
+            self._bytes_done -= received
+            raise _RetryableFetchError(f"sha256校验失败: 期望 {distribution.sha256}，实际 {digest.hexdigest()}")
+        return received
+
+    async def _report(self, force: bool = False):
+        """节流汇报下载进度（串行调用回调，汇报进行中时跳过非强制汇报）"""
+        if not self.on_progress:
+            return
+        if not force and (self._report_lock.locked() or time.monotonic() - self._last_report < self.progress_interval):
+            return
+
+        async with self._report_lock:
+            await self._send_progress()
+
+    async def _send_progress(self):
+        self._last_report = time.monotonic()
+
+        # 尚未开始下载的文件按已知文件的平均大小估算
+        known_bytes = sum(self._bytes_expected.values())
+        known_files = len(self._bytes_expected)
+        bytes_total = known_bytes
+        if known_files:
+            bytes_total += known_bytes // known_files * max(self._files_total - known_files, 0)
+
+        await self.on_progress(FetchProgress(
+            files_done=self._files_done,
+            files_total=self._files_total,
+            bytes_done=self._bytes_done,
+            bytes_total=bytes_total
+        ))
+
+    async def _log(self, line: str):
+        if self.on_log:
+            await self.on_log(line)
@@ -0,0 +1,121 @@
+import os
+import shutil
+from typing import Optional, Dict, Any
+
+from app.core.config import settings
+from app.services.cache_service import compute_file_sha256, link_or_copy
+
+class Wheelhouse:
+    """跨任务共享的依赖仓库
+
+    依赖文件按sha256和文件名存放在WHEELHOUSE_DIR/<sha256前两位>/<sha256>/<文件名>，
+    任务的wheels目录通过硬链接（跨文件系统时复制）填充。每次使用都会刷新文件修改时间，
+    超出WHEELHOUSE_MAX_SIZE时按最近最少使用淘汰。
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def root(self) -> str:
+        return settings.WHEELHOUSE_DIR
+
+    @property
+    def enabled(self) -> bool:
+        return settings.WHEELHOUSE_ENABLED
+
+    def path_for(self, filename: str, sha256: str) -> str:
+        """获取依赖文件在仓库中的路径"""
+        return os.path.join(self.root, sha256[:2], sha256, filename)
+
+    def lookup(self, filename: str, sha256: Optional[str]) -> Optional[str]:
+        """查找依赖文件，命中时刷新其使用时间"""
+        if not self.enabled or not sha256:
+            self.misses += 1
+            return None
+
+        path = self.path_for(filename, sha256)
+        if not os.path.exists(path):
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return path
+
+    def add(self, src_path: str, filename: str, sha256: Optional[str] = None, verified: bool = False) -> str:
+        """将下载好的依赖文件加入仓库，返回仓库中的路径（sha256不一致时抛出ValueError）
+
+        verified为True表示调用方已在下载时校验过sha256，不再重新计算。
+        """
+        actual_sha256 = sha256 if verified and sha256 else compute_file_sha256(src_path)
+        if sha256 and actual_sha256 != sha256:
+            raise ValueError(f"{filename} 校验失败: 期望 {sha256}，实际 {actual_sha256}")
+
+        path = self.path_for(filename, actual_sha256)
+        if not self.enabled:
+            return src_path
+
+        link_or_copy(src_path, path)
+        return path
+
+    def link_into(self, store_path: str, dest_dir: str, filename: str) -> str:
+        """将仓库中的依赖文件链接到任务的wheels目录"""
+        dest_path = os.path.join(dest_dir, filename)
+        link_or_copy(store_path, dest_path)
+        return dest_path
+
+    def evict(self) -> int:
+        """按最近使用时间淘汰超出大小限制的依赖文件，返回删除的文件数"""
+        if not os.path.exists(self.root):
+            return 0
+
+        entries = []
+        total_size = 0
+        for root, _, files in os.walk(self.root):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total_size += stat.st_size
+
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total_size <= settings.WHEELHOUSE_MAX_SIZE:
+                break
+            try:
+                os.remove(path)
+                shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+            removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """获取仓库统计"""
+        files = 0
+        total_size = 0
+        if os.path.exists(self.root):
+            for root, _, names in os.walk(self.root):
+                for name in names:
+                    files += 1
+                    total_size += os.path.getsize(os.path.join(root, name))
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "files": files,
+            "total_size": total_size,
+            "max_size": settings.WHEELHOUSE_MAX_SIZE
+        }
+
+# 全局依赖仓库
+wheelhouse = Wheelhouse()
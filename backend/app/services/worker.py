@@ -0,0 +1,141 @@
+import asyncio
+import logging
+from typing import Optional, Dict, List
+from sqlalchemy import select
+
+from app.models.task import Task, TaskStatus
+from app.core.config import settings
+from app.core.database import async_session_maker
+from app.services.leases import LeaseKeeper, RUNNING_STATUSES, retry_due
+from app.services.progress_store import progress_store
+from app.services.websocket_service import WebSocketManager
+
+logger = logging.getLogger(__name__)
+
+class TaskWorker:
+    """独立任务执行节点
+
+    从共享数据库的pending任务中按优先级认领（带租约），执行与API进程相同的打包流水线，
+    进度写入共享数据库并通过事件总线（EVENT_BUS=redis）推送给API进程的WebSocket连接。
+    缓存键与运行中任务相同的pending任务暂不认领，待其完成后直接复用结果缓存。
+    """
+
+    def __init__(self, concurrency: Optional[int] = None, websocket_manager: Optional[WebSocketManager] = None):
+        self.concurrency = concurrency or settings.MAX_CONCURRENT_TASKS
+        self.websocket_manager = websocket_manager or WebSocketManager()
+        self.leases = LeaseKeeper(on_lost=self._on_lease_lost)
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+
+    @property
+    def owner(self) -> str:
+        return self.leases.owner
+
+    def stop(self):
+        """停止认领新任务，运行中的任务完成（最多等待SHUTDOWN_GRACE_PERIOD秒）后退出"""
+        if not self._stopping:
+            logger.info(f"Worker {self.owner} stopping, waiting for {len(self._tasks)} running tasks")
+        self._stopping = True
+        self._wakeup.set()
+
+    async def run(self):
+        """运行执行节点，直到stop()被调用且运行中的任务全部结束或重新排队"""
+        await progress_store.start()
+        await self.websocket_manager.start()
+        await self.leases.start()
+        logger.info(f"Worker {self.owner} started with concurrency {self.concurrency}")
+        try:
+            while not self._stopping:
+                free = self.concurrency - len(self._tasks)
+                if free > 0:
+                    try:
+                        await self._claim_next(free)
+                    except Exception as e:
+                        logger.error(f"Failed to claim tasks: {e}")
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=settings.WORKER_POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+
+            requeued = await self.leases.drain(self._tasks, websocket_manager=self.websocket_manager)
+            if requeued:
+                logger.info(f"Worker {self.owner} requeued {len(requeued)} interrupted tasks: {requeued}")
+        finally:
+            await self.leases.stop()
+            await self.websocket_manager.stop()
+            await progress_store.stop()
+            logger.info(f"Worker {self.owner} stopped")
+
+    async def _claim_next(self, limit: int):
+        """认领最多limit个待处理任务"""
+        for task_id in await self._candidates(limit):
+            if await self.leases.claim(task_id):
+                logger.info(f"Worker {self.owner} claimed task {task_id}")
+                self._tasks[task_id] = asyncio.create_task(self._execute(task_id))
+
+    async def _candidates(self, limit: int) -> List[str]:
+        """按优先级获取可认领的pending任务
+
+        跳过与运行中任务缓存键相同的任务；多个待处理任务缓存键相同时只取优先的一个，
+        其余任务在它完成后通过结果缓存完成。
+        """
+        running_keys = (
+            select(Task.cache_key)
+            .where(Task.status.in_(RUNNING_STATUSES), Task.cache_key.is_not(None))
+        )
+        async with async_session_maker() as db:
+            result = await db.stream(
+                select(Task.task_id, Task.cache_key)
+                .where(
+                    Task.status == TaskStatus.PENDING.value,
+                    Task.leader_task_id.is_(None),
+                    retry_due(),
+                    (Task.cache_key.is_(None)) | (Task.cache_key.not_in(running_keys))
+                )
+                .order_by(Task.priority.desc(), Task.id)
+            )
+            task_ids = []
+            seen_keys = set()
+            async for task_id, cache_key in result:
+                if cache_key in seen_keys:
+                    continue
+                if cache_key:
+                    seen_keys.add(cache_key)
+                task_ids.append(task_id)
+                if len(task_ids) >= limit:
+                    break
+            await result.close()
+            return task_ids
+
+    async def _execute(self, task_id: str):
+        """执行已认领的任务"""
+        from app.services.task_service import TaskService
+
+        try:
+            async with async_session_maker() as db:
+                service = TaskService(db)
+                result = await db.execute(select(Task).where(Task.task_id == task_id))
+                task = result.scalar_one_or_none()
+                if task is None:
+                    return
+                # 相同任务已由其他节点完成时直接复用结果
+                if await service._complete_from_cache(task):
+                    logger.info(f"Task {task_id} completed from result cache")
+                    return
+                await service._process_task(task_id, self.websocket_manager)
+        except asyncio.CancelledError:
+            logger.warning(f"Task {task_id} was stopped on worker {self.owner}")
+        except Exception as e:
+            logger.error(f"Worker {self.owner} failed to run task {task_id}: {e}")
+        finally:
+            self._tasks.pop(task_id, None)
+            await self.leases.release(task_id)
+            self._wakeup.set()
+
+    def _on_lease_lost(self, task_id: str):
+        task = self._tasks.get(task_id)
+        if task:
+            task.cancel()
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import shutil
+from typing import Dict, Any, List
+
+from app.core.config import settings
+
+def package_stem(mode: str, parameters: Dict[str, Any]) -> str:
+    """获取插件包的基础名称（与plugin_repackaging.sh的命名规则一致）"""
+    if mode == "market":
+        return f"{parameters.get('author')}-{parameters.get('name')}_{parameters.get('version')}"
+    if mode == "github":
+        asset_name = parameters.get("asset_name", "")
+        if asset_name.endswith(".difypkg"):
+            asset_name = asset_name[:-len(".difypkg")]
+        return f"{asset_name}-{parameters.get('release')}"
+    file_name = parameters.get("file_name", "unknown.difypkg")
+    return os.path.splitext(os.path.basename(file_name))[0]
+
+def output_filename(mode: str, parameters: Dict[str, Any]) -> str:
+    """获取重新打包后的输出文件名"""
+    suffix = parameters.get("suffix") or "offline"
+    return f"{package_stem(mode, parameters)}-{suffix}.difypkg"
+
+def build_targets(parameters: Dict[str, Any]) -> List[Dict[str, str]]:
+    """获取任务的目标平台列表（未指定targets时为单个platform/suffix），后缀重复时抛出ValueError"""
+    targets = parameters.get("targets")
+    if not targets:
+        return [{
+            "platform": parameters.get("platform") or "",
+            "suffix": parameters.get("suffix") or "offline"
+        }]
+
+    result = []
+    for target in targets:
+        platform = (target.get("platform") or "").strip()
+        suffix = (target.get("suffix") or "").strip() or platform or "offline"
+        if any(item["suffix"] == suffix for item in result):
+            raise ValueError(f"目标平台的后缀重复: {suffix}")
+        result.append({"platform": platform, "suffix": suffix})
+    return result
+
+class TaskWorkspace:
+    """任务独立的临时工作目录
+
+    下载、解压和打包产物都放在WORK_DIR/<task_id>下，任务结束（成功、失败或取消）时整体删除，
+    并发任务之间互不干扰。
+    """
+
+    def __init__(self, task_id: str):
+        self.task_id = task_id
+        self.path = os.path.join(settings.WORK_DIR, task_id)
+
+    def file_path(self, filename: str) -> str:
+        """获取工作目录下的文件路径"""
+        return os.path.join(self.path, filename)
+
+    async def create(self) -> "TaskWorkspace":
+        """创建工作目录（已存在的残留内容会被清空）"""
+        await self.cleanup()
+        os.makedirs(self.path, exist_ok=True)
+        return self
+
+    async def cleanup(self):
+        """删除工作目录"""
+        if os.path.exists(self.path):
+            await asyncio.to_thread(shutil.rmtree, self.path, True)
+
+    async def __aenter__(self) -> "TaskWorkspace":
+        return await self.create()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.cleanup()
@@ -1,15 +1,35 @@
 #!/usr/bin/env python3
 """
 启动脚本
+
+    python run.py              # 单进程（DEBUG=true时自动重载）
+    python run.py --workers 4  # 多进程，需设置EVENT_BUS=redis以跨进程推送任务进度
 """
+import argparse
 import uvicorn
 from app.core.config import settings
 
 if __name__ == "__main__":
-    uvicorn.run(
-        "app.main:app",
-        host=settings.HOST,
-        port=settings.PORT,
-        reload=settings.DEBUG,
-        log_level="info"
-    )
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Dify插件重新打包工具后端服务")
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数（默认1）")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        if settings.EVENT_BUS != "redis":
+            parser.error("多进程运行需要设置 EVENT_BUS=redis，否则WebSocket连接收不到其他进程中任务的进度")
+        # 多进程模式不支持自动重载
+        uvicorn.run(
+            "app.main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            workers=args.workers,
+            log_level="info"
+        )
+    else:
+        uvicorn.run(
+            "app.main:app",
+            host=settings.HOST,
+            port=settings.PORT,
+            reload=settings.DEBUG,
+            log_level="info"
+        )
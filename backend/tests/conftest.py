@@ -0,0 +1,19 @@
+import os
+import sys
+import tempfile
+
+# 测试使用临时目录中的数据库和存储目录，必须在导入app之前设置
+_TEST_ROOT = tempfile.mkdtemp(prefix="dify-repackaging-tests-")
+os.environ.update({
+    "DEBUG": "false",
+    "DATABASE_URL": f"sqlite+aiosqlite:///{os.path.join(_TEST_ROOT, 'app.db')}",
+    "UPLOAD_DIR": os.path.join(_TEST_ROOT, "uploads"),
+    "OUTPUT_DIR": os.path.join(_TEST_ROOT, "outputs"),
+    "CACHE_DIR": os.path.join(_TEST_ROOT, "cache"),
+    "WORK_DIR": os.path.join(_TEST_ROOT, "work"),
+    "LOG_DIR": os.path.join(_TEST_ROOT, "logs"),
+    "WHEELHOUSE_DIR": os.path.join(_TEST_ROOT, "wheels"),
+    "EVENT_BUS": "memory"
+})
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,84 @@
+import asyncio
+import hashlib
+import http.server
+import json
+import os
+import threading
+
+import pytest
+
+from app.services import downloader as downloader_module
+from app.services.downloader import ResumableDownloader
+
+DATA = bytes(range(256)) * 400
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """支持Range的静态文件，起始位置超出文件长度时返回416"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        start = 0
+        range_header = self.headers.get("Range")
+        if range_header and self.headers.get("If-Range") == '"v2"':
+            start = int(range_header.split("=")[1].rstrip("-"))
+            if start >= len(DATA):
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{len(DATA)}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{len(DATA) - 1}/{len(DATA)}")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(DATA) - start))
+        self.send_header("ETag", '"v2"')
+        self.end_headers()
+        self.wfile.write(DATA[start:])
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/plugin.difypkg"
+    server.shutdown()
+    server.server_close()
+
+def test_unsatisfiable_range_restarts_from_zero(server_url, tmp_path):
+    downloader = ResumableDownloader(retries=0)
+    partial_path = downloader.partial_path(server_url)
+
+    # 服务端资源已变短：部分文件比资源更长，元数据中的总长度已过时
+    os.makedirs(downloader.partial_dir, exist_ok=True)
+    with open(partial_path, "wb") as f:
+        f.write(b"x" * (len(DATA) + 100))
+    with open(f"{partial_path}.json", "w") as f:
+        json.dump({"url": server_url, "validator": '"v2"', "total": len(DATA) + 500}, f)
+
+    dest_path = tmp_path / "plugin.difypkg"
+    size = asyncio.run(downloader.download(server_url, str(dest_path), expected_sha256=hashlib.sha256(DATA).hexdigest()))
+
+    assert size == len(DATA)
+    assert dest_path.read_bytes() == DATA
+    assert not os.path.exists(partial_path)
+    assert not os.path.exists(f"{partial_path}.lock")
+
+def test_download_without_fcntl(server_url, tmp_path, monkeypatch):
+    # 没有fcntl的平台（Windows）退化为进程内互斥，不创建锁文件
+    monkeypatch.setattr(downloader_module, "fcntl", None)
+    downloader = ResumableDownloader(retries=0)
+
+    async def run():
+        return await asyncio.gather(*(
+            downloader.download(server_url, str(tmp_path / f"plugin-{index}.difypkg"))
+            for index in range(3)
+        ))
+
+    assert asyncio.run(run()) == [len(DATA)] * 3
+    for index in range(3):
+        assert (tmp_path / f"plugin-{index}.difypkg").read_bytes() == DATA
+    assert not downloader_module._held_locally
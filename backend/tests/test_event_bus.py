@@ -0,0 +1,45 @@
+import asyncio
+
+import fakeredis
+import redis.asyncio
+
+from app.services.event_bus import RedisEventBus
+
+async def _wait_for(events, count: int, timeout: float = 5.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while len(events) < count and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.01)
+
+def test_redis_event_bus_delivers_to_every_process(monkeypatch):
+    # 同一个FakeServer上的多个客户端相当于连接同一个Redis的多个进程
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.asyncio, "from_url", lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server))
+
+    async def run():
+        received = {"api": [], "worker": []}
+        api_bus = RedisEventBus(url="redis://fake", channel="test:events")
+        worker_bus = RedisEventBus(url="redis://fake", channel="test:events")
+        await api_bus.start(received["api"].append)
+        await worker_bus.start(received["worker"].append)
+        try:
+            # 等待两个订阅协程都已订阅频道
+            for _ in range(100):
+                if (await api_bus._client.pubsub_numsub("test:events"))[0][1] == 2:
+                    break
+                await asyncio.sleep(0.01)
+
+            events = [{"task_id": "t1", "kind": "progress", "seq": seq} for seq in range(1, 51)]
+            for event in events:
+                worker_bus.publish(event)
+            await _wait_for(received["api"], len(events))
+            await _wait_for(received["worker"], len(events))
+        finally:
+            await api_bus.stop()
+            await worker_bus.stop()
+
+        # 发布者自身也会收到事件，且按发布顺序到达
+        assert received["api"] == events
+        assert received["worker"] == events
+        assert worker_bus.dropped == 0
+
+    asyncio.run(run())
@@ -0,0 +1,81 @@
+import asyncio
+
+from sqlalchemy import delete, select
+
+from app.core.database import init_db, async_session_maker
+from app.models.task import Task, TaskStatus
+from app.services import progress_store as progress_store_module
+from app.services.progress_store import ProgressStore
+
+async def _create_task(task_id: str):
+    await init_db()
+    async with async_session_maker() as db:
+        await db.execute(delete(Task).where(Task.task_id == task_id))
+        db.add(Task(task_id=task_id, task_name=task_id, mode="market", parameters="{}",
+                    status=TaskStatus.PENDING.value, progress=0.0, total_steps=5))
+        await db.commit()
+
+def test_finished_tasks_are_forgotten():
+    async def run():
+        store = ProgressStore()
+        for status in (TaskStatus.COMPLETED, TaskStatus.FAILED, TaskStatus.CANCELLED):
+            task_id = f"finished-{status.value}"
+            await _create_task(task_id)
+            await store.update(task_id, {"status": TaskStatus.DOWNLOADING.value, "progress": 0.1})
+            await store.update(task_id, {"status": status.value, "progress": 1.0})
+            assert task_id not in store._statuses
+
+            async with async_session_maker() as db:
+                saved = (await db.execute(select(Task.status).where(Task.task_id == task_id))).scalar_one()
+            assert saved == status.value
+
+    asyncio.run(run())
+
+def test_update_does_not_wait_for_database_write(monkeypatch):
+    async def run():
+        await _create_task("slow-flush")
+        store = ProgressStore()
+        await store.update("slow-flush", {"status": TaskStatus.DOWNLOADING.value})
+        await store.start()
+
+        writing = asyncio.Event()
+        release = asyncio.Event()
+
+        class SlowSession:
+            """提交前阻塞，模拟被锁住的SQLite"""
+
+            def __init__(self):
+                self._session = async_session_maker()
+
+            async def __aenter__(self):
+                self.db = await self._session.__aenter__()
+                original_commit = self.db.commit
+
+                async def commit():
+                    writing.set()
+                    await release.wait()
+                    await original_commit()
+
+                self.db.commit = commit
+                return self.db
+
+            async def __aexit__(self, *exc_info):
+                return await self._session.__aexit__(*exc_info)
+
+        monkeypatch.setattr(progress_store_module, "async_session_maker", SlowSession)
+        await store.update("slow-flush", {"progress": 0.5})
+        flush = asyncio.create_task(store.flush())
+        await asyncio.wait_for(writing.wait(), timeout=5)
+
+        # 写库期间仍能立即记录新的进度
+        await asyncio.wait_for(store.update("slow-flush", {"progress": 0.6}), timeout=1)
+        assert store.get("slow-flush") == {"progress": 0.6}
+
+        release.set()
+        await flush
+        await store.stop()
+        async with async_session_maker() as db:
+            saved = (await db.execute(select(Task.progress).where(Task.task_id == "slow-flush"))).scalar_one()
+        assert saved == 0.6
+
+    asyncio.run(run())
@@ -0,0 +1,100 @@
+import asyncio
+import hashlib
+import os
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from app.services.resolver import build_resolve_args, parse_pip_report
+from app.services.wheel_fetcher import WheelFetcher, FetchError
+
+def _build_wheel(dist_dir: Path, name: str, version: str, requires=()) -> Path:
+    """生成最小的纯Python wheel"""
+    path = dist_dir / f"{name}-{version}-py3-none-any.whl"
+    dist_info = f"{name}-{version}.dist-info"
+    metadata = f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n"
+    metadata += "".join(f"Requires-Dist: {requirement}\n" for requirement in requires)
+    with zipfile.ZipFile(path, "w") as wheel:
+        wheel.writestr(f"{name}/__init__.py", "")
+        wheel.writestr(f"{dist_info}/METADATA", metadata)
+        wheel.writestr(f"{dist_info}/WHEEL", "Wheel-Version: 1.0\nGenerator: tests\nRoot-Is-Purelib: true\nTag: py3-none-any\n")
+        wheel.writestr(f"{dist_info}/RECORD", "")
+    return path
+
+def _build_index(root: Path, wheels) -> str:
+    """按PEP 503生成file://简单索引，返回索引地址"""
+    simple = root / "simple"
+    projects = {}
+    for wheel in wheels:
+        projects.setdefault(wheel.name.split("-")[0], []).append(wheel)
+    for project, files in projects.items():
+        links = "".join(
+            f'<a href="{wheel.as_uri()}#sha256={hashlib.sha256(wheel.read_bytes()).hexdigest()}">{wheel.name}</a>\n'
+            for wheel in files
+        )
+        (simple / project).mkdir(parents=True)
+        (simple / project / "index.html").write_text(f"<html><body>\n{links}</body></html>\n")
+    (simple / "index.html").write_text(
+        "<html><body>\n" + "".join(f'<a href="{project}/">{project}</a>\n' for project in projects) + "</body></html>\n"
+    )
+    return simple.as_uri()
+
+def _resolve(tmp_path: Path, index_url: str, requirements: str):
+    requirements_path = tmp_path / "requirements.txt"
+    requirements_path.write_text(requirements)
+    report_path = tmp_path / "report.json"
+    args = build_resolve_args(
+        sys.executable, str(requirements_path), str(report_path), str(tmp_path / "target"),
+        index_url, "localhost", platform="manylinux2014_x86_64", python_version="3.12"
+    )
+    env = dict(os.environ, PIP_CONFIG_FILE=os.devnull, PIP_DISABLE_PIP_VERSION_CHECK="1")
+    subprocess.run(args, check=True, env=env, capture_output=True, timeout=120)
+    return parse_pip_report(str(report_path))
+
+def test_resolve_and_fetch_from_file_index(tmp_path):
+    dist_dir = tmp_path / "dist"
+    dist_dir.mkdir()
+    wheels = [
+        _build_wheel(dist_dir, "alpha", "1.0", requires=["beta>=1.0"]),
+        _build_wheel(dist_dir, "beta", "1.0"),
+        _build_wheel(dist_dir, "beta", "2.0")
+    ]
+    index_url = _build_index(tmp_path / "index", wheels)
+
+    distributions = _resolve(tmp_path, index_url, "alpha==1.0\n")
+
+    # dry-run只解析不安装
+    assert not (tmp_path / "target").exists()
+    assert distributions is not None
+    resolved = {distribution.name: distribution for distribution in distributions}
+    assert {name: distribution.version for name, distribution in resolved.items()} == {"alpha": "1.0", "beta": "2.0"}
+    beta = resolved["beta"]
+    assert beta.filename == "beta-2.0-py3-none-any.whl"
+    assert beta.url.startswith("file://")
+    assert beta.sha256 == hashlib.sha256((dist_dir / beta.filename).read_bytes()).hexdigest()
+
+    dest_dir = tmp_path / "wheelhouse"
+    fetched = asyncio.run(WheelFetcher().fetch_all(distributions, str(dest_dir)))
+    assert sorted(fetched) == ["alpha-1.0-py3-none-any.whl", "beta-2.0-py3-none-any.whl"]
+    for filename, path in fetched.items():
+        assert Path(path).read_bytes() == (dist_dir / filename).read_bytes()
+
+def test_fetch_rejects_corrupted_wheel(tmp_path):
+    dist_dir = tmp_path / "dist"
+    dist_dir.mkdir()
+    wheel = _build_wheel(dist_dir, "gamma", "1.0")
+    index_url = _build_index(tmp_path / "index", [wheel])
+    distributions = _resolve(tmp_path, index_url, "gamma==1.0\n")
+
+    # 解析之后文件被篡改，与索引中的sha256不一致
+    with open(wheel, "ab") as f:
+        f.write(b"corrupted")
+
+    dest_dir = tmp_path / "wheelhouse"
+    with pytest.raises(ExceptionGroup) as excinfo:
+        asyncio.run(WheelFetcher(retries=0).fetch_all(distributions, str(dest_dir)))
+    assert excinfo.group_contains(FetchError, match="sha256")
+    assert not (dest_dir / wheel.name).exists()
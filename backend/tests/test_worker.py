@@ -0,0 +1,84 @@
+import asyncio
+
+from sqlalchemy import delete, select
+
+from app.core.database import init_db, async_session_maker
+from app.models.task import Task, TaskStatus
+from app.services.worker import TaskWorker
+
+async def _reset_tasks(cache_keys):
+    await init_db()
+    async with async_session_maker() as db:
+        await db.execute(delete(Task))
+        for index, cache_key in enumerate(cache_keys):
+            db.add(Task(
+                task_id=f"task-{index}",
+                task_name=f"task-{index}",
+                mode="market",
+                parameters="{}",
+                status=TaskStatus.PENDING.value,
+                priority=0,
+                cache_key=cache_key,
+                progress=0.0,
+                total_steps=5
+            ))
+        await db.commit()
+
+def _idle_worker(owner: str) -> TaskWorker:
+    """认领任务但不执行流水线的执行节点"""
+    worker = TaskWorker(concurrency=50)
+    worker.leases.owner = owner
+
+    async def execute(task_id: str):
+        worker._tasks.pop(task_id, None)
+
+    worker._execute = execute
+    return worker
+
+def test_two_workers_never_claim_the_same_task():
+    async def run():
+        await _reset_tasks([f"key-{index}" for index in range(40)])
+        workers = [_idle_worker("worker-a"), _idle_worker("worker-b")]
+        claimed = {}
+        attempts = []
+
+        original_claim = {}
+        for worker in workers:
+            original_claim[worker.owner] = worker.leases.claim
+
+            async def claim(task_id: str, worker=worker):
+                attempts.append(task_id)
+                if await original_claim[worker.owner](task_id):
+                    claimed.setdefault(task_id, []).append(worker.owner)
+                    return True
+                return False
+
+            worker.leases.claim = claim
+
+        # 两个节点同时多轮认领同一批pending任务
+        for _ in range(3):
+            await asyncio.gather(*(worker._claim_next(25) for worker in workers))
+        await asyncio.sleep(0)
+
+        async with async_session_maker() as db:
+            rows = (await db.execute(select(Task.task_id, Task.status, Task.lease_owner, Task.attempts))).all()
+
+        assert len(claimed) == 40
+        assert all(len(owners) == 1 for owners in claimed.values())
+        # 两个节点确实争抢过相同的任务
+        assert len(attempts) > len(claimed)
+        for row in rows:
+            assert row.status == TaskStatus.DOWNLOADING.value
+            assert row.lease_owner == claimed[row.task_id][0]
+            assert row.attempts == 1
+
+    asyncio.run(run())
+
+def test_worker_claims_one_task_per_cache_key():
+    async def run():
+        await _reset_tasks(["same", "same", "other", None, "same"])
+        worker = _idle_worker("worker-a")
+        task_ids = await worker._candidates(10)
+        assert task_ids == ["task-0", "task-2", "task-3"]
+
+    asyncio.run(run())
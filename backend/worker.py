@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+独立任务执行节点
+
+    python worker.py                   # 并发数为MAX_CONCURRENT_TASKS
+    python worker.py --concurrency 2
+
+API进程设置EMBEDDED_WORKER=false时只负责创建和排队任务，由一个或多个worker执行。
+多个节点需共享同一个数据库（DATABASE_URL）和输出目录（OUTPUT_DIR），并设置EVENT_BUS=redis
+将任务进度推送到API进程。收到SIGINT/SIGTERM后不再认领新任务，运行中的任务完成后退出，
+超过SHUTDOWN_GRACE_PERIOD秒仍未完成的任务终止后重新排队。
+"""
+import argparse
+import asyncio
+import logging
+import signal
+
+from app.core.database import init_db
+from app.services.worker import TaskWorker
+
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+
+async def main(concurrency: int):
+    await init_db()
+    worker = TaskWorker(concurrency or None)
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    await worker.run()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dify插件重新打包工具任务执行节点")
+    parser.add_argument("--concurrency", type=int, default=0, help="同时执行的任务数（默认MAX_CONCURRENT_TASKS）")
+    args = parser.parse_args()
+
+    asyncio.run(main(args.concurrency))
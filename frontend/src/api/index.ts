@@ -8,6 +8,7 @@ import type {
   SystemStatus, 
   ApiConfig,
   UploadResponse,
+  UploadSession,
   PaginationParams
 } from '@/types'
 import { ElMessage } from '@/utils/element'
@@ -50,6 +51,97 @@ api.interceptors.response.use(
   }
 )
 
+// 超过该大小的文件使用断点续传上传
+const RESUMABLE_UPLOAD_THRESHOLD = 16 * 1024 * 1024
+// 并行上传的分块数
+const UPLOAD_CONCURRENCY = 3
+// 单个分块失败后的最大重试次数
+const UPLOAD_CHUNK_RETRIES = 5
+
+const sleep = (ms: number) => new Promise(resolve => setTimeout(resolve, ms))
+
+// 获取或创建上传会话（同一文件的未完成会话保存在localStorage中，刷新页面后可继续上传）
+const openUploadSession = async (file: File, storageKey: string, platform?: string, suffix?: string): Promise<UploadSession> => {
+  const savedId = localStorage.getItem(storageKey)
+  if (savedId) {
+    try {
+      // 不经过api实例，会话过期时不提示错误
+      const res = await axios.get<UploadSession>(`/api/v1/tasks/uploads/${savedId}`)
+      return res.data
+    } catch {
+      localStorage.removeItem(storageKey)
+    }
+  }
+
+  const session: UploadSession = await api.post('/tasks/uploads', {
+    filename: file.name,
+    size: file.size,
+    platform,
+    suffix
+  }).then(res => res.data)
+  localStorage.setItem(storageKey, session.upload_id)
+  return session
+}
+
+// 分块上传，失败时按指数退避重试
+const putChunk = async (uploadId: string, file: File, start: number, end: number) => {
+  for (let attempt = 0; ; attempt++) {
+    try {
+      await axios.put(`/api/v1/tasks/uploads/${uploadId}`, file.slice(start, end), {
+        params: { offset: start },
+        headers: { 'Content-Type': 'application/octet-stream' },
+        timeout: 0
+      })
+      return
+    } catch (error) {
+      const status = (error as any).response?.status
+      // 会话不存在或请求本身有误时不再重试
+      if (attempt >= UPLOAD_CHUNK_RETRIES || (status && status < 500 && status !== 408 && status !== 429)) {
+        throw error
+      }
+      await sleep(Math.min(1000 * 2 ** attempt, 30000))
+    }
+  }
+}
+
+// 断点续传上传：只上传服务端尚未接收的分块，完成后创建Local任务
+const uploadFileResumable = async (
+  file: File,
+  platform?: string,
+  suffix?: string,
+  onProgress?: (loaded: number, total: number) => void
+): Promise<UploadResponse> => {
+  const storageKey = `upload:${file.name}:${file.size}:${file.lastModified}`
+  const session = await openUploadSession(file, storageKey, platform, suffix)
+
+  if (session.status !== 'completed') {
+    const covered = (start: number, end: number) =>
+      session.received.some(([from, to]) => from <= start && end <= to)
+    const pending: [number, number][] = []
+    for (let start = 0; start < file.size; start += session.chunk_size) {
+      const end = Math.min(start + session.chunk_size, file.size)
+      if (!covered(start, end)) pending.push([start, end])
+    }
+
+    let loaded = file.size - pending.reduce((sum, [start, end]) => sum + end - start, 0)
+    onProgress?.(loaded, file.size)
+    const worker = async () => {
+      for (let chunk = pending.shift(); chunk; chunk = pending.shift()) {
+        await putChunk(session.upload_id, file, chunk[0], chunk[1])
+        loaded += chunk[1] - chunk[0]
+        onProgress?.(loaded, file.size)
+      }
+    }
+    await Promise.all(Array.from({ length: UPLOAD_CONCURRENCY }, worker))
+  }
+
+  const response: UploadResponse = await api.post(`/tasks/uploads/${session.upload_id}/complete`, null, {
+    timeout: 120000
+  }).then(res => res.data)
+  localStorage.removeItem(storageKey)
+  return response
+}
+
 // 任务相关API
 export const taskApi = {
   // 获取任务列表
@@ -68,8 +160,17 @@ export const taskApi = {
   createGithubTask: (params: GithubParams): Promise<Task> => 
     api.post('/tasks/github', params).then(res => res.data),
   
-  // 上传文件并创建Local任务
-  uploadFile: (file: File, platform?: string, suffix?: string): Promise<UploadResponse> => {
+  // 上传文件并创建Local任务（大文件使用断点续传，中断后重新上传同一文件时从已接收的位置继续）
+  uploadFile: (
+    file: File,
+    platform?: string,
+    suffix?: string,
+    onProgress?: (loaded: number, total: number) => void
+  ): Promise<UploadResponse> => {
+    if (file.size > RESUMABLE_UPLOAD_THRESHOLD) {
+      return uploadFileResumable(file, platform, suffix, onProgress)
+    }
+    
     const formData = new FormData()
     formData.append('file', file)
     if (platform) formData.append('platform', platform)
@@ -152,6 +253,8 @@ export class WebSocketClient {
   private reconnectAttempts = 0
   private maxReconnectAttempts = 5
   private reconnectDelay = 1000
+  // 已收到的最大事件序号，重连时从该序号之后补发
+  private lastSeq: number | null = null
 
   constructor(
     taskId: string,
@@ -168,7 +271,8 @@ export class WebSocketClient {
   connect() {
     try {
       const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
-      const wsUrl = `${protocol}//${window.location.host}/api/v1/tasks/ws/${this.taskId}`
+      const since = this.lastSeq !== null ? `?since=${this.lastSeq}` : ''
+      const wsUrl = `${protocol}//${window.location.host}/api/v1/tasks/ws/${this.taskId}${since}`
       
       this.ws = new WebSocket(wsUrl)
       
@@ -180,6 +284,9 @@ export class WebSocketClient {
       this.ws.onmessage = (event) => {
         try {
           const message = JSON.parse(event.data)
+          if (typeof message.seq === 'number') {
+            this.lastSeq = message.seq
+          }
           this.onMessage(message)
         } catch (error) {
           console.error('解析WebSocket消息失败:', error)
@@ -224,4 +331,113 @@ export class WebSocketClient {
   }
 }
 
+// 多路复用的WebSocket连接：一个连接订阅多个任务，消息通过task_id区分
+export class TaskStreamClient {
+  private ws: WebSocket | null = null
+  private taskIds = new Set<string>()
+  // 各任务已收到的最大事件序号，重连时从该序号之后补发
+  private lastSeq = new Map<string, number>()
+  private onMessage: (message: any) => void
+  private reconnectAttempts = 0
+  private maxReconnectAttempts = 5
+  private reconnectDelay = 1000
+  private closed = false
+
+  constructor(onMessage: (message: any) => void) {
+    this.onMessage = onMessage
+  }
+
+  connect() {
+    this.closed = false
+    try {
+      const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:'
+      const wsUrl = `${protocol}//${window.location.host}/api/v1/tasks/ws`
+
+      this.ws = new WebSocket(wsUrl)
+
+      this.ws.onopen = () => {
+        console.log('WebSocket连接已建立')
+        this.reconnectAttempts = 0
+        // 连接（或重连）后恢复订阅
+        if (this.taskIds.size > 0) {
+          this.send({
+            action: 'subscribe',
+            task_ids: Array.from(this.taskIds),
+            since: Object.fromEntries(this.lastSeq)
+          })
+        }
+      }
+
+      this.ws.onmessage = (event) => {
+        try {
+          const message = JSON.parse(event.data)
+          if (message.task_id && typeof message.seq === 'number') {
+            this.lastSeq.set(message.task_id, message.seq)
+          }
+          this.onMessage(message)
+        } catch (error) {
+          console.error('解析WebSocket消息失败:', error)
+        }
+      }
+
+      this.ws.onerror = (error) => {
+        console.error('WebSocket错误:', error)
+      }
+
+      this.ws.onclose = () => {
+        console.log('WebSocket连接已关闭')
+        this.ws = null
+
+        // 仍有订阅时自动重连
+        if (!this.closed && this.taskIds.size > 0 && this.reconnectAttempts < this.maxReconnectAttempts) {
+          setTimeout(() => {
+            this.reconnectAttempts++
+            console.log(`尝试重连 (${this.reconnectAttempts}/${this.maxReconnectAttempts})`)
+            this.connect()
+          }, this.reconnectDelay * this.reconnectAttempts)
+        }
+      }
+    } catch (error) {
+      console.error('WebSocket连接失败:', error)
+    }
+  }
+
+  subscribe(taskIds: string[]) {
+    taskIds.forEach(taskId => this.taskIds.add(taskId))
+    if (!this.ws) {
+      this.connect()
+    } else {
+      this.send({ action: 'subscribe', task_ids: taskIds })
+    }
+  }
+
+  unsubscribe(taskIds: string[]) {
+    taskIds.forEach(taskId => {
+      this.taskIds.delete(taskId)
+      this.lastSeq.delete(taskId)
+    })
+    this.send({ action: 'unsubscribe', task_ids: taskIds })
+  }
+
+  isSubscribed(taskId: string) {
+    return this.taskIds.has(taskId)
+  }
+
+  disconnect() {
+    this.closed = true
+    this.taskIds.clear()
+    this.lastSeq.clear()
+    if (this.ws) {
+      this.ws.close()
+      this.ws = null
+    }
+  }
+
+  private send(data: any) {
+    if (this.ws && this.ws.readyState === WebSocket.OPEN) {
+      this.ws.send(JSON.stringify(data))
+    }
+  }
+}
+
 export default api
\ No newline at end of file
@@ -1,7 +1,7 @@
 import { defineStore } from 'pinia'
 import { ref, computed } from 'vue'
 import type { Task, TaskProgress, WebSocketMessage } from '@/types'
-import { taskApi, WebSocketClient } from '@/api'
+import { taskApi, TaskStreamClient } from '@/api'
 import { ElMessage } from '@/utils/element'
 
 export const useTaskStore = defineStore('task', () => {
@@ -9,7 +9,8 @@ export const useTaskStore = defineStore('task', () => {
   const tasks = ref<Task[]>([])
   const currentTask = ref<Task | null>(null)
   const loading = ref(false)
-  const wsClients = ref<Map<string, WebSocketClient>>(new Map())
+  // 所有任务共用一个WebSocket连接
+  let wsClient: TaskStreamClient | null = null
 
   // 计算属性
   const activeTasks = computed(() => 
@@ -131,41 +132,27 @@ export const useTaskStore = defineStore('task', () => {
   }
 
   const connectWebSocket = (taskId: string) => {
-    // 如果已经有连接，先断开
-    if (wsClients.value.has(taskId)) {
-      disconnectWebSocket(taskId)
+    if (!wsClient) {
+      wsClient = new TaskStreamClient((message: WebSocketMessage) => {
+        handleWebSocketMessage(message)
+      })
     }
-
-    const wsClient = new WebSocketClient(
-      taskId,
-      (message: WebSocketMessage) => {
-        handleWebSocketMessage(taskId, message)
-      },
-      (error) => {
-        console.error(`WebSocket错误 (${taskId}):`, error)
-      },
-      (event) => {
-        console.log(`WebSocket关闭 (${taskId}):`, event)
-        wsClients.value.delete(taskId)
-      }
-    )
-
-    wsClient.connect()
-    wsClients.value.set(taskId, wsClient)
+    wsClient.subscribe([taskId])
   }
 
   const disconnectWebSocket = (taskId: string) => {
-    const wsClient = wsClients.value.get(taskId)
-    if (wsClient) {
-      wsClient.disconnect()
-      wsClients.value.delete(taskId)
+    if (wsClient && wsClient.isSubscribed(taskId)) {
+      wsClient.unsubscribe([taskId])
     }
   }
 
-  const handleWebSocketMessage = (_taskId: string, message: WebSocketMessage) => {
+  const handleWebSocketMessage = (message: WebSocketMessage) => {
     if (message.type === 'progress') {
       const progress: TaskProgress = message.data
       updateTaskProgress(progress)
+    } else if (message.type === 'replay_gap') {
+      // 断线期间的事件已无法补发，通过REST接口重新获取任务状态
+      fetchTask(message.data.task_id)
     } else if (message.type === 'system') {
       ElMessage.info(message.data.message)
     }
@@ -211,10 +198,10 @@ export const useTaskStore = defineStore('task', () => {
 
   // 断开所有WebSocket连接
   const disconnectAllWebSockets = () => {
-    wsClients.value.forEach((client, _taskId) => {
-      client.disconnect()
-    })
-    wsClients.value.clear()
+    if (wsClient) {
+      wsClient.disconnect()
+      wsClient = null
+    }
   }
 
   return {
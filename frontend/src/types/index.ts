@@ -49,6 +49,8 @@ export interface TaskProgress {
 // WebSocket消息接口
 export interface WebSocketMessage {
   type: string
+  task_id?: string
+  seq?: number
   data: any
   timestamp: string
 }
@@ -122,6 +124,20 @@ export interface UploadResponse {
   status: string
 }
 
+// 断点续传上传会话
+export interface UploadSession {
+  upload_id: string
+  filename: string
+  size: number
+  status: 'uploading' | 'completing' | 'completed'
+  received: [number, number][]  // 已接收的字节范围 [start, end)
+  received_bytes: number
+  chunk_size: number
+  task_id?: string
+  created_at: string
+  expires_at: string
+}
+
 // 通用API响应接口
 export interface ApiResponse<T = any> {
   success: boolean
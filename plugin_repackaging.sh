@@ -12,6 +12,9 @@ PIP_MIRROR_URL="${PIP_MIRROR_URL:-$DEFAULT_PIP_MIRROR_URL}"
 CURR_DIR=`dirname $0`
 cd $CURR_DIR
 CURR_DIR=`pwd`
+# Scratch directory for downloads, extraction and the output package (defaults to the script directory)
+WORK_DIR="${WORK_DIR:-$CURR_DIR}"
+mkdir -p ${WORK_DIR}
 USER=`whoami`
 ARCH_NAME=`uname -m`
 OS_TYPE=$(uname)
@@ -39,7 +42,7 @@ market(){
 	PLUGIN_AUTHOR=$2
 	PLUGIN_NAME=$3
 	PLUGIN_VERSION=$4
-	PLUGIN_PACKAGE_PATH=${CURR_DIR}/${PLUGIN_AUTHOR}-${PLUGIN_NAME}_${PLUGIN_VERSION}.difypkg
+	PLUGIN_PACKAGE_PATH=${WORK_DIR}/${PLUGIN_AUTHOR}-${PLUGIN_NAME}_${PLUGIN_VERSION}.difypkg
 	PLUGIN_DOWNLOAD_URL=${MARKETPLACE_API_URL}/api/v1/plugins/${PLUGIN_AUTHOR}/${PLUGIN_NAME}/${PLUGIN_VERSION}/download
 	echo "Downloading ${PLUGIN_DOWNLOAD_URL} ..."
 	curl -L -o ${PLUGIN_PACKAGE_PATH} ${PLUGIN_DOWNLOAD_URL}
@@ -69,7 +72,7 @@ github(){
 	RELEASE_TITLE=$3
 	ASSETS_NAME=$4
 	PLUGIN_NAME="${ASSETS_NAME%.difypkg}"
-	PLUGIN_PACKAGE_PATH=${CURR_DIR}/${PLUGIN_NAME}-${RELEASE_TITLE}.difypkg
+	PLUGIN_PACKAGE_PATH=${WORK_DIR}/${PLUGIN_NAME}-${RELEASE_TITLE}.difypkg
 	PLUGIN_DOWNLOAD_URL=${GITHUB_REPO}/releases/download/${RELEASE_TITLE}/${ASSETS_NAME}
 	echo "Downloading ${PLUGIN_DOWNLOAD_URL} ..."
 	curl -L -o ${PLUGIN_PACKAGE_PATH} ${PLUGIN_DOWNLOAD_URL}
@@ -102,14 +105,14 @@ repackage(){
 	PACKAGE_NAME="${PACKAGE_NAME_WITH_EXTENSION%.*}"
 	echo "Unziping ..."
 	install_unzip
-	unzip -o ${PACKAGE_PATH} -d ${CURR_DIR}/${PACKAGE_NAME}
+	unzip -o ${PACKAGE_PATH} -d ${WORK_DIR}/${PACKAGE_NAME}
 	if [[ $? -ne 0 ]]; then
 		echo "Unzip failed."
 		exit 1
 	fi
 	echo "Unzip success."
 	echo "Repackaging ..."
-	cd ${CURR_DIR}/${PACKAGE_NAME}
+	cd ${WORK_DIR}/${PACKAGE_NAME}
 	pip download ${PIP_PLATFORM} -r requirements.txt -d ./wheels --index-url ${PIP_MIRROR_URL} --trusted-host mirrors.aliyun.com
 	if [[ $? -ne 0 ]]; then
 		echo "Pip download failed."
@@ -137,7 +140,8 @@ repackage(){
 	fi
 	cd ${CURR_DIR}
 	chmod 755 ${CURR_DIR}/${CMD_NAME}
-	${CURR_DIR}/${CMD_NAME} plugin package ${CURR_DIR}/${PACKAGE_NAME} -o ${CURR_DIR}/${PACKAGE_NAME}-${PACKAGE_SUFFIX}.difypkg
+	OUTPUT_PATH="${OUTPUT_PATH:-${WORK_DIR}/${PACKAGE_NAME}-${PACKAGE_SUFFIX}.difypkg}"
+	${CURR_DIR}/${CMD_NAME} plugin package ${WORK_DIR}/${PACKAGE_NAME} -o ${OUTPUT_PATH}
 	echo "Repackage success."
 }
 